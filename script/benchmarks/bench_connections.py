@@ -0,0 +1,129 @@
+"""
+Benchmark das consultas dependentes do horário: Connection Scan Algorithm (connections.py)
+contra Dijkstra sobre o grafo expandido no tempo.
+
+No grafo expandido no tempo cada conexão vira um evento de partida e um de chegada,
+além de um evento de espera na parada de partida (de onde se embarca); as arestas
+representam viajar, seguir na mesma viagem, esperar na parada, embarcar e trocar de
+viagem (respeitando o tempo de transferência). As duas abordagens devem produzir o
+mesmo horário de chegada.
+
+Execução (a partir da raiz do repositório):
+    python script/benchmarks/bench_connections.py
+"""
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import networkx as nx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import connections
+import stop_data
+
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"
+NUM_QUERIES = 100
+SEED = 42
+ROUNDS = 3
+DEPARTURE_WINDOW = ("06:00", "20:00")
+TRANSFER_S = connections.DEFAULT_TRANSFER_S
+
+
+def time_expanded_graph(table: connections.ConnectionsTable, transfer_s: int) -> tuple[nx.DiGraph, dict]:
+    """
+    Grafo expandido no tempo. Pesos em segundos.
+
+    Returns:
+        (grafo, partidas por parada: parada -> lista ordenada de (horário, conexão)).
+    """
+    G = nx.DiGraph()
+    dep_stop, arr_stop = table.dep_stop.tolist(), table.arr_stop.tolist()
+    dep_time, arr_time, trip = table.dep_time.tolist(), table.arr_time.tolist(), table.trip.tolist()
+
+    departures = defaultdict(list)
+    ultima_da_viagem = {}
+    for i in range(len(dep_time)):
+        G.add_edge(('d', i), ('a', i), weight=arr_time[i] - dep_time[i])
+        G.add_edge(('w', i), ('d', i), weight=0)  # embarcar
+        departures[dep_stop[i]].append((dep_time[i], i))
+        # Conexões de uma viagem aparecem em ordem de partida: seguir na viagem
+        anterior = ultima_da_viagem.get(trip[i])
+        if anterior is not None:
+            G.add_edge(('a', anterior), ('d', i), weight=dep_time[i] - arr_time[anterior])
+        ultima_da_viagem[trip[i]] = i
+
+    for eventos in departures.values():
+        eventos.sort()
+        for (t1, i1), (t2, i2) in zip(eventos, eventos[1:]):
+            G.add_edge(('w', i1), ('w', i2), weight=t2 - t1)  # esperar na parada
+
+    for i in range(len(arr_time)):
+        eventos = departures.get(arr_stop[i], [])
+        k = _first_at_or_after(eventos, arr_time[i] + transfer_s)
+        if k < len(eventos):
+            G.add_edge(('a', i), ('w', eventos[k][1]), weight=eventos[k][0] - arr_time[i])  # transferência
+    return G, departures
+
+
+def _first_at_or_after(eventos: list[tuple[int, int]], t: int) -> int:
+    lo, hi = 0, len(eventos)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if eventos[mid][0] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def time_expanded_earliest_arrival(G, departures, table, source, target, departure_time):
+    """Chegada mais cedo via Dijkstra no grafo expandido no tempo (None se não houver)."""
+    s, t = table.stop_position[source], table.stop_position[target]
+    eventos = departures.get(s, [])
+    k = _first_at_or_after(eventos, departure_time)
+    if k == len(eventos):
+        return None
+    inicio, primeira = eventos[k]
+    distancias = nx.single_source_dijkstra_path_length(G, ('w', primeira), weight='weight')
+    chegadas = [inicio + custo for (tipo, i), custo in distancias.items() if tipo == 'a' and table.arr_stop[i] == t]
+    return min(chegadas) if chegadas else None
+
+
+def sample_queries(table: connections.ConnectionsTable, n: int) -> list[tuple]:
+    rng = random.Random(SEED)
+    inicio, fim = (connections.parse_time_s(h) for h in DEPARTURE_WINDOW)
+    return [(*rng.sample(table.stops, 2), rng.randrange(inicio, fim, 60)) for _ in range(n)]
+
+
+def run(name, fn, queries, rounds=ROUNDS):
+    elapsed = float('inf')
+    for _ in range(rounds):  # menor tempo entre as rodadas, para reduzir ruído
+        start = time.perf_counter()
+        results = [fn(s, t, dep) for s, t, dep in queries]
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"  {name:<32} {elapsed * 1000 / len(queries):8.3f} ms/consulta")
+    return results
+
+
+if __name__ == "__main__":
+    stops = stop_data.load_stops(STOPS_FILE)
+    start = time.perf_counter()
+    table = connections.build_connections(stops)
+    print(f"Tabela: {len(table)} conexões, {len(table.trip_lines)} viagens ({(time.perf_counter() - start) * 1000:.0f} ms).")
+    start = time.perf_counter()
+    G, departures = time_expanded_graph(table, TRANSFER_S)
+    print(f"Grafo expandido no tempo: {G.number_of_nodes()} nós, {G.number_of_edges()} arestas "
+          f"({(time.perf_counter() - start) * 1000:.0f} ms).")
+
+    queries = sample_queries(table, NUM_QUERIES)
+    print(f"{len(queries)} consultas de chegada mais cedo:")
+    csa = run("CSA (varredura única)", lambda s, t, dep: table.earliest_arrival(s, t, dep, TRANSFER_S)[0], queries)
+    ted = run("Dijkstra expandido no tempo",
+              lambda s, t, dep: time_expanded_earliest_arrival(G, departures, table, s, t, dep), queries, rounds=1)
+    divergencias = sum(1 for a, b in zip(csa, ted) if a != b)
+    print(f"  Divergências CSA x Dijkstra: {divergencias} ({sum(a is not None for a in csa)} consultas com viagem)")
+
+    print("Consultas de perfil (dia inteiro):")
+    run("CSA perfil", lambda s, t, dep: table.profile(s, t, TRANSFER_S), queries[:20])
@@ -0,0 +1,99 @@
+"""
+Atualização incremental do grafo (graph_analysis.patch_graph_lines) contra a reconstrução completa.
+
+Para cada cenário de alteração da tabela de itinerários (parada deslocada, parada retirada,
+parada nova, linha removida), aplica a atualização incremental sobre o grafo da versão anterior
+e verifica que o resultado é idêntico ao de create_transport_graph sobre a tabela alterada:
+mesmos nós com os mesmos atributos (coordenadas, endereço) e mesmas arestas com os mesmos
+atributos (peso, linhas e trechos, na mesma ordem). Mede também o tempo de cada abordagem.
+
+Execução (a partir da raiz do repositório):
+    python script/benchmarks/bench_incremental.py
+"""
+import os
+import sys
+import time
+
+import networkx as nx
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import graph_analysis
+
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"
+MOVED_STOP = "Alameda Maricá, 1496"  # Parada da linha E17
+MOVED_DELTA_DEG = 0.003
+
+
+def load_stops() -> pd.DataFrame:
+    return pd.read_csv(STOPS_FILE).rename(columns={'nome_parada': 'parada_nome'})
+
+
+def graph_differences(patched: nx.DiGraph, rebuilt: nx.DiGraph) -> list[str]:
+    """Diferenças entre o grafo atualizado e o reconstruído (lista vazia se forem iguais)."""
+    diferencas = []
+    if set(patched.nodes) != set(rebuilt.nodes):
+        diferencas.append(f"nós: {len(set(patched.nodes) ^ set(rebuilt.nodes))} diferentes")
+    for node in set(patched.nodes) & set(rebuilt.nodes):
+        if patched.nodes[node] != rebuilt.nodes[node]:
+            diferencas.append(f"nó {node!r}: {patched.nodes[node]} != {rebuilt.nodes[node]}")
+    if set(patched.edges) != set(rebuilt.edges):
+        diferencas.append(f"arestas: {len(set(patched.edges) ^ set(rebuilt.edges))} diferentes")
+    for u, v in set(patched.edges) & set(rebuilt.edges):
+        if patched[u][v] != rebuilt[u][v]:
+            diferencas.append(f"aresta {u!r} -> {v!r}: {patched[u][v]} != {rebuilt[u][v]}")
+    return diferencas
+
+
+def scenarios(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Tabelas alteradas, uma por cenário."""
+    linhas = sorted(df['numero_linha'].astype(str).unique())
+    primeira = df[df['numero_linha'].astype(str) == linhas[0]]
+
+    deslocada = df.copy()
+    mascara = deslocada['parada_nome'] == MOVED_STOP
+    deslocada.loc[mascara, 'latitude'] += MOVED_DELTA_DEG
+
+    retirada = df.drop(primeira[primeira['ordem_parada'] == primeira['ordem_parada'].max()].index)
+
+    nova = df.copy()
+    linha_nova = nova.loc[primeira.index[:2]]
+    nova.loc[primeira.index[1], ['parada_nome', 'latitude', 'longitude']] = [
+        "Parada Nova (teste)", linha_nova['latitude'].mean(), linha_nova['longitude'].mean()]
+
+    endereco = df.copy()
+    endereco.loc[endereco['parada_nome'] == MOVED_STOP, 'endereco_geocodificado'] = "Endereço alterado (teste)"
+
+    removida = df[df['numero_linha'].astype(str) != linhas[1]]
+    return {
+        f"parada deslocada ({MOVED_STOP})": deslocada,
+        f"última parada retirada ({linhas[0]})": retirada,
+        f"parada nova ({linhas[0]})": nova,
+        f"endereço alterado ({MOVED_STOP})": endereco,
+        f"linha removida ({linhas[1]})": removida,
+    }
+
+
+if __name__ == "__main__":
+    df = load_stops()
+    falhas = 0
+    for nome, df_alterado in scenarios(df).items():
+        G = graph_analysis.create_transport_graph(df)
+        linhas = graph_analysis.changed_lines(G, df_alterado)
+
+        inicio = time.perf_counter()
+        graph_analysis.patch_graph_lines(G, df_alterado, linhas)
+        t_patch = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        R = graph_analysis.create_transport_graph(df_alterado)
+        t_rebuild = time.perf_counter() - inicio
+
+        diferencas = graph_differences(G, R)
+        falhas += bool(diferencas)
+        status = "OK" if not diferencas else f"DIFERENTE ({len(diferencas)} diferenças)"
+        print(f"{nome}: linhas {linhas}; incremental {t_patch * 1000:.1f} ms, "
+              f"reconstrução {t_rebuild * 1000:.1f} ms -> {status}")
+        for diferenca in diferencas[:5]:
+            print(f"    {diferenca}")
+    sys.exit(1 if falhas else 0)
@@ -0,0 +1,108 @@
+"""
+Benchmark das consultas de caminho mínimo sobre o grafo completo de Maricá.
+
+Compara a abordagem antiga (duas buscas por consulta e heurística com `geodesic`)
+com o motor de `routing.py` (busca única, heurística haversine vetorizada e
+Dijkstra bidirecional). Também mede as rotas alternativas (k = 5) do Yen de
+`routing.k_shortest_paths` contra `nx.shortest_simple_paths`.
+
+Execução (a partir da raiz do repositório):
+    python script/benchmarks/bench_routing.py
+"""
+import os
+import random
+import sys
+import time
+from itertools import islice
+
+import networkx as nx
+import pandas as pd
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import graph_analysis
+import routing
+
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"
+NUM_QUERIES = 200
+SEED = 42
+ROUNDS = 5
+K_ALTERNATIVES = 5
+NUM_K_QUERIES = 50
+
+
+def load_graph() -> nx.DiGraph:
+    df = pd.read_csv(STOPS_FILE).rename(columns={'nome_parada': 'parada_nome'})
+    return graph_analysis.create_transport_graph(df)
+
+
+def sample_pairs(G: nx.DiGraph, n: int) -> list[tuple]:
+    """Sorteia pares origem/destino que possuem caminho."""
+    rng = random.Random(SEED)
+    nodes = list(G.nodes)
+    pairs = []
+    while len(pairs) < n:
+        s, t = rng.choice(nodes), rng.choice(nodes)
+        if s != t and nx.has_path(G, s, t):
+            pairs.append((s, t))
+    return pairs
+
+
+def legacy_dijkstra(G, s, t):
+    path = nx.dijkstra_path(G, s, t, weight='weight')
+    cost = nx.dijkstra_path_length(G, s, t, weight='weight')
+    return cost, path
+
+
+def legacy_astar(G, s, t):
+    def heuristic(u, v):
+        return geodesic((G.nodes[u]['latitude'], G.nodes[u]['longitude']),
+                        (G.nodes[v]['latitude'], G.nodes[v]['longitude'])).km
+    path = nx.astar_path(G, s, t, heuristic=heuristic, weight='weight')
+    cost = nx.astar_path_length(G, s, t, heuristic=heuristic, weight='weight')
+    return cost, path
+
+
+def legacy_k_shortest(G, s, t):
+    paths = list(islice(nx.shortest_simple_paths(G, s, t, weight='weight'), K_ALTERNATIVES))
+    return [nx.path_weight(G, p, weight='weight') for p in paths], paths
+
+
+def yen_k_shortest(G, s, t):
+    result = routing.k_shortest_paths(G, s, t, k=K_ALTERNATIVES)
+    return [cost for cost, _ in result], [path for _, path in result]
+
+
+def run(name, fn, G, pairs, reference=None, rounds=ROUNDS):
+    elapsed = float('inf')
+    for _ in range(rounds):  # menor tempo entre as rodadas, para reduzir ruído
+        start = time.perf_counter()
+        costs = [fn(G, s, t)[0] for s, t in pairs]
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"  {name:<28} {elapsed * 1000 / len(pairs):8.3f} ms/consulta")
+    if reference is not None:
+        max_diff = max(abs(a - b) for a, b in zip(_flatten(costs), _flatten(reference)))
+        print(f"  {'':<28} diferença máx. de custo vs. Dijkstra: {max_diff:.2e} km")
+    return costs
+
+
+def _flatten(costs: list) -> list:
+    """Custos de consultas simples ou listas de custos (k caminhos) em uma única lista."""
+    return [c for item in costs for c in (item if isinstance(item, list) else [item])]
+
+
+if __name__ == "__main__":
+    G = load_graph()
+    pairs = sample_pairs(G, NUM_QUERIES)
+    print(f"Grafo: {G.number_of_nodes()} nós, {G.number_of_edges()} arestas. {len(pairs)} consultas.")
+    reference = run("Dijkstra (antigo, 2 buscas)", legacy_dijkstra, G, pairs)
+    run("A* (antigo, geodesic)", legacy_astar, G, pairs, reference, rounds=1)
+    run("Dijkstra (busca única)", routing.dijkstra_path, G, pairs, reference)
+    run("Dijkstra bidirecional", routing.bidirectional_dijkstra_path, G, pairs, reference)
+    routing.get_coordinate_index(G)  # índice construído uma vez, no carregamento
+    run("A* (haversine vetorizado)", routing.astar_path, G, pairs, reference)
+
+    k_pairs = pairs[:NUM_K_QUERIES]
+    print(f"Rotas alternativas (k = {K_ALTERNATIVES}), {len(k_pairs)} consultas:")
+    k_reference = run("nx.shortest_simple_paths", legacy_k_shortest, G, k_pairs, rounds=1)
+    run("Yen (árvore reaproveitada)", yen_k_shortest, G, k_pairs, k_reference)
@@ -0,0 +1,214 @@
+"""
+Centralidade de intermediação (betweenness) e de proximidade harmônica para a rede de transporte.
+
+A intermediação identifica as paradas por onde passam mais caminhos mínimos (o tráfego
+de passagem), algo que a simples contagem de arestas de entrada/saída não captura.
+Ambas as métricas são calculadas na mesma passada de Dijkstra por origem (algoritmo
+de Brandes), de forma exata (todas as origens) ou aproximada (k origens sorteadas
+com semente fixa). As origens são processadas em lotes distribuídos entre processos,
+e a variação entre os lotes fornece uma estimativa do erro da aproximação.
+"""
+import heapq
+import random
+from itertools import count
+
+import networkx as nx
+import numpy as np
+
+import routing
+from graph_analysis import get_graph_version, register_graph_change_listener
+
+DEFAULT_SEED = 42
+
+# Cache em memória: (versão do grafo, peso, modelo de peso, k, semente, lotes) -> CentralityResult
+_centrality_cache: dict = {}
+
+
+class CentralityResult:
+    """
+    Resultado do cálculo de centralidade.
+
+    Atributos:
+        betweenness: dict nó -> intermediação (normalizada para grafos direcionados).
+        harmonic: dict nó -> proximidade harmônica (soma de 1/d a partir das origens).
+        report: dict com o relatório de convergência/erro da estimativa.
+    """
+
+    def __init__(self, betweenness: dict, harmonic: dict, report: dict):
+        self.betweenness = betweenness
+        self.harmonic = harmonic
+        self.report = report
+
+    def top(self, n: int = 5, metric: str = 'betweenness') -> list[tuple]:
+        """Os `n` nós de maior valor na métrica escolhida ('betweenness' ou 'harmonic')."""
+        values = self.betweenness if metric == 'betweenness' else self.harmonic
+        return sorted(values.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+def _brandes_batch(graph: nx.DiGraph, sources: list, context) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Acumula dependências de Brandes e somas harmônicas para um lote de origens.
+    Retorna dois arrays indexados pela posição do nó.
+    """
+    weight, position = context
+    betweenness = np.zeros(len(position))
+    harmonic = np.zeros(len(position))
+    adj = dict(graph.adjacency())
+
+    for s in sources:
+        # Dijkstra contando caminhos mínimos (sigma) e predecessores (P)
+        order = []
+        preds = {s: []}
+        sigma = {s: 1.0}
+        dist = {}
+        seen = {s: 0.0}
+        tie = count()
+        queue = [(0.0, next(tie), s, s)]
+        while queue:
+            d, _, pred, v = heapq.heappop(queue)
+            if v in dist:
+                continue
+            if v != s:
+                sigma[v] += sigma[pred]
+            order.append(v)
+            dist[v] = d
+            for w, edge_data in adj[v].items():
+                vw_dist = d + edge_data.get(weight, 1)
+                if w not in dist and (w not in seen or vw_dist < seen[w]):
+                    seen[w] = vw_dist
+                    heapq.heappush(queue, (vw_dist, next(tie), v, w))
+                    sigma[w] = 0.0
+                    preds[w] = [v]
+                elif vw_dist == seen.get(w):
+                    sigma[w] += sigma[v]
+                    preds[w].append(v)
+
+        # Acúmulo das dependências em ordem reversa de distância
+        delta = dict.fromkeys(order, 0.0)
+        while order:
+            w = order.pop()
+            coeff = (1.0 + delta[w]) / sigma[w]
+            for v in preds[w]:
+                delta[v] += sigma[v] * coeff
+            if w != s:
+                i = position[w]
+                betweenness[i] += delta[w]
+                if dist[w] > 0:
+                    harmonic[i] += 1.0 / dist[w]
+    return betweenness, harmonic
+
+
+def compute_centrality(graph: nx.DiGraph, k: int | None = None, weight: str = 'weight',
+                       seed: int = DEFAULT_SEED, batches: int = 8, processes: int | None = None,
+                       use_cache: bool = True) -> CentralityResult:
+    """
+    Calcula intermediação e proximidade harmônica, exatas ou aproximadas.
+
+    Args:
+        graph: Grafo de transporte.
+        k: Número de origens sorteadas. None (ou k >= nº de nós) calcula o valor exato.
+        weight: Atributo de peso das arestas.
+        seed: Semente do sorteio das origens (resultados reprodutíveis).
+        batches: Número de lotes de origens. Os lotes são a unidade de paralelismo e
+                 a base da estimativa de erro.
+        processes: Número de processos (ver routing.map_over_graph).
+        use_cache: Reutiliza resultados já calculados para a mesma versão do grafo.
+
+    Returns:
+        CentralityResult com os dois dicionários de centralidade e o relatório de erro.
+    """
+    nodes = list(graph.nodes)
+    n = len(nodes)
+    exact = k is None or k >= n
+    # A assinatura do modelo distingue colunas de tempo recalculadas com outros parâmetros (weight_models)
+    cache_key = (get_graph_version(graph), weight, graph.graph.get(f'modelo_peso__{weight}'),
+                 None if exact else k, None if exact else seed, batches)
+    if use_cache and cache_key in _centrality_cache:
+        return _centrality_cache[cache_key]
+
+    if exact:
+        sources = nodes
+    else:
+        sources = random.Random(seed).sample(nodes, k)
+    num_batches = max(1, min(batches, len(sources)))
+    source_batches = [sources[i::num_batches] for i in range(num_batches)]
+
+    position = {node: i for i, node in enumerate(nodes)}
+    partials = routing.map_over_graph(graph, _brandes_batch, source_batches, context=(weight, position),
+                                      processes=processes, min_items_per_process=1)
+
+    scale = n / len(sources) if sources else 0.0
+    norm = 1.0 / ((n - 1) * (n - 2)) if n > 2 else 1.0
+    betweenness = sum(p[0] for p in partials) * scale * norm
+    harmonic = sum(p[1] for p in partials) * scale
+
+    report = _error_report(partials, source_batches, n, norm, betweenness, exact)
+    result = CentralityResult(
+        betweenness=dict(zip(nodes, betweenness.tolist())),
+        harmonic=dict(zip(nodes, harmonic.tolist())),
+        report=report,
+    )
+    if use_cache:
+        _centrality_cache[cache_key] = result
+    return result
+
+
+def _error_report(partials: list, source_batches: list, n: int, norm: float,
+                  betweenness: np.ndarray, exact: bool, top_n: int = 10) -> dict:
+    """
+    Relatório de convergência: cada lote é uma estimativa independente da intermediação;
+    o erro padrão da média entre lotes estima o erro da aproximação.
+    """
+    report = {
+        'exato': exact,
+        'origens': sum(len(b) for b in source_batches),
+        'nos': n,
+        'lotes': len(source_batches),
+    }
+    if exact or len(partials) < 2:
+        report.update({'erro_padrao_max': 0.0, 'erro_relativo_top': 0.0, 'estabilidade_top': 1.0})
+        return report
+
+    estimates = np.vstack([p[0] * (n / len(b)) * norm for p, b in zip(partials, source_batches)])
+    std_error = estimates.std(axis=0, ddof=1) / np.sqrt(len(partials))
+    top = np.argsort(betweenness)[::-1][:top_n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(betweenness[top] > 0, std_error[top] / betweenness[top], 0.0)
+
+    # Estabilidade: fração do top-N obtido com metade dos lotes que coincide com o top-N final
+    half = len(partials) // 2
+    half_estimate = estimates[:half].mean(axis=0)
+    half_top = set(np.argsort(half_estimate)[::-1][:top_n].tolist())
+    report.update({
+        'erro_padrao_max': float(std_error.max()),
+        'erro_relativo_top': float(relative.mean()) if len(relative) else 0.0,
+        'estabilidade_top': len(half_top & set(top.tolist())) / max(1, len(top)),
+    })
+    return report
+
+
+def print_centrality_report(result: CentralityResult):
+    """Imprime o relatório de convergência em formato legível."""
+    r = result.report
+    tipo = "exata" if r['exato'] else f"aproximada ({r['origens']} de {r['nos']} origens, {r['lotes']} lotes)"
+    print(f"Centralidade {tipo}:")
+    print(f"  Erro padrão máximo (intermediação): {r['erro_padrao_max']:.2e}")
+    print(f"  Erro relativo médio no top: {r['erro_relativo_top']:.1%}")
+    print(f"  Estabilidade do top (metade dos lotes vs. todos): {r['estabilidade_top']:.0%}")
+
+
+def clear_centrality_cache(graph_version: str | None = None):
+    """Remove resultados do cache: todos, ou apenas os de uma versão de grafo."""
+    if graph_version is None:
+        _centrality_cache.clear()
+        return
+    for key in [key for key in _centrality_cache if key[0] == graph_version]:
+        del _centrality_cache[key]
+
+
+def _on_graph_change(graph, old_version: str, new_version: str, alteracoes: dict):
+    """Intermediação depende de todos os caminhos mínimos: qualquer alteração invalida a versão antiga."""
+    clear_centrality_cache(old_version)
+
+
+register_graph_change_listener(_on_graph_change)
@@ -0,0 +1,296 @@
+"""
+Tabela de conexões e Connection Scan Algorithm (CSA) para viagens dependentes do horário.
+
+Uma conexão é um trecho percorrido por uma viagem específica: (parada de partida,
+parada de chegada, horário de partida, horário de chegada, viagem). As conexões ficam
+em arrays numpy ordenados pelo horário de partida, e as consultas percorrem a tabela
+uma única vez, sem fila de prioridade:
+    - earliest_arrival: "saindo às 07:40 de A, a que horas chego em B?" (com o itinerário);
+    - profile: todas as combinações ótimas (partida, chegada) de A para B ao longo do dia.
+
+As viagens são geradas a partir dos horários coletados pelo scraper
+(MoovitScraper.extract_schedule_from_line_page): partidas explícitas ou faixas de
+frequência. Linhas sem horário publicado usam uma frequência padrão (estimada). Os
+tempos entre paradas seguem um WeightModel (velocidade e tempo de parada).
+
+Horários são inteiros em segundos desde a meia-noite.
+"""
+import bisect
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import routing
+from weight_models import WeightModel
+
+DEFAULT_HEADWAY_MIN = 30
+DEFAULT_SERVICE_WINDOW = ("05:00", "23:00")
+DEFAULT_TRANSFER_S = 120
+INF = float('inf')
+
+SCHEDULE_COLUMNS = ['numero_linha', 'url_linha', 'sentido', 'tipo', 'horario', 'inicio', 'fim', 'intervalo_min']
+
+
+def parse_time_s(value) -> int | None:
+    """Converte 'HH:MM' (ou 'HHhMM') em segundos desde a meia-noite; None se inválido."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    match = re.match(r"^\s*(\d{1,2})\s*[:h]\s*(\d{2})", str(value))
+    if not match:
+        return None
+    return int(match.group(1)) * 3600 + int(match.group(2)) * 60
+
+
+def format_time(seconds: float | None) -> str:
+    """Segundos desde a meia-noite -> 'HH:MM' ('--:--' se ausente/infinito)."""
+    if seconds is None or seconds == INF:
+        return "--:--"
+    minutes = int(round(seconds / 60.0))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def load_schedules(filepath: str) -> pd.DataFrame:
+    """Carrega os horários exportados pelo scraper; DataFrame vazio se o arquivo não existir."""
+    if not os.path.exists(filepath):
+        return pd.DataFrame(columns=SCHEDULE_COLUMNS)
+    df = pd.read_csv(filepath)
+    for col in SCHEDULE_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df['numero_linha'] = df['numero_linha'].astype(str)
+    return df
+
+
+class ConnectionsTable:
+    """
+    Conexões ordenadas pelo horário de partida.
+
+    Atributos:
+        stops: Lista de paradas (índice -> identificador da parada).
+        stop_position: dict parada -> índice.
+        dep_stop, arr_stop, dep_time, arr_time, trip: Arrays numpy (uma posição por conexão).
+        trip_lines: Lista (numero_linha, sentido) de cada viagem.
+        estimated_lines: Linhas cujas viagens usaram a frequência padrão (sem horário publicado).
+    """
+
+    def __init__(self, stops: list, dep_stop: np.ndarray, arr_stop: np.ndarray, dep_time: np.ndarray,
+                 arr_time: np.ndarray, trip: np.ndarray, trip_lines: list, estimated_lines: list | None = None):
+        order = np.lexsort((arr_time, dep_time))
+        self.stops = stops
+        self.stop_position = {stop: i for i, stop in enumerate(stops)}
+        self.dep_stop = dep_stop[order]
+        self.arr_stop = arr_stop[order]
+        self.dep_time = dep_time[order]
+        self.arr_time = arr_time[order]
+        self.trip = trip[order]
+        self.trip_lines = trip_lines
+        self.estimated_lines = estimated_lines or []
+        # Listas Python para o laço de varredura (acesso por índice mais rápido que em arrays numpy)
+        self._columns = (self.dep_stop.tolist(), self.arr_stop.tolist(), self.dep_time.tolist(),
+                         self.arr_time.tolist(), self.trip.tolist())
+
+    def __len__(self) -> int:
+        return len(self.dep_time)
+
+    def _positions(self, source, target) -> tuple[int, int]:
+        if source not in self.stop_position:
+            raise KeyError(f"Parada de origem '{source}' não está na tabela de conexões.")
+        if target not in self.stop_position:
+            raise KeyError(f"Parada de destino '{target}' não está na tabela de conexões.")
+        return self.stop_position[source], self.stop_position[target]
+
+    def earliest_arrival(self, source, target, departure_time: int,
+                         transfer_s: int = DEFAULT_TRANSFER_S) -> tuple[float | None, list[dict]]:
+        """
+        Horário de chegada mais cedo em `target` saindo de `source` a partir de `departure_time`.
+
+        Args:
+            source: Parada de origem.
+            target: Parada de destino.
+            departure_time: Horário de partida (segundos desde a meia-noite).
+            transfer_s: Tempo mínimo para trocar de viagem em uma parada.
+
+        Returns:
+            (horário de chegada, trechos) ou (None, []) se não houver viagem. Cada trecho é um
+            dict com 'linha', 'sentido', 'de', 'partida', 'para' e 'chegada'.
+        """
+        s, t = self._positions(source, target)
+        if s == t:
+            return departure_time, []
+        dep_stop, arr_stop, dep_time, arr_time, trip = self._columns
+
+        arrival = [INF] * len(self.stops)
+        ready = [INF] * len(self.stops)   # horário mínimo para embarcar na parada
+        arrival[s] = ready[s] = departure_time
+        boarded = {}                      # viagem -> conexão de embarque
+        leg = {}                          # parada -> (conexão de embarque, conexão de desembarque)
+
+        for i in range(bisect.bisect_left(dep_time, departure_time), len(dep_time)):
+            d = dep_time[i]
+            if d >= arrival[t]:
+                break
+            tr = trip[i]
+            if tr not in boarded:
+                if ready[dep_stop[i]] > d:
+                    continue
+                boarded[tr] = i
+            a, v = arr_time[i], arr_stop[i]
+            if a < arrival[v]:
+                arrival[v] = a
+                ready[v] = a + transfer_s
+                leg[v] = (boarded[tr], i)
+
+        if arrival[t] == INF:
+            return None, []
+        legs = []
+        stop = t
+        while stop != s:
+            board, alight = leg[stop]
+            linha, sentido = self.trip_lines[trip[board]]
+            legs.append({'linha': linha, 'sentido': sentido,
+                         'de': self.stops[dep_stop[board]], 'partida': dep_time[board],
+                         'para': self.stops[arr_stop[alight]], 'chegada': arr_time[alight]})
+            stop = dep_stop[board]
+        legs.reverse()
+        return arrival[t], legs
+
+    def profile(self, source, target, transfer_s: int = DEFAULT_TRANSFER_S) -> list[tuple[int, int]]:
+        """
+        Perfil de `source` para `target`: todos os pares (partida, chegada) não dominados ao longo
+        do dia, em uma única varredura das conexões em ordem decrescente de partida.
+        Um par domina outro se parte mais tarde e chega no mesmo horário ou antes.
+
+        Returns:
+            Lista de (horário de partida, horário de chegada), em ordem crescente de partida.
+        """
+        s, t = self._positions(source, target)
+        dep_stop, arr_stop, dep_time, arr_time, trip = self._columns
+
+        trip_arrival = {}  # viagem -> chegada mais cedo em target continuando nela
+        # Perfil por parada: partidas (negadas, para busca binária crescente) e chegadas correspondentes
+        neg_deps = [[] for _ in self.stops]
+        arrivals = [[] for _ in self.stops]
+
+        for i in range(len(dep_time) - 1, -1, -1):
+            v = arr_stop[i]
+            if v == t:
+                best = arr_time[i]
+            else:
+                best = trip_arrival.get(trip[i], INF)
+                # Melhor chegada trocando de viagem em v: primeira partida do perfil >= chegada + transferência
+                k = bisect.bisect_right(neg_deps[v], -(arr_time[i] + transfer_s))
+                if k > 0 and arrivals[v][k - 1] < best:
+                    best = arrivals[v][k - 1]
+            if best == INF:
+                continue
+            tr = trip[i]
+            if best < trip_arrival.get(tr, INF):
+                trip_arrival[tr] = best
+            u = dep_stop[i]
+            if u == t:
+                continue
+            # Partidas chegam em ordem decrescente: só entra se melhorar a chegada mais cedo atual
+            if not arrivals[u] or best < arrivals[u][-1]:
+                if neg_deps[u] and neg_deps[u][-1] == -dep_time[i]:
+                    arrivals[u][-1] = best
+                else:
+                    neg_deps[u].append(-dep_time[i])
+                    arrivals[u].append(best)
+
+        return [(-d, a) for d, a in zip(reversed(neg_deps[s]), reversed(arrivals[s]))]
+
+
+def _departures(line_schedules: pd.DataFrame, service_window_s: tuple[int, int]) -> list[int]:
+    """
+    Horários de partida (segundos) a partir de registros de partida e de frequência. Frequências
+    sem início/fim publicados valem na janela de operação `service_window_s`.
+    """
+    partidas = []
+    for row in line_schedules.itertuples(index=False):
+        if row.tipo == 'partida':
+            t = parse_time_s(row.horario)
+            if t is not None:
+                partidas.append(t)
+        elif row.tipo == 'frequencia':
+            inicio, fim = parse_time_s(row.inicio), parse_time_s(row.fim)
+            if inicio is None and fim is None:
+                inicio, fim = service_window_s
+            intervalo = pd.to_numeric(row.intervalo_min, errors='coerce')
+            if inicio is not None and fim is not None and pd.notna(intervalo) and intervalo > 0:
+                partidas.extend(range(inicio, fim + 1, int(intervalo * 60)))
+    return sorted(set(partidas))
+
+
+def build_connections(stops: pd.DataFrame, schedules: pd.DataFrame | None = None,
+                      model: WeightModel | None = None, default_headway_min: float | None = DEFAULT_HEADWAY_MIN,
+                      service_window: tuple[str, str] = DEFAULT_SERVICE_WINDOW) -> ConnectionsTable:
+    """
+    Gera a tabela de conexões de todas as viagens do dia.
+
+    Args:
+        stops: Tabela de paradas (stop_data.load_stops), com 'parada_nome'.
+        schedules: Horários do scraper (load_schedules). Registros com 'sentido' vazio valem
+                   para todos os sentidos da linha.
+        model: Velocidades e tempos de parada para os tempos entre paradas (padrão: WeightModel()).
+        default_headway_min: Frequência para linhas sem horário publicado; None as ignora.
+        service_window: Início e fim ('HH:MM') da operação com a frequência padrão e com as
+                        frequências publicadas sem janela.
+
+    Returns:
+        ConnectionsTable.
+    """
+    model = model or WeightModel()
+    schedules = schedules if schedules is not None else pd.DataFrame(columns=SCHEDULE_COLUMNS)
+    df = stops.dropna(subset=['parada_nome']).sort_values(by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable')
+    stop_codes, stop_values = pd.factorize(df['parada_nome'])
+    df = df.assign(_parada=stop_codes)
+
+    inicio_padrao, fim_padrao = (parse_time_s(t) for t in service_window)
+    partidas_padrao = (list(range(inicio_padrao, fim_padrao + 1, int(default_headway_min * 60)))
+                       if default_headway_min else [])
+    line_speeds = {str(k): v for k, v in model.line_speeds_kmh.items()}
+
+    blocos = {name: [] for name in ('dep_stop', 'arr_stop', 'dep_time', 'arr_time', 'trip')}
+    trip_lines = []
+    estimadas = set()
+    for (numero_linha, sentido), grupo in df.groupby(['numero_linha', 'sentido'], sort=True):
+        numero_linha = str(numero_linha)
+        horarios = schedules[(schedules['numero_linha'] == numero_linha)
+                             & (schedules['sentido'].isna() | (schedules['sentido'] == sentido))]
+        partidas = _departures(horarios, (inicio_padrao, fim_padrao))
+        if not partidas:
+            partidas = partidas_padrao
+            if partidas:
+                estimadas.add(numero_linha)
+        paradas = grupo['_parada'].to_numpy()
+        if not partidas or len(paradas) < 2:
+            continue
+
+        # Tempos acumulados ao longo do itinerário (vetorizado): percurso + tempo de parada
+        lat, lon = grupo['latitude'].to_numpy(dtype=float), grupo['longitude'].to_numpy(dtype=float)
+        dist_km = routing.haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        velocidade = line_speeds.get(numero_linha, model.default_speed_kmh)
+        percurso_s = dist_km / velocidade * 3600.0
+        nomes = grupo['parada_nome'].to_numpy()
+        dwell_s = pd.Series(nomes[1:], dtype=object).map(model.stop_dwell_s).fillna(model.dwell_s).to_numpy(dtype=float) \
+            if model.stop_dwell_s else np.full(len(nomes) - 1, model.dwell_s)
+        chegada_off = np.cumsum(percurso_s + np.concatenate([[0.0], dwell_s[:-1]]))
+        partida_off = np.concatenate([[0.0], chegada_off[:-1] + dwell_s[:-1]])
+
+        # Trechos com a mesma parada nas duas pontas não geram conexão
+        validos = paradas[:-1] != paradas[1:]
+        partidas = np.array(partidas, dtype=np.int64)
+        primeiro_trip = len(trip_lines)
+        trip_lines.extend([(numero_linha, sentido)] * len(partidas))
+        n_validos = int(validos.sum())
+        blocos['dep_stop'].append(np.tile(paradas[:-1][validos], len(partidas)))
+        blocos['arr_stop'].append(np.tile(paradas[1:][validos], len(partidas)))
+        blocos['dep_time'].append(np.rint(np.add.outer(partidas, partida_off[validos])).astype(np.int64).ravel())
+        blocos['arr_time'].append(np.rint(np.add.outer(partidas, chegada_off[validos])).astype(np.int64).ravel())
+        blocos['trip'].append(np.repeat(np.arange(primeiro_trip, primeiro_trip + len(partidas)), n_validos))
+
+    arrays = {name: (np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)) for name, partes in blocos.items()}
+    return ConnectionsTable(list(stop_values), arrays['dep_stop'], arrays['arr_stop'], arrays['dep_time'],
+                            arrays['arr_time'], arrays['trip'], trip_lines, sorted(estimadas))
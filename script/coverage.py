@@ -0,0 +1,188 @@
+"""
+Cobertura das paradas sobre uma região: distância de cada ponto até a parada mais próxima.
+
+A região é representada por uma grade regular de células (ou por pontos de domicílios/
+população carregados de um arquivo local). A distância até a parada mais próxima é calculada
+para todos os pontos de uma vez, por consulta em lote à KD-tree das paradas
+(spatial_index.StopSpatialIndex.nearest_many), e classificada nas mesmas faixas usadas nos
+mapas de análise (classify_distance): 0-400 m, 400-600 m, 600-800 m, 800-1200 m e acima.
+Grades com milhões de células são processadas em segundos.
+"""
+import numpy as np
+import pandas as pd
+
+from spatial_index import StopSpatialIndex
+
+METERS_PER_DEGREE_LAT = 111_320.0
+DEFAULT_CELL_M = 50.0
+DEFAULT_THRESHOLD_M = 400.0
+
+# Faixas de distância: (limite superior em metros, rótulo, cor)
+DISTANCE_BUCKETS = [
+    (400, "Perto (0-400m)", "green"),
+    (600, "Razoável (400-600m)", "gold"),
+    (800, "Médio (600-800m)", "orange"),
+    (1200, "Longe (800-1200m)", "red"),
+    (np.inf, "Muito longe (>1200m)", "purple"),
+]
+NO_DATA_BUCKET = ("Sem dados", "gray")
+
+
+def classify_distance(distance_m) -> tuple[str, str]:
+    """Classifica uma distância (metros) e retorna (rótulo da faixa, cor)."""
+    if distance_m is None or pd.isna(distance_m):
+        return NO_DATA_BUCKET
+    for limit, label, color in DISTANCE_BUCKETS:
+        if distance_m <= limit:
+            return label, color
+    return NO_DATA_BUCKET
+
+
+def classify_distances(distances_m) -> np.ndarray:
+    """
+    Versão vetorizada de classify_distance: índice da faixa (em DISTANCE_BUCKETS) de cada
+    distância; -1 para NaN.
+    """
+    distances_m = np.asarray(distances_m, dtype=float)
+    limits = np.array([limit for limit, _, _ in DISTANCE_BUCKETS[:-1]], dtype=float)
+    buckets = np.searchsorted(limits, distances_m, side='left')
+    buckets[np.isnan(distances_m)] = -1
+    return buckets
+
+
+def make_grid(bounds: tuple[float, float, float, float], cell_m: float = DEFAULT_CELL_M) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Centros das células de uma grade regular sobre a região.
+
+    Args:
+        bounds: (lat_min, lat_max, lon_min, lon_max).
+        cell_m: Lado da célula em metros.
+
+    Returns:
+        (latitudes, longitudes) dos centros, arrays 1D.
+    """
+    lat_min, lat_max, lon_min, lon_max = bounds
+    dlat = cell_m / METERS_PER_DEGREE_LAT
+    dlon = cell_m / (METERS_PER_DEGREE_LAT * np.cos(np.radians((lat_min + lat_max) / 2.0)))
+    lats = np.arange(lat_min + dlat / 2.0, lat_max, dlat)
+    lons = np.arange(lon_min + dlon / 2.0, lon_max, dlon)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing='ij')
+    return grid_lat.ravel(), grid_lon.ravel()
+
+
+def load_points(filepath: str, weight_column: str | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+    """
+    Carrega pontos (ex.: domicílios, setores censitários) de um CSV com 'latitude' e 'longitude'
+    (ou 'lat'/'lon') e, opcionalmente, uma coluna de peso (ex.: população).
+
+    Returns:
+        (latitudes, longitudes, pesos ou None).
+    """
+    df = pd.read_csv(filepath).rename(columns={'lat': 'latitude', 'lon': 'longitude'})
+    df = df.dropna(subset=['latitude', 'longitude'])
+    weights = df[weight_column].to_numpy(dtype=float) if weight_column else None
+    return df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float), weights
+
+
+class CoverageResult:
+    """
+    Resultado da análise de cobertura.
+
+    Atributos:
+        latitudes, longitudes: Coordenadas dos pontos avaliados.
+        weights: Peso de cada ponto (população) ou None (todos valem 1).
+        distances_m: Distância de cada ponto até a parada mais próxima (metros).
+        nearest_position: Posição (em stop_index.nodes) da parada mais próxima de cada ponto.
+        stop_index: StopSpatialIndex usado na consulta.
+        buckets: Índice da faixa de distância de cada ponto (classify_distances).
+    """
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, weights: np.ndarray | None,
+                 distances_m: np.ndarray, nearest_position: np.ndarray, stop_index: StopSpatialIndex):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.weights = weights
+        self.distances_m = distances_m
+        self.nearest_position = nearest_position
+        self.stop_index = stop_index
+        self.buckets = classify_distances(distances_m)
+
+    def __len__(self) -> int:
+        return len(self.distances_m)
+
+    def summary(self) -> pd.DataFrame:
+        """Pontos, peso e percentuais por faixa de distância (uma linha por faixa)."""
+        weights = self.weights if self.weights is not None else np.ones(len(self))
+        counts = np.bincount(self.buckets[self.buckets >= 0], minlength=len(DISTANCE_BUCKETS))
+        weighted = np.bincount(self.buckets[self.buckets >= 0], weights=weights[self.buckets >= 0],
+                               minlength=len(DISTANCE_BUCKETS))
+        total, total_weight = max(counts.sum(), 1), max(weighted.sum(), 1e-12)
+        return pd.DataFrame({
+            'faixa': [label for _, label, _ in DISTANCE_BUCKETS],
+            'limite_m': [limit for limit, _, _ in DISTANCE_BUCKETS],
+            'pontos': counts,
+            'percentual_pontos': counts / total * 100.0,
+            'peso': weighted,
+            'percentual_peso': weighted / total_weight * 100.0,
+        })
+
+    def covered_fraction(self, threshold_m: float = DEFAULT_THRESHOLD_M) -> float:
+        """Fração (ponderada) dos pontos a até `threshold_m` metros de alguma parada."""
+        weights = self.weights if self.weights is not None else np.ones(len(self))
+        total = weights.sum()
+        return float(weights[self.distances_m <= threshold_m].sum() / total) if total else 0.0
+
+    def uncovered(self, threshold_m: float = DEFAULT_THRESHOLD_M) -> pd.DataFrame:
+        """Pontos a mais de `threshold_m` metros da parada mais próxima, do mais distante para o mais próximo."""
+        mask = self.distances_m > threshold_m
+        df = pd.DataFrame({'latitude': self.latitudes[mask], 'longitude': self.longitudes[mask],
+                           'distancia_m': self.distances_m[mask]})
+        if self.weights is not None:
+            df['peso'] = self.weights[mask]
+        return df.sort_values(by='distancia_m', ascending=False, kind='stable').reset_index(drop=True)
+
+    def add_heatmap_layer(self, folium_map, threshold_m: float = DEFAULT_THRESHOLD_M, max_points: int = 20_000,
+                          name: str = "Áreas descobertas", seed: int = 42):
+        """
+        Adiciona um mapa de calor (folium.plugins.HeatMap) dos pontos a mais de `threshold_m` metros
+        de uma parada, com intensidade proporcional ao excesso de distância (e ao peso, se houver).
+        Grades grandes são amostradas para no máximo `max_points` pontos.
+        """
+        from folium.plugins import HeatMap
+        mask = np.flatnonzero(self.distances_m > threshold_m)
+        if len(mask) > max_points:
+            mask = np.sort(np.random.default_rng(seed).choice(mask, size=max_points, replace=False))
+        intensity = np.minimum((self.distances_m[mask] - threshold_m) / threshold_m, 1.0)
+        if self.weights is not None and len(mask):
+            intensity = intensity * self.weights[mask] / max(self.weights[mask].max(), 1e-12)
+        data = np.column_stack([self.latitudes[mask], self.longitudes[mask], intensity]).tolist()
+        HeatMap(data, name=name, radius=12, blur=15, min_opacity=0.3).add_to(folium_map)
+        return folium_map
+
+
+def compute_coverage(stops: pd.DataFrame | StopSpatialIndex, latitudes, longitudes,
+                     weights=None, workers: int = -1) -> CoverageResult:
+    """
+    Distância até a parada mais próxima de cada ponto, em uma única consulta em lote.
+
+    Args:
+        stops: Tabela de paradas (stop_data.load_stops) ou um StopSpatialIndex já construído.
+        latitudes, longitudes: Coordenadas dos pontos (células da grade ou domicílios).
+        weights: Peso de cada ponto (ex.: população) ou None.
+        workers: Threads da consulta à KD-tree (-1 usa todos os núcleos).
+
+    Returns:
+        CoverageResult.
+    """
+    index = stops if isinstance(stops, StopSpatialIndex) else StopSpatialIndex.from_stops(stops)
+    latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+    positions, dist_km = index.nearest_many(latitudes, longitudes, workers=workers)
+    return CoverageResult(latitudes, longitudes, None if weights is None else np.asarray(weights, dtype=float),
+                          dist_km * 1000.0, positions, index)
+
+
+def compute_grid_coverage(stops: pd.DataFrame | StopSpatialIndex, bounds: tuple[float, float, float, float],
+                          cell_m: float = DEFAULT_CELL_M, workers: int = -1) -> CoverageResult:
+    """Cobertura sobre uma grade regular de células de `cell_m` metros na região `bounds` (ver make_grid)."""
+    latitudes, longitudes = make_grid(bounds, cell_m)
+    return compute_coverage(stops, latitudes, longitudes, workers=workers)
@@ -0,0 +1,207 @@
+"""
+Detecção de lacunas (gaps) entre paradas em toda a rede.
+
+Generaliza a análise da Av. Carlos Marighella (tests/principal-carlos-marighella) para todas as
+vias e todas as sequências de linha:
+    - por via: as paradas são agrupadas pelo nome da rua (extraído de 'parada_nome', com
+      aliases para grafias alternativas e nomes antigos), ordenadas ao longo da via e as
+      distâncias entre paradas vizinhas são medidas;
+    - por linha: distâncias entre paradas consecutivas de cada itinerário ('ordem_parada').
+
+A ordenação ao longo da via começa pela parada de menor 'ordem_parada' (ou por uma ponta da
+via, pelo eixo principal das coordenadas) e segue o vizinho mais próximo ainda não visitado,
+consultado em uma KD-tree (scipy.spatial.cKDTree) em vez de comparar todos os pares. As
+distâncias saem de uma única passada vetorizada (haversine) e as vias são processadas em
+paralelo (routing.map_over_graph).
+
+Trechos acima de routing.MAX_PLAUSIBLE_SEGMENT_M não entram no relatório: vêm de paradas
+geocodificadas no lugar errado (outro bairro com a mesma rua, outro estado), não de falta de
+paradas. Com `bounds`, as paradas fora da região também são descartadas antes da ordenação,
+para que suas vizinhas voltem a ser comparadas entre si.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+import routing
+from coverage import classify_distance
+
+DEFAULT_MAX_GAP_M = 450.0
+# Prefixos de logradouro ignorados na chave da via ("Rua X" e "Av. X" são a mesma via)
+STREET_PREFIXES = r"^(rua|r\.|avenida|av\.?|rodovia|rod\.?|estrada|estr\.?|travessa|tv\.?|alameda|al\.?|praca|pca\.?)\s+"
+# Chave normalizada -> chave canônica (grafias alternativas e nomes antigos)
+STREET_ALIASES = {
+    "carlos marighella": "carlos mariguella",
+    "vitoria regia": "carlos mariguella",
+}
+GAP_COLUMNS = ['tipo', 'grupo', 'de', 'para', 'lat_de', 'lon_de', 'lat_para', 'lon_para',
+               'distancia_m', 'faixa', 'lat_sugerida', 'lon_sugerida']
+
+
+def street_key(stop_name: str, aliases: dict | None = None) -> str | None:
+    """
+    Chave normalizada da via a partir do nome da parada: parte antes da vírgula, sem
+    parênteses, números, acentos e prefixo de logradouro, em minúsculas.
+    Ex.: "Rua Carlos Mariguella, 402" e "Av. Vitória Régia" -> "carlos mariguella".
+    """
+    if not isinstance(stop_name, str) or not stop_name.strip():
+        return None
+    nome = re.sub(r"\(.*?\)", " ", stop_name.split(",")[0])
+    nome = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii').lower()
+    nome = re.sub(r"(?<![\w-])(km\s*)?\d+[\w-]*", " ", nome)  # números, preservando códigos de rodovia (RJ-114)
+    nome = re.sub(r"\s+", " ", re.sub(STREET_PREFIXES, "", nome.strip())).strip(" -")
+    if not nome:
+        return None
+    aliases = STREET_ALIASES if aliases is None else aliases
+    return aliases.get(nome, nome)
+
+
+def order_points(latitudes: np.ndarray, longitudes: np.ndarray, stop_orders: np.ndarray | None = None) -> np.ndarray:
+    """
+    Ordena pontos ao longo de uma via: começa pelo ponto de menor `stop_orders` (ou, sem ordem,
+    pela ponta do eixo principal) e segue sempre o vizinho mais próximo ainda não visitado.
+
+    Returns:
+        Array com as posições dos pontos na ordem do percurso.
+    """
+    n = len(latitudes)
+    if n <= 2:
+        return np.arange(n)
+    # Coordenadas planas locais (graus de longitude escalados pela latitude)
+    xy = np.column_stack([np.asarray(longitudes) * np.cos(np.radians(np.mean(latitudes))), np.asarray(latitudes)])
+    if stop_orders is not None and not np.all(np.isnan(stop_orders)):
+        start = int(np.nanargmin(stop_orders))
+    else:
+        centered = xy - xy.mean(axis=0)
+        axis = np.linalg.svd(centered, full_matrices=False)[2][0]
+        start = int(np.argmin(centered @ axis))
+
+    tree = cKDTree(xy)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    current = start
+    for _ in range(n - 1):
+        k = 8
+        while True:
+            _, neighbors = tree.query(xy[current], k=min(k, n))
+            candidates = [j for j in np.atleast_1d(neighbors).tolist() if not visited[j]]
+            if candidates or k >= n:
+                break
+            k *= 4
+        current = candidates[0]
+        visited[current] = True
+        order.append(current)
+    return np.array(order, dtype=np.int64)
+
+
+def _gap_rows(tipo: str, grupos, names: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+              max_gap_m: float, max_segment_m: float = routing.MAX_PLAUSIBLE_SEGMENT_M) -> pd.DataFrame:
+    """
+    Lacunas entre pontos consecutivos (já ordenados), em uma passada vetorizada.
+    `grupos` é o nome do grupo (via) ou um array com o grupo de cada ponto; pares de
+    grupos diferentes (ex.: fim de um itinerário e início do próximo) são ignorados, assim
+    como trechos acima de `max_segment_m` (erro de geocodificação).
+    """
+    dist_m = routing.haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:]) * 1000.0
+    mask = (dist_m > max_gap_m) & (dist_m <= max_segment_m)
+    if isinstance(grupos, np.ndarray):
+        mask &= grupos[:-1] == grupos[1:]
+        grupos = grupos[:-1][mask]
+    if not mask.any():
+        return pd.DataFrame(columns=GAP_COLUMNS)
+    return pd.DataFrame({
+        'tipo': tipo, 'grupo': grupos,
+        'de': names[:-1][mask], 'para': names[1:][mask],
+        'lat_de': lats[:-1][mask], 'lon_de': lons[:-1][mask],
+        'lat_para': lats[1:][mask], 'lon_para': lons[1:][mask],
+        'distancia_m': dist_m[mask],
+        'faixa': [classify_distance(d)[0] for d in dist_m[mask]],
+        'lat_sugerida': (lats[:-1][mask] + lats[1:][mask]) / 2.0,
+        'lon_sugerida': (lons[:-1][mask] + lons[1:][mask]) / 2.0,
+    }, columns=GAP_COLUMNS)
+
+
+def _street_gaps(_graph, street: tuple, limits: tuple[float, float]) -> pd.DataFrame:
+    """Tarefa de uma via (executada em paralelo por routing.map_over_graph)."""
+    nome, names, lats, lons, orders = street
+    order = order_points(lats, lons, orders)
+    return _gap_rows('rua', nome, names[order], lats[order], lons[order], *limits)
+
+
+def within_bounds(stops: pd.DataFrame, bounds: tuple[float, float, float, float] | None) -> pd.DataFrame:
+    """Paradas dentro de `bounds` = (lat_min, lat_max, lon_min, lon_max); todas, se `bounds` for None."""
+    if bounds is None:
+        return stops
+    lat_min, lat_max, lon_min, lon_max = bounds
+    return stops[stops['latitude'].between(lat_min, lat_max) & stops['longitude'].between(lon_min, lon_max)]
+
+
+def street_sequences(stops: pd.DataFrame, aliases: dict | None = None, min_stops: int = 2) -> list[tuple]:
+    """
+    Agrupa as paradas por via. Cada via vira (nome, nomes das paradas, lats, lons, menor
+    ordem_parada), com uma entrada por coordenada distinta.
+    """
+    df = stops.dropna(subset=['latitude', 'longitude', 'parada_nome'])
+    df = df.assign(_via=df['parada_nome'].map(lambda nome: street_key(nome, aliases))).dropna(subset=['_via'])
+    pontos = (df.groupby(['_via', 'latitude', 'longitude'], sort=True)
+              .agg(parada_nome=('parada_nome', 'first'), ordem=('ordem_parada', 'min'))
+              .reset_index())
+    ruas = []
+    for via, grupo in pontos.groupby('_via', sort=True):
+        if len(grupo) >= min_stops:
+            ruas.append((via, grupo['parada_nome'].to_numpy(dtype=object),
+                         grupo['latitude'].to_numpy(dtype=float), grupo['longitude'].to_numpy(dtype=float),
+                         grupo['ordem'].to_numpy(dtype=float)))
+    return ruas
+
+
+def detect_street_gaps(stops: pd.DataFrame, max_gap_m: float = DEFAULT_MAX_GAP_M, aliases: dict | None = None,
+                       processes: int | None = None,
+                       max_segment_m: float = routing.MAX_PLAUSIBLE_SEGMENT_M) -> pd.DataFrame:
+    """Lacunas acima de `max_gap_m` metros entre paradas vizinhas de cada via, com as vias em paralelo."""
+    ruas = street_sequences(stops, aliases)
+    partes = routing.map_over_graph(None, _street_gaps, ruas, context=(max_gap_m, max_segment_m),
+                                    processes=processes, min_items_per_process=32)
+    partes = [p for p in partes if not p.empty]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=GAP_COLUMNS)
+
+
+def detect_line_gaps(stops: pd.DataFrame, max_gap_m: float = DEFAULT_MAX_GAP_M,
+                     max_segment_m: float = routing.MAX_PLAUSIBLE_SEGMENT_M) -> pd.DataFrame:
+    """Lacunas acima de `max_gap_m` metros entre paradas consecutivas de cada itinerário (linha e sentido)."""
+    df = stops.dropna(subset=['latitude', 'longitude']).sort_values(
+        by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable')
+    grupos = (df['numero_linha'].astype(str) + "|" + df['sentido'].astype(str)).to_numpy(dtype=object)
+    return _gap_rows('linha', grupos, df['parada_nome'].to_numpy(dtype=object),
+                     df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float),
+                     max_gap_m, max_segment_m)
+
+
+def detect_gaps(stops: pd.DataFrame, max_gap_m: float = DEFAULT_MAX_GAP_M, aliases: dict | None = None,
+                processes: int | None = None, max_segment_m: float = routing.MAX_PLAUSIBLE_SEGMENT_M,
+                bounds: tuple[float, float, float, float] | None = None) -> pd.DataFrame:
+    """
+    Relatório de lacunas de toda a rede (vias e itinerários), ordenado da maior para a menor
+    distância, com uma posição sugerida para nova parada (ponto médio) em cada lacuna.
+    Trechos acima de `max_segment_m` são descartados como erro de geocodificação; com `bounds`,
+    só as paradas dentro da região são consideradas (ver within_bounds).
+    """
+    stops = within_bounds(stops, bounds)
+    partes = [detect_street_gaps(stops, max_gap_m, aliases, processes, max_segment_m),
+              detect_line_gaps(stops, max_gap_m, max_segment_m)]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=GAP_COLUMNS)
+    report = pd.concat(partes, ignore_index=True)
+    report = report.sort_values(by='distancia_m', ascending=False, kind='stable').reset_index(drop=True)
+    report.insert(0, 'posicao', np.arange(1, len(report) + 1))
+    return report
+
+
+def export_gaps(report: pd.DataFrame, filepath: str):
+    """Grava o relatório de lacunas em CSV."""
+    report.to_csv(filepath, index=False, float_format='%.6f')
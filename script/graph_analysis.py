@@ -1,3 +1,6 @@
+import hashlib # Para a impressão digital (versão) do grafo
+import json # Hashes por linha guardados nos atributos do grafo
+import weakref # Índices derivados associados ao objeto do grafo
 import networkx as nx
 import pandas as pd
 from geopy.distance import geodesic # Para calcular distância geodésica
@@ -6,8 +9,20 @@ import contextily as cx # Para adicionar mapas base
 import folium # Para mapas interativos
 import webbrowser # Para abrir o mapa no navegador
 import os # Para obter o caminho absoluto do arquivo
+import routing # Motor de caminhos mínimos (Dijkstra/A*)
+import reachability # Índice de alcançabilidade (rejeição de pares sem caminho)
+import stop_index # Índice parada -> linhas (consultas dos mapas sem filtrar a tabela por parada)
+import map_layers # Camada GeoJSON da rede (modo de renderização 'geojson')
 # import xyzservices.providers as xyz_providers # Removido, usar cx.providers diretamente
 
+# Versão do construtor do grafo. Faz parte da chave do cache (graph_store):
+# incremente ao mudar a forma como create_transport_graph monta nós/arestas.
+GRAPH_BUILDER_VERSION = 3
+# Separador de 'numero_linha' e 'sentido' nos trechos registrados nas arestas ('trechos_linha')
+LINE_KEY_SEPARATOR = "|"
+# Modos de renderização de create_interactive_map
+MAP_RENDER_MODES = ('marcadores', 'geojson')
+
 def calculate_distance_km(coord1: tuple[float, float] | None, coord2: tuple[float, float] | None) -> float:
     """
     Calcula a distância geodésica em km entre duas coordenadas (lat, lon).
@@ -23,22 +38,45 @@ def calculate_distance_km(coord1: tuple[float, float] | None, coord2: tuple[floa
     except ValueError: # Pode ocorrer se as coordenadas forem inválidas para geopy
         return float('inf')
 
-def create_transport_graph(df_itinerarios: pd.DataFrame) -> nx.DiGraph:
-    """
-    Cria um grafo NetworkX direcionado (DiGraph) a partir do DataFrame de itinerários de ônibus.
+# Impressão digital dos grafos sem graph['versao'], por objeto: ((nós, arestas), impressão digital)
+_graph_fingerprints: "weakref.WeakKeyDictionary[nx.DiGraph, tuple]" = weakref.WeakKeyDictionary()
 
-    Nós: Paradas de ônibus únicas (identificadas por 'parada_nome').
-         Atributos dos nós: 'pos' (latitude, longitude), 'nome_completo' (descrição geocodificada).
-    Arestas: Conexões diretas entre paradas sequenciais em uma mesma linha e sentido.
-             Atributos das arestas: 'weight' (distância em km), 'linha' (código da linha), 'sentido'.
+def get_graph_version(graph: nx.DiGraph) -> str:
     """
-    G = nx.DiGraph()
-
+    Identificador da versão do grafo, usado como chave de caches derivados (centralidade, rotas...).
+    Usa graph.graph['versao'] quando definido; caso contrário, calcula uma impressão digital
+    a partir dos nós, arestas e pesos. A impressão digital é memorizada por objeto de grafo e
+    recalculada quando o número de nós ou de arestas muda; alterações no lugar que mantêm as
+    contagens (ex.: mudar um peso) não são percebidas: nesse caso, defina graph['versao'].
+    """
+    versao = graph.graph.get('versao')
+    if versao is not None:
+        return str(versao)
+    contagens = routing.graph_state(graph)[1:]  # (nós, arestas)
+    memo = _graph_fingerprints.get(graph)
+    if memo is not None and memo[0] == contagens:
+        return memo[1]
+    digest = hashlib.sha1()
+    for u, v, w in sorted((repr(u), repr(v), repr(d.get('weight'))) for u, v, d in graph.edges(data=True)):
+        digest.update(f"{u}\x1f{v}\x1f{w}\x1e".encode('utf-8'))
+    digest.update(f"{graph.number_of_nodes()}".encode('utf-8'))
+    impressao = f"fp-{digest.hexdigest()[:16]}"
+    _graph_fingerprints[graph] = (contagens, impressao)
+    return impressao
+
+def _add_stop_nodes(G: nx.DiGraph, df_itinerarios: pd.DataFrame) -> set:
+    """
+    Adiciona ao grafo as paradas de df_itinerarios que ainda não são nós.
+    A primeira ocorrência de cada 'parada_nome' define suas coordenadas. Retorna os nós adicionados.
+    """
+    adicionados = set()
     paradas_unicas = df_itinerarios.dropna(subset=['parada_nome', 'latitude', 'longitude'])
     paradas_unicas = paradas_unicas.drop_duplicates(subset=['parada_nome'])
 
     for _, row in paradas_unicas.iterrows():
         nome_parada = row['parada_nome']
+        if G.has_node(nome_parada):
+            continue
         try:
             lat = float(row['latitude'])
             lon = float(row['longitude'])
@@ -47,59 +85,341 @@ def create_transport_graph(df_itinerarios: pd.DataFrame) -> nx.DiGraph:
                             pos=(lon, lat),  # IMPORTANTE: NetworkX espera (x, y), contextily espera (lon, lat)
                             latitude=lat, longitude=lon, # Guardar separadamente para clareza
                             nome_completo=row.get('endereco_geocodificado', nome_parada))
+                 adicionados.add(nome_parada)
         except (ValueError, TypeError):
             # print(f"Aviso: Coordenadas inválidas para a parada '{nome_parada}'. Não será adicionada ao grafo.")
             continue
+    return adicionados
+
+def _stop_attributes(df_itinerarios: pd.DataFrame, nomes: set) -> dict:
+    """
+    Atributos que create_transport_graph daria às paradas `nomes`: (latitude, longitude,
+    nome_completo) da primeira ocorrência válida de cada 'parada_nome' na tabela.
+    """
+    paradas = df_itinerarios[df_itinerarios['parada_nome'].isin(nomes)]
+    paradas = paradas.dropna(subset=['parada_nome', 'latitude', 'longitude']).drop_duplicates(subset=['parada_nome'])
+    atributos = {}
+    for _, row in paradas.iterrows():
+        try:
+            lat, lon = float(row['latitude']), float(row['longitude'])
+        except (ValueError, TypeError):
+            continue
+        atributos[row['parada_nome']] = (lat, lon, row.get('endereco_geocodificado', row['parada_nome']))
+    return atributos
+
+def _sync_stop_nodes(G: nx.DiGraph, df_itinerarios: pd.DataFrame, nomes: set, alteracoes: dict):
+    """
+    Atualiza as paradas `nomes` já existentes para as coordenadas/endereço que uma reconstrução
+    daria (primeira ocorrência na tabela completa) e recalcula o peso de todas as arestas que
+    tocam as paradas que mudaram de posição.
+    """
+    for nome, (lat, lon, nome_completo) in _stop_attributes(df_itinerarios, nomes).items():
+        if not G.has_node(nome):
+            continue
+        data = G.nodes[nome]
+        if data.get('nome_completo') != nome_completo:
+            data['nome_completo'] = nome_completo
+            alteracoes['nos_alterados'].add(nome)
+        if data.get('latitude') == lat and data.get('longitude') == lon:
+            continue
+        data.update(pos=(lon, lat), latitude=lat, longitude=lon)
+        alteracoes['nos_alterados'].add(nome)
+        for u, v in list(G.in_edges(nome)) + list(G.out_edges(nome)):
+            G[u][v]['weight'] = calculate_distance_km((G.nodes[u]['latitude'], G.nodes[u]['longitude']),
+                                                      (G.nodes[v]['latitude'], G.nodes[v]['longitude']))
+            alteracoes['arestas_alteradas'].add((u, v))
+
+def _add_line_sequence(G: nx.DiGraph, numero_linha, sentido, paradas_sequenciais_nomes: list) -> set:
+    """
+    Adiciona as arestas de uma linha/sentido (paradas já em ordem) e registra o trecho
+    ('linha|sentido') em 'trechos_linha' de cada aresta. Retorna as arestas tocadas.
+    """
+    trecho = f"{numero_linha}{LINE_KEY_SEPARATOR}{sentido}"
+    tocadas = set()
+    for i in range(len(paradas_sequenciais_nomes) - 1):
+        parada_origem_nome = paradas_sequenciais_nomes[i]
+        parada_destino_nome = paradas_sequenciais_nomes[i+1]
+
+        if G.has_node(parada_origem_nome) and G.has_node(parada_destino_nome):
+            # Usar longitude e latitude diretamente para calculate_distance_km
+            coord_origem_latlon = (G.nodes[parada_origem_nome]['latitude'], G.nodes[parada_origem_nome]['longitude'])
+            coord_destino_latlon = (G.nodes[parada_destino_nome]['latitude'], G.nodes[parada_destino_nome]['longitude'])
+            
+            distancia = calculate_distance_km(coord_origem_latlon, coord_destino_latlon)
+
+            if distancia != float('inf'):
+                if G.has_edge(parada_origem_nome, parada_destino_nome):
+                    if distancia < G[parada_origem_nome][parada_destino_nome]['weight']:
+                        G[parada_origem_nome][parada_destino_nome]['weight'] = distancia
+                    # Toda linha que percorre o trecho é registrada, independentemente da distância
+                    current_linhas = G[parada_origem_nome][parada_destino_nome].setdefault('linhas_passantes', [])
+                    if numero_linha not in current_linhas:
+                        current_linhas.append(numero_linha)
+                    trechos = G[parada_origem_nome][parada_destino_nome].setdefault('trechos_linha', [])
+                    if trecho not in trechos:
+                        trechos.append(trecho)
+                else:
+                    G.add_edge(parada_origem_nome, parada_destino_nome, 
+                               weight=distancia, 
+                               linha=numero_linha, 
+                               linhas_passantes=[numero_linha],
+                               sentido=sentido,
+                               trechos_linha=[trecho])
+                tocadas.add((parada_origem_nome, parada_destino_nome))
+    return tocadas
+
+def line_content_hashes(df_itinerarios: pd.DataFrame) -> dict[str, str]:
+    """
+    Hash do conteúdo de cada linha ('numero_linha'): sentidos, ordem, nomes e coordenadas das paradas.
+    Usado para detectar quais linhas mudaram entre duas versões do CSV.
+    """
+    colunas = [c for c in ['numero_linha', 'sentido', 'ordem_parada', 'parada_nome', 'latitude', 'longitude', 'endereco_geocodificado']
+               if c in df_itinerarios.columns]
+    df = df_itinerarios.dropna(subset=['numero_linha']).sort_values(by=['numero_linha', 'sentido', 'ordem_parada'])
+    hashes_linhas = pd.util.hash_pandas_object(df[colunas].astype(str), index=False)
+    return {str(numero_linha): hashlib.sha1(grupo.to_numpy().tobytes()).hexdigest()
+            for numero_linha, grupo in hashes_linhas.groupby(df['numero_linha'].astype(str).to_numpy())}
+
+def create_transport_graph(df_itinerarios: pd.DataFrame) -> nx.DiGraph:
+    """
+    Cria um grafo NetworkX direcionado (DiGraph) a partir do DataFrame de itinerários de ônibus.
+
+    Nós: Paradas de ônibus únicas (identificadas por 'parada_nome').
+         Atributos dos nós: 'pos' (latitude, longitude), 'nome_completo' (descrição geocodificada).
+    Arestas: Conexões diretas entre paradas sequenciais em uma mesma linha e sentido.
+             Atributos das arestas: 'weight' (distância em km), 'linha' (código da linha), 'sentido',
+             'trechos_linha' (todos os pares 'linha|sentido' que originaram a aresta).
+    O grafo guarda em graph['hashes_linhas'] o hash do conteúdo de cada linha (ver patch_graph_lines).
+    """
+    G = nx.DiGraph()
+    _add_stop_nodes(G, df_itinerarios)
 
     df_sorted = df_itinerarios.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'])
 
     for (numero_linha, sentido), group in df_sorted.groupby(['numero_linha', 'sentido']):
-        paradas_sequenciais_nomes = group['parada_nome'].tolist()
-        
-        for i in range(len(paradas_sequenciais_nomes) - 1):
-            parada_origem_nome = paradas_sequenciais_nomes[i]
-            parada_destino_nome = paradas_sequenciais_nomes[i+1]
-
-            if G.has_node(parada_origem_nome) and G.has_node(parada_destino_nome):
-                # Usar longitude e latitude diretamente para calculate_distance_km
-                coord_origem_latlon = (G.nodes[parada_origem_nome]['latitude'], G.nodes[parada_origem_nome]['longitude'])
-                coord_destino_latlon = (G.nodes[parada_destino_nome]['latitude'], G.nodes[parada_destino_nome]['longitude'])
-                
-                distancia = calculate_distance_km(coord_origem_latlon, coord_destino_latlon)
-
-                if distancia != float('inf'):
-                    if G.has_edge(parada_origem_nome, parada_destino_nome):
-                        if distancia < G[parada_origem_nome][parada_destino_nome]['weight']:
-                            G[parada_origem_nome][parada_destino_nome]['weight'] = distancia
-                            current_linhas = G[parada_origem_nome][parada_destino_nome].get('linhas_passantes', [])
-                            if numero_linha not in current_linhas:
-                                G[parada_origem_nome][parada_destino_nome]['linhas_passantes'].append(numero_linha)
-                    else:
-                        G.add_edge(parada_origem_nome, parada_destino_nome, 
-                                   weight=distancia, 
-                                   linha=numero_linha, 
-                                   linhas_passantes=[numero_linha],
-                                   sentido=sentido)
+        _add_line_sequence(G, numero_linha, sentido, group['parada_nome'].tolist())
+
+    G.graph['hashes_linhas'] = json.dumps(line_content_hashes(df_itinerarios), sort_keys=True)
+    G.graph['versao_construtor'] = GRAPH_BUILDER_VERSION
     return G
 
-def find_shortest_path_dijkstra(graph: nx.DiGraph, source_node: str, target_node: str, weight: str = 'weight'):
+# --- Atualização incremental por linha ---
+
+# Índice linha -> arestas associado a cada objeto de grafo (subgrafos/cópias não o herdam)
+_line_edge_indexes: "weakref.WeakKeyDictionary[nx.DiGraph, dict]" = weakref.WeakKeyDictionary()
+# Callbacks chamados quando um grafo é alterado: callback(graph, versao_antiga, versao_nova, alteracoes)
+_graph_change_listeners: list = []
+
+def register_graph_change_listener(callback):
+    """
+    Registra um callback para invalidação seletiva de caches derivados.
+    Assinatura: callback(graph, versao_antiga: str, versao_nova: str, alteracoes: dict), onde
+    alteracoes tem 'arestas_removidas', 'arestas_adicionadas', 'arestas_alteradas' (conjuntos de (u, v)),
+    'nos_removidos', 'nos_adicionados', 'nos_alterados' (paradas com coordenadas/endereço atualizados)
+    e 'linhas'.
+    """
+    if callback not in _graph_change_listeners:
+        _graph_change_listeners.append(callback)
+
+def line_edge_index(graph: nx.DiGraph) -> dict[tuple, set]:
+    """
+    Índice (numero_linha, sentido) -> conjunto de arestas (u, v) originadas por aquele trecho.
+    Construído a partir de 'trechos_linha' na primeira chamada e mantido por patch_graph_lines.
+    """
+    index = _line_edge_indexes.get(graph)
+    if index is None:
+        index = {}
+        for u, v, data in graph.edges(data=True):
+            for trecho in data.get('trechos_linha', []):
+                numero_linha, _, sentido = trecho.partition(LINE_KEY_SEPARATOR)
+                index.setdefault((numero_linha, sentido), set()).add((u, v))
+        _line_edge_indexes[graph] = index
+    return index
+
+def _remove_line(graph: nx.DiGraph, numero_linha: str, alteracoes: dict):
+    """Retira de todas as arestas os trechos da linha; remove as arestas que ficarem sem trechos."""
+    index = line_edge_index(graph)
+    for chave in [k for k in index if k[0] == numero_linha]:
+        trecho = f"{chave[0]}{LINE_KEY_SEPARATOR}{chave[1]}"
+        for u, v in index.pop(chave):
+            if not graph.has_edge(u, v):
+                continue
+            data = graph[u][v]
+            trechos = [t for t in data.get('trechos_linha', []) if t != trecho]
+            if not trechos:
+                graph.remove_edge(u, v)
+                alteracoes['arestas_removidas'].add((u, v))
+                continue
+            data['trechos_linha'] = trechos
+            linhas_restantes = [t.partition(LINE_KEY_SEPARATOR)[0] for t in trechos]
+            data['linhas_passantes'] = list(dict.fromkeys(linhas_restantes))
+            if str(data.get('linha')) not in linhas_restantes:
+                data['linha'], _, data['sentido'] = trechos[0].partition(LINE_KEY_SEPARATOR)
+            alteracoes['arestas_alteradas'].add((u, v))
+
+def _sort_edge_lines(data: dict):
+    """
+    Reordena os trechos e as linhas de uma aresta como create_transport_graph os registraria
+    (ordem de (linha, sentido)); 'linha'/'sentido' passam a ser os do primeiro trecho.
+    """
+    trechos = sorted(data.get('trechos_linha', []), key=lambda t: t.partition(LINE_KEY_SEPARATOR)[::2])
+    if not trechos:
+        return
+    posicao = {}
+    for trecho in trechos:
+        posicao.setdefault(trecho.partition(LINE_KEY_SEPARATOR)[0], len(posicao))
+    data['trechos_linha'] = trechos
+    data['linhas_passantes'] = sorted(data.get('linhas_passantes', []), key=lambda l: posicao.get(str(l), len(posicao)))
+    data['linha'] = data['linhas_passantes'][0] if data['linhas_passantes'] else trechos[0].partition(LINE_KEY_SEPARATOR)[0]
+    data['sentido'] = trechos[0].partition(LINE_KEY_SEPARATOR)[2]
+
+def patch_graph_lines(graph: nx.DiGraph, df_itinerarios: pd.DataFrame, linhas: list,
+                      new_version: str | None = None) -> dict:
+    """
+    Reprocessa apenas as linhas indicadas: remove suas arestas (e as paradas que ficarem
+    isoladas e sem referência no DataFrame) e as adiciona novamente a partir de df_itinerarios.
+    As paradas tocadas pelas linhas recebem as coordenadas que uma reconstrução daria, e os pesos
+    das arestas das paradas que mudaram de posição (inclusive de outras linhas) são recalculados.
+    Incrementa graph['versao'] e notifica os caches derivados registrados.
+
+    Args:
+        graph: Grafo criado por create_transport_graph (alterado no lugar).
+        df_itinerarios: DataFrame completo e atualizado (colunas como em create_transport_graph).
+        linhas: Valores de 'numero_linha' que mudaram (podem ter sido removidas do DataFrame).
+        new_version: Versão a atribuir ao grafo. None deriva uma nova a partir da anterior.
+
+    Returns:
+        Dicionário com as alterações (ver register_graph_change_listener) e 'versao'.
     """
-    Encontra o caminho mais curto usando Dijkstra em um grafo direcionado.
+    linhas = [str(l) for l in linhas]
+    alteracoes = {'linhas': linhas, 'arestas_removidas': set(), 'arestas_adicionadas': set(),
+                  'arestas_alteradas': set(), 'nos_removidos': set(), 'nos_adicionados': set(),
+                  'nos_alterados': set()}
+    arestas_antes = set()
+    index = line_edge_index(graph)
+    for chave, arestas in index.items():
+        if chave[0] in linhas:
+            arestas_antes |= arestas
+
+    for numero_linha in linhas:
+        _remove_line(graph, numero_linha, alteracoes)
+
+    df_linhas = df_itinerarios[df_itinerarios['numero_linha'].astype(str).isin(linhas)]
+    alteracoes['nos_adicionados'] = _add_stop_nodes(graph, df_linhas)
+    # Paradas já existentes tocadas pelas linhas (antes ou depois): coordenadas da tabela atual
+    paradas_tocadas = set(df_linhas['parada_nome'].dropna()) | {n for aresta in arestas_antes for n in aresta}
+    _sync_stop_nodes(graph, df_itinerarios, paradas_tocadas - alteracoes['nos_adicionados'], alteracoes)
+    df_sorted = df_linhas.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'])
+    for (numero_linha, sentido), group in df_sorted.groupby(['numero_linha', 'sentido']):
+        tocadas = _add_line_sequence(graph, numero_linha, sentido, group['parada_nome'].tolist())
+        index[(str(numero_linha), str(sentido))] = tocadas
+        for aresta in tocadas:
+            if aresta in alteracoes['arestas_removidas']:
+                alteracoes['arestas_removidas'].discard(aresta)
+                alteracoes['arestas_alteradas'].add(aresta)
+            elif aresta not in arestas_antes:
+                alteracoes['arestas_adicionadas'].add(aresta)
+            else:
+                alteracoes['arestas_alteradas'].add(aresta)
+
+    for u, v in alteracoes['arestas_adicionadas'] | alteracoes['arestas_alteradas']:
+        if graph.has_edge(u, v):
+            _sort_edge_lines(graph[u][v])
+
+    # Paradas isoladas que nenhuma linha do DataFrame referencia mais
+    paradas_referenciadas = set(df_itinerarios['parada_nome'].dropna())
+    candidatos = {n for aresta in arestas_antes for n in aresta}
+    for node in candidatos:
+        if graph.has_node(node) and graph.degree(node) == 0 and node not in paradas_referenciadas:
+            graph.remove_node(node)
+            alteracoes['nos_removidos'].add(node)
+
+    hashes = json.loads(graph.graph.get('hashes_linhas', '{}'))
+    hashes_novos = line_content_hashes(df_linhas)
+    for numero_linha in linhas:
+        hashes.pop(numero_linha, None)
+    hashes.update(hashes_novos)
+    graph.graph['hashes_linhas'] = json.dumps(hashes, sort_keys=True)
+
+    versao_antiga = get_graph_version(graph)
+    if new_version is None:
+        new_version = hashlib.sha1(f"{versao_antiga}|{json.dumps(hashes_novos, sort_keys=True)}|{','.join(sorted(linhas))}".encode('utf-8')).hexdigest()[:32]
+    graph.graph['versao'] = new_version
+    alteracoes['versao'] = new_version
+
+    # Índices derivados ligados ao objeto do grafo
+    if alteracoes['nos_removidos'] or alteracoes['nos_adicionados'] or alteracoes['nos_alterados']:
+        routing.invalidate_coordinate_index(graph)
+    reachability.refresh_index(graph)
+    for callback in list(_graph_change_listeners):
+        callback(graph, versao_antiga, new_version, alteracoes)
+    return alteracoes
+
+def changed_lines(graph: nx.DiGraph, df_itinerarios: pd.DataFrame) -> list[str]:
+    """Linhas cujo conteúdo em df_itinerarios difere do registrado no grafo (graph['hashes_linhas'])."""
+    antigos = json.loads(graph.graph.get('hashes_linhas', '{}'))
+    novos = line_content_hashes(df_itinerarios)
+    return sorted(l for l in set(antigos) | set(novos) if antigos.get(l) != novos.get(l))
+
+def find_shortest_path_dijkstra(graph: nx.DiGraph, source_node: str, target_node: str, weight: str = 'weight',
+                                method: str = 'dijkstra'):
+    """
+    Encontra o caminho mais curto em um grafo direcionado com uma única busca.
+    method: 'dijkstra', 'bidirecional' ou 'astar' (heurística haversine na unidade do peso escolhido,
+            ver routing.weight_units_per_km). weight pode ser uma coluna de weight_models (ex.: 'tempo_min').
+    Se o grafo tiver um índice de alcançabilidade (reachability.attach_index), pares sem
+    caminho são rejeitados em O(1), antes de qualquer busca.
     Retorna (comprimento, lista de nós do caminho) ou (None, mensagem de erro).
     """
     if not graph.has_node(source_node):
         return None, f"Nó de origem '{source_node}' não encontrado no grafo."
     if not graph.has_node(target_node):
         return None, f"Nó de destino '{target_node}' não encontrado no grafo."
+
+    indice_alcance = reachability.get_attached_index(graph)
+    if indice_alcance is not None and not indice_alcance.can_reach(source_node, target_node):
+        return None, f"Não há caminho entre '{source_node}' e '{target_node}' no grafo."
         
     try:
-        length, path_nodes = nx.single_source_dijkstra(graph, source_node, target_node, weight=weight)
+        if method == 'bidirecional':
+            length, path_nodes = routing.bidirectional_dijkstra_path(graph, source_node, target_node, weight=weight)
+        elif method == 'astar':
+            length, path_nodes = routing.astar_path(graph, source_node, target_node, weight=weight,
+                                                    units_per_km=routing.weight_units_per_km(graph, weight))
+        else:
+            length, path_nodes = routing.dijkstra_path(graph, source_node, target_node, weight=weight)
         return length, path_nodes
     except nx.NetworkXNoPath:
         return None, f"Não há caminho entre '{source_node}' e '{target_node}' no grafo."
     except Exception as e:
         return None, f"Erro ao calcular o caminho: {e}"
 
+def find_k_shortest_paths(graph: nx.DiGraph, source_node: str, target_node: str, k: int = 3,
+                          weight: str = 'weight', max_overlap: float | None = 0.8):
+    """
+    Encontra até `k` rotas alternativas (caminhos simples), da mais curta para a mais longa
+    (algoritmo de Yen, ver routing.k_shortest_paths).
+    max_overlap: descarta alternativas que repetem mais que esta fração do custo de uma rota
+                 já escolhida (None desativa o filtro de diversidade).
+    Retorna (lista de (comprimento, lista de nós), None) ou (None, mensagem de erro).
+    """
+    if not graph.has_node(source_node):
+        return None, f"Nó de origem '{source_node}' não encontrado no grafo."
+    if not graph.has_node(target_node):
+        return None, f"Nó de destino '{target_node}' não encontrado no grafo."
+
+    indice_alcance = reachability.get_attached_index(graph)
+    if indice_alcance is not None and not indice_alcance.can_reach(source_node, target_node):
+        return None, f"Não há caminho entre '{source_node}' e '{target_node}' no grafo."
+
+    try:
+        return routing.k_shortest_paths(graph, source_node, target_node, k=k, weight=weight,
+                                        max_overlap=max_overlap), None
+    except nx.NetworkXNoPath:
+        return None, f"Não há caminho entre '{source_node}' e '{target_node}' no grafo."
+    except Exception as e:
+        return None, f"Erro ao calcular as rotas alternativas: {e}"
+
 def get_path_details(graph: nx.DiGraph, path_nodes: list) -> list[dict]:
     """
     Obtém detalhes de cada trecho (aresta) em um caminho.
@@ -244,7 +564,9 @@ def create_interactive_map(graph: nx.DiGraph,
                            df_itinerarios: pd.DataFrame, 
                            path_to_highlight: list | None = None, 
                            map_filename: str = "interactive_map.html",
-                           tile_provider: str = "OpenStreetMap"):
+                           tile_provider: str = "OpenStreetMap",
+                           render_mode: str = 'marcadores',
+                           cluster_stops: bool = False):
     """
     Cria um mapa HTML interativo usando Folium para visualizar o grafo de transporte.
 
@@ -254,7 +576,12 @@ def create_interactive_map(graph: nx.DiGraph,
         path_to_highlight: Uma lista opcional de nós (nomes das paradas) representando um caminho a ser destacado.
         map_filename: Nome do arquivo HTML para salvar o mapa interativo.
         tile_provider: Nome do provedor de tiles para Folium (ex: "OpenStreetMap", "CartoDB positron").
+        render_mode: 'marcadores' (um objeto Folium por parada e por trecho) ou 'geojson' (paradas e
+            trechos em duas FeatureCollections, com estilo e popups montados no navegador; map_layers).
+        cluster_stops: No modo 'geojson', agrupa as paradas (leaflet.markercluster).
     """
+    if render_mode not in MAP_RENDER_MODES:
+        raise ValueError(f"render_mode deve ser um de {MAP_RENDER_MODES}, não '{render_mode}'.")
     if not graph.nodes():
         print("Grafo está vazio. Nada para criar mapa interativo.")
         return
@@ -271,6 +598,27 @@ def create_interactive_map(graph: nx.DiGraph,
     
     m = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles=tile_provider)
 
+    # Linhas de cada parada: um agrupamento da tabela inteira, em vez de um filtro por parada
+    stop_lines = stop_index.get_stop_line_index(df_itinerarios)
+
+    path_edges_set = set()
+    if path_to_highlight and len(path_to_highlight) >=2:
+        path_edges_set = set(zip(path_to_highlight[:-1], path_to_highlight[1:]))
+
+    if render_mode == 'geojson':
+        map_layers.add_network_layer(
+            m, graph,
+            stop_properties=lambda node, data: {
+                'nome': str(node), 'endereco': data.get('nome_completo', node),
+                'linhas': stop_lines.lines_label(node, empty="Nenhuma linha principal associada")},
+            edge_properties=lambda u, v, data: {
+                'trecho': f"{u} → {v}",
+                'distancia_km': data['weight'] if isinstance(data.get('weight'), (int, float)) else None,
+                'linha': data.get('linha', 'N/A'), 'linhas': ", ".join(data.get('linhas_passantes', []))},
+            highlight_nodes=path_to_highlight or (), highlight_edges=path_edges_set, cluster=cluster_stops)
+        _save_interactive_map(m, map_filename)
+        return
+
     for node_name, data in graph.nodes(data=True):
         lat = data.get('latitude')
         lon = data.get('longitude')
@@ -279,8 +627,7 @@ def create_interactive_map(graph: nx.DiGraph,
         if lat is None or lon is None:
             continue
 
-        linhas_na_parada = df_itinerarios[df_itinerarios['parada_nome'] == node_name]['numero_linha'].unique().tolist()
-        linhas_str = ", ".join(linhas_na_parada) if linhas_na_parada else "Nenhuma linha principal associada"
+        linhas_str = stop_lines.lines_label(node_name, empty="Nenhuma linha principal associada")
 
         popup_html = f"""<b>Parada:</b> {node_name}<br>
                        <b>Endereço:</b> {full_name}<br>
@@ -313,10 +660,6 @@ def create_interactive_map(graph: nx.DiGraph,
             tooltip=node_name 
         ).add_to(m)
 
-    path_edges_set = set()
-    if path_to_highlight and len(path_to_highlight) >=2:
-        path_edges_set = set(zip(path_to_highlight[:-1], path_to_highlight[1:]))
-
     for u, v, edge_data in graph.edges(data=True):
         u_data = graph.nodes[u]
         v_data = graph.nodes[v]
@@ -360,6 +703,11 @@ def create_interactive_map(graph: nx.DiGraph,
     # folium.TileLayer('Stamen Terrain', name='Relevo', attr="Stamen Terrain").add_to(m)
     # folium.LayerControl().add_to(m)
 
+    _save_interactive_map(m, map_filename)
+
+
+def _save_interactive_map(m: folium.Map, map_filename: str):
+    """Salva o mapa e tenta abri-lo no navegador."""
     try:
         m.save(map_filename)
         print(f"Mapa interativo salvo em '{map_filename}'")
@@ -0,0 +1,290 @@
+"""
+Cache versionado do grafo de transporte, endereçado pelo conteúdo dos dados de entrada.
+
+Substitui o cache em pickle invalidado por data de modificação. Cada entrada é
+identificada por um hash do conteúdo do CSV de origem e da versão do construtor do
+grafo, então cópias, checkouts ou `touch` no arquivo não invalidam (nem validam)
+o cache indevidamente.
+
+O grafo é gravado como arrays colunares (.npz, sem pickle): nós, arestas em
+formato origem/destino por índice e uma coluna por atributo. Ao carregar, os arrays
+são lidos imediatamente e o DiGraph do NetworkX só é montado quando solicitado;
+consumidores que precisam apenas da estrutura podem usar a representação CSR.
+Várias versões convivem no diretório, com descarte LRU.
+"""
+import hashlib
+import json
+import os
+
+import networkx as nx
+import numpy as np
+
+# Separador para atributos do tipo lista (ex.: 'linhas_passantes')
+LIST_SEPARATOR = "\x1f"
+FILE_PREFIX = "graph-"
+# Versão do formato colunar. Entradas gravadas em outro formato são ignoradas (e reconstruídas).
+FORMAT_VERSION = 2
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 do conteúdo de um arquivo."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(source_csv_path: str, builder_version: str | int, extra: str = "") -> str:
+    """Chave da entrada: hash do conteúdo do CSV + versão do construtor (+ parâmetros extras)."""
+    digest = hashlib.sha256()
+    digest.update(hash_file(source_csv_path).encode('ascii'))
+    digest.update(f"|builder={builder_version}|{extra}".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def _column_from_values(values: list) -> tuple[str, dict]:
+    """
+    Converte os valores de um atributo em (tipo, arrays da coluna), preservando os tipos:
+    'int' (int64), 'float' (float64) e 'bool', com máscara de presença; 'list' (listas de
+    strings), 'jsonlist' (listas com itens de outros tipos, gravadas como JSON) ou 'str'.
+    Colunas de texto são codificadas como dicionário (valores únicos + códigos int32), já que
+    linhas, sentidos e endereços se repetem muito; o código -1 indica ausência.
+    Levanta TypeError para itens de lista que não podem ser gravados em JSON.
+    """
+    sample = [v for v in values if v is not None]
+    present = np.array([v is not None for v in values], dtype=bool)
+    if sample and all(isinstance(v, (bool, np.bool_)) for v in sample):
+        return 'bool', {'values': np.array([bool(v) if v is not None else False for v in values], dtype=bool),
+                        'present': present}
+    if sample and all(isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_)) for v in sample):
+        return 'int', {'values': np.array([0 if v is None else int(v) for v in values], dtype=np.int64),
+                       'present': present}
+    if sample and all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+                      for v in sample):
+        return 'float', {'values': np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64),
+                         'present': present}
+    if sample and all(isinstance(v, (list, tuple)) for v in sample):
+        if all(isinstance(x, str) for v in sample for x in v):
+            kind = 'list'
+            texts = [None if v is None else LIST_SEPARATOR.join(v) for v in values]
+        else:
+            kind = 'jsonlist'
+            try:
+                texts = [None if v is None else json.dumps([x.item() if isinstance(x, np.generic) else x for x in v])
+                         for v in values]
+            except TypeError as e:
+                raise TypeError(f"Itens de lista não suportados pelo cache colunar: {e}") from e
+    else:
+        kind = 'str'
+        texts = [None if v is None else str(v) for v in values]
+    vocabulary = {}
+    codes = np.array([-1 if t is None else vocabulary.setdefault(t, len(vocabulary)) for t in texts], dtype=np.int32)
+    return kind, {'vocab': np.array(list(vocabulary) or [""], dtype=str), 'codes': codes}
+
+
+def _decode_column(kind: str, arrays: dict, prefix: str, name: str) -> list:
+    """Decodifica uma coluna para uma lista Python (None onde o valor está ausente)."""
+    if kind in ('int', 'float', 'bool'):
+        values = arrays[f'{prefix}_attr__{name}__values'].tolist()
+        present = arrays[f'{prefix}_attr__{name}__present'].tolist()
+        return [v if p else None for v, p in zip(values, present)]
+    vocab = arrays[f'{prefix}_attr__{name}__vocab'].tolist()
+    if kind == 'list':
+        vocab = [t.split(LIST_SEPARATOR) if t != "" else [] for t in vocab]
+    elif kind == 'jsonlist':
+        vocab = [json.loads(t) if t != "" else [] for t in vocab]
+    return [None if c < 0 else vocab[c] for c in arrays[f'{prefix}_attr__{name}__codes'].tolist()]
+
+
+class StoredGraph:
+    """
+    Grafo carregado do cache em formato colunar.
+
+    Atributos:
+        key: Chave (versão) da entrada.
+        arrays: dict com os arrays lidos do .npz.
+        nodes: Lista de nós (na ordem dos índices usados pelas arestas).
+    """
+
+    def __init__(self, key: str, arrays: dict):
+        self.key = key
+        self.arrays = arrays
+        self.meta = json.loads(str(arrays['meta']))
+        if self.meta.get('formato') != FORMAT_VERSION:
+            raise ValueError(f"formato {self.meta.get('formato')} do cache difere do atual ({FORMAT_VERSION})")
+        if self.meta['node_kind'] == 'latlon':
+            self.nodes = [tuple(p) for p in arrays['node_ids'].tolist()]
+        else:
+            self.nodes = arrays['node_ids'].tolist()
+        self._graph: nx.DiGraph | None = None
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """DiGraph do NetworkX, montado na primeira vez em que é acessado."""
+        if self._graph is None:
+            self._graph = self._build_networkx()
+        return self._graph
+
+    def to_csr(self, weight: str = 'weight') -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Representação compacta da adjacência (CSR): (indptr, indices, pesos).
+        Os vizinhos de saída do nó i são indices[indptr[i]:indptr[i + 1]].
+        """
+        src = self.arrays['edge_src']
+        dst = self.arrays['edge_dst']
+        weights = self.arrays.get(f'edge_attr__{weight}__values', np.ones(len(src)))
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+        np.add.at(indptr, src + 1, 1)
+        return np.cumsum(indptr), dst[order], weights[order]
+
+    def _build_networkx(self) -> nx.DiGraph:
+        G = nx.DiGraph()
+        G.graph.update(self.meta.get('graph_attrs', {}))
+
+        node_columns = [(name, _decode_column(kind, self.arrays, 'node', name))
+                        for name, kind in self.meta['node_attrs'].items()]
+        node_data = [{} for _ in self.nodes]
+        for name, values in node_columns:
+            for data, value in zip(node_data, values):
+                if value is not None:
+                    data[name] = list(value) if isinstance(value, list) else value  # listas não compartilhadas
+        for data in node_data:
+            if 'latitude' in data and 'longitude' in data:
+                data['pos'] = (data['longitude'], data['latitude'])  # (x, y), como em create_transport_graph
+        nodes = self.nodes
+        edge_data = [{} for _ in range(len(self.arrays['edge_src']))]
+        for name, kind in self.meta['edge_attrs'].items():
+            for data, value in zip(edge_data, _decode_column(kind, self.arrays, 'edge', name)):
+                if value is not None:
+                    data[name] = list(value) if isinstance(value, list) else value
+
+        G.add_nodes_from(zip(nodes, node_data))
+        G.add_edges_from((nodes[u], nodes[v], data) for u, v, data in
+                         zip(self.arrays['edge_src'].tolist(), self.arrays['edge_dst'].tolist(), edge_data))
+        return G
+
+
+class GraphStore:
+    """
+    Diretório de grafos em cache, endereçados por chave de conteúdo, com descarte LRU.
+    O horário de modificação de cada arquivo marca o último uso.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 5):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{FILE_PREFIX}{key}.npz")
+
+    def entries(self) -> list[str]:
+        """Caminhos das entradas existentes, da mais recentemente usada para a menos."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                 if f.startswith(FILE_PREFIX) and f.endswith('.npz')]
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def load(self, key: str) -> StoredGraph | None:
+        """Carrega a entrada `key`, ou None se não existir ou estiver corrompida."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            print(f"(Cache do Grafo) Nenhuma entrada para a versão {key[:12]}.")
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(path)  # marca como usado recentemente (LRU)
+            stored = StoredGraph(key, arrays)
+            print(f"(Cache do Grafo) Versão {key[:12]} carregada de '{path}' "
+                  f"({len(stored.nodes)} nós, {len(arrays['edge_src'])} arestas).")
+            return stored
+        except Exception as e:
+            print(f"(Cache do Grafo) Erro ao carregar '{path}': {e}.")
+            return None
+
+    def load_latest(self, exclude: str | None = None, graph_attrs: dict | None = None) -> StoredGraph | None:
+        """
+        Carrega a entrada usada mais recentemente (ponto de partida para uma atualização incremental).
+        Com `graph_attrs`, considera apenas entradas cujos atributos de grafo coincidem com os informados.
+        """
+        for path in self.entries():
+            key = os.path.basename(path)[len(FILE_PREFIX):-len('.npz')]
+            if key == exclude:
+                continue
+            if graph_attrs:
+                try:
+                    with np.load(path, allow_pickle=False) as data:
+                        attrs = json.loads(str(data['meta'])).get('graph_attrs', {})
+                except Exception:
+                    continue
+                if any(attrs.get(name) != value for name, value in graph_attrs.items()):
+                    continue
+            return self.load(key)
+        return None
+
+    def save(self, key: str, graph: nx.DiGraph) -> str | None:
+        """Grava o grafo em formato colunar sob a chave `key` e aplica o descarte LRU."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        try:
+            arrays = graph_to_arrays(graph)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+            print(f"(Cache do Grafo) Grafo salvo em '{path}'.")
+        except Exception as e:
+            print(f"(Cache do Grafo) Erro ao salvar o grafo em '{path}': {e}")
+            return None
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove as entradas menos usadas além de `max_entries`."""
+        for path in self.entries()[self.max_entries:]:
+            try:
+                os.remove(path)
+                print(f"(Cache do Grafo) Entrada antiga removida: '{path}'.")
+            except OSError as e:
+                print(f"(Cache do Grafo) Não foi possível remover '{path}': {e}")
+
+
+def graph_to_arrays(graph: nx.DiGraph) -> dict:
+    """Serializa o grafo em arrays colunares (sem objetos Python)."""
+    nodes = list(graph.nodes)
+    if all(isinstance(n, str) for n in nodes):
+        node_kind, node_ids = 'str', np.array(nodes, dtype=str)
+    elif all(isinstance(n, tuple) and len(n) == 2 for n in nodes):
+        node_kind, node_ids = 'latlon', np.array(nodes, dtype=np.float64).reshape(-1, 2)
+    else:
+        raise ValueError("Tipo de nó não suportado pelo cache colunar (use strings ou tuplas (lat, lon)).")
+    position = {node: i for i, node in enumerate(nodes)}
+
+    arrays = {'node_ids': node_ids}
+    node_attrs = {}
+    names = sorted({k for _, d in graph.nodes(data=True) for k in d} - {'pos'})  # 'pos' é derivado de lat/lon
+    for name in names:
+        kind, columns = _column_from_values([d.get(name) for _, d in graph.nodes(data=True)])
+        arrays.update({f'node_attr__{name}__{part}': array for part, array in columns.items()})
+        node_attrs[name] = kind
+
+    edges = list(graph.edges(data=True))
+    arrays['edge_src'] = np.array([position[u] for u, _, _ in edges], dtype=np.int32)
+    arrays['edge_dst'] = np.array([position[v] for _, v, _ in edges], dtype=np.int32)
+    edge_attrs = {}
+    for name in sorted({k for _, _, d in edges for k in d}):
+        kind, columns = _column_from_values([d.get(name) for _, _, d in edges])
+        arrays.update({f'edge_attr__{name}__{part}': array for part, array in columns.items()})
+        edge_attrs[name] = kind
+
+    graph_attrs = {k: v for k, v in graph.graph.items() if isinstance(v, (str, int, float, bool))}
+    arrays['meta'] = np.array(json.dumps({
+        'formato': FORMAT_VERSION,
+        'node_kind': node_kind,
+        'node_attrs': node_attrs,
+        'edge_attrs': edge_attrs,
+        'graph_attrs': graph_attrs,
+    }))
+    return arrays
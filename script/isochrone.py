@@ -0,0 +1,188 @@
+"""
+Isócronas: o que se alcança a partir de um ponto dentro de um limite de custo.
+
+Responde perguntas como "quais paradas estão a até 2 km (ou 15 minutos) desta parada/ponto"
+com uma única busca de Dijkstra limitada pelo custo (`cutoff`), em vez de uma consulta de
+caminho mínimo por parada. A busca só expande nós dentro do limite, então o custo é
+proporcional à área alcançada, não ao tamanho da rede. Várias origens podem ser tratadas
+como uma única fonte (multi-source) ou como isócronas independentes, em paralelo.
+
+A origem pode ser uma parada do grafo ou uma coordenada (lat, lon), que é ajustada à
+parada mais próxima pelo índice espacial (spatial_index.get_spatial_index).
+
+O custo usa o atributo de peso escolhido: 'weight' (distância) ou uma coluna de
+weight_models (ex.: 'tempo_min').
+"""
+import networkx as nx
+import pandas as pd
+import shapely
+from shapely.geometry import mapping
+
+import routing
+import spatial_index
+
+DEFAULT_MAX_SNAP_KM = 1.0
+# Raio (m) em torno das paradas alcançadas ao montar o polígono, para que poucas paradas
+# (ou paradas alinhadas) ainda formem uma área.
+DEFAULT_BUFFER_M = 150.0
+METERS_PER_DEGREE = 111_320.0
+
+
+class Isochrone:
+    """
+    Resultado de uma isócrona.
+
+    Atributos:
+        origins: Paradas de origem (após o ajuste de coordenadas).
+        snap_km: dict parada de origem -> distância (km) do ponto informado até ela (0 para paradas).
+        cutoff: Limite de custo, na unidade do peso.
+        weight: Atributo de peso usado.
+        costs: dict parada alcançada -> custo mínimo a partir das origens.
+    """
+
+    def __init__(self, origins: list, snap_km: dict, cutoff: float, weight: str, costs: dict, coordinates: dict):
+        self.origins = origins
+        self.snap_km = snap_km
+        self.cutoff = cutoff
+        self.weight = weight
+        self.costs = costs
+        self._coordinates = coordinates
+
+    def __len__(self) -> int:
+        return len(self.costs)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Paradas alcançadas com 'parada', 'custo', 'latitude' e 'longitude', em ordem de custo."""
+        rows = [(node, cost, *self._coordinates.get(node, (None, None))) for node, cost in self.costs.items()]
+        return (pd.DataFrame(rows, columns=['parada', 'custo', 'latitude', 'longitude'])
+                .sort_values(by='custo', kind='stable').reset_index(drop=True))
+
+    def polygon(self, hull: str = 'convexa', buffer_m: float = DEFAULT_BUFFER_M, concave_ratio: float = 0.3):
+        """
+        Área da isócrona (shapely, coordenadas lon/lat): envoltória das paradas alcançadas,
+        com um raio de `buffer_m` metros em volta.
+
+        Args:
+            hull: 'convexa' ou 'concava' (segue melhor o formato de corredores das linhas).
+            buffer_m: Raio em torno da envoltória, em metros.
+            concave_ratio: Parâmetro de shapely.concave_hull (0 = mais justo, 1 = convexa).
+        """
+        points = shapely.MultiPoint([(lon, lat) for lat, lon in (self._coordinates[n] for n in self.costs
+                                                                   if n in self._coordinates)])
+        if points.is_empty:
+            return points
+        envoltoria = shapely.concave_hull(points, ratio=concave_ratio) if hull == 'concava' else points.convex_hull
+        return envoltoria.buffer(buffer_m / METERS_PER_DEGREE)
+
+    def to_geojson(self, hull: str = 'convexa', buffer_m: float = DEFAULT_BUFFER_M, include_stops: bool = True) -> dict:
+        """
+        FeatureCollection GeoJSON com o polígono da isócrona e, opcionalmente, um ponto por parada
+        alcançada (propriedade 'custo').
+        """
+        features = [{
+            'type': 'Feature',
+            'geometry': mapping(self.polygon(hull=hull, buffer_m=buffer_m)),
+            'properties': {'tipo': 'isocrona', 'origens': [str(o) for o in self.origins],
+                           'limite': self.cutoff, 'peso': self.weight, 'paradas': len(self.costs)},
+        }]
+        if include_stops:
+            for node, cost in self.costs.items():
+                if node in self._coordinates:
+                    lat, lon = self._coordinates[node]
+                    features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                                     'properties': {'tipo': 'parada', 'parada': str(node), 'custo': cost}})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def add_to_map(self, folium_map, color: str = 'purple', name: str | None = None, hull: str = 'convexa'):
+        """Adiciona o polígono da isócrona como camada de um mapa Folium (ex.: graph_analysis.create_interactive_map)."""
+        import folium
+        layer_name = name or f"Isócrona ({self.cutoff} {self.weight})"
+        folium.GeoJson(
+            mapping(self.polygon(hull=hull)), name=layer_name,
+            style_function=lambda _: {'color': color, 'fillColor': color, 'weight': 2, 'fillOpacity': 0.15},
+            tooltip=f"{layer_name}: {len(self.costs)} paradas",
+        ).add_to(folium_map)
+        return folium_map
+
+
+def snap_origin(graph: nx.DiGraph, origin, max_snap_km: float = DEFAULT_MAX_SNAP_KM) -> tuple:
+    """
+    Converte a origem em uma parada do grafo.
+
+    Args:
+        origin: Parada do grafo ou coordenada (lat, lon).
+        max_snap_km: Distância máxima até a parada mais próxima.
+
+    Returns:
+        (parada, distância do ponto até a parada em km).
+
+    Raises:
+        nx.NodeNotFound: Se a origem não é parada do grafo nem há parada a até `max_snap_km`.
+    """
+    if origin in graph:
+        return origin, 0.0
+    if isinstance(origin, tuple) and len(origin) == 2:
+        nearest = spatial_index.get_spatial_index(graph).nearest(*origin, k=1)
+        if nearest and nearest[0][1] <= max_snap_km:
+            return nearest[0]
+        raise nx.NodeNotFound(f"Nenhuma parada a até {max_snap_km} km de {origin}.")
+    raise nx.NodeNotFound(f"Origem '{origin}' não encontrada no grafo.")
+
+
+def _coordinates(graph: nx.DiGraph, nodes) -> dict:
+    coords = routing.get_coordinate_index(graph)
+    result = {}
+    for node in nodes:
+        i = coords.position.get(node)
+        if i is not None and coords.latitudes[i] == coords.latitudes[i]:  # ignora NaN
+            result[node] = (float(coords.latitudes[i]), float(coords.longitudes[i]))
+    return result
+
+
+def compute_isochrone(graph: nx.DiGraph, origins, cutoff: float, weight: str = 'weight',
+                      max_snap_km: float = DEFAULT_MAX_SNAP_KM) -> Isochrone:
+    """
+    Isócrona a partir de uma ou mais origens, com uma única busca de Dijkstra limitada.
+
+    Args:
+        graph: Grafo de transporte.
+        origins: Uma origem ou lista de origens (paradas ou coordenadas (lat, lon)). Com várias
+                 origens, o custo de cada parada é o mínimo entre elas (multi-source).
+        cutoff: Custo máximo, na unidade do peso (ex.: 2 km com 'weight', 15 com 'tempo_min').
+        weight: Atributo de peso das arestas.
+        max_snap_km: Distância máxima para ajustar uma coordenada à parada mais próxima.
+
+    Returns:
+        Isochrone com as paradas alcançadas e seus custos.
+    """
+    if not isinstance(origins, list):
+        origins = [origins]
+    snapped = [snap_origin(graph, origin, max_snap_km) for origin in origins]
+    snap_km = {}
+    for node, dist in snapped:
+        snap_km[node] = min(dist, snap_km.get(node, dist))
+    sources = list(snap_km)
+    costs = nx.multi_source_dijkstra_path_length(graph, sources, cutoff=cutoff, weight=weight)
+    return Isochrone(sources, snap_km, cutoff, weight, dict(costs), _coordinates(graph, costs))
+
+
+def _isochrone_task(graph: nx.DiGraph, origin, context) -> tuple[dict, dict]:
+    cutoff, weight, max_snap_km = context
+    iso = compute_isochrone(graph, origin, cutoff, weight, max_snap_km)
+    return iso.snap_km, iso.costs
+
+
+def compute_isochrones(graph: nx.DiGraph, origins: list, cutoff: float, weight: str = 'weight',
+                       max_snap_km: float = DEFAULT_MAX_SNAP_KM, processes: int | None = None,
+                       min_origins_per_process: int = 16) -> list[Isochrone]:
+    """
+    Isócronas independentes para várias origens, distribuídas em processos (routing.map_over_graph).
+
+    Returns:
+        Lista de Isochrone, na ordem das origens.
+    """
+    context = (cutoff, weight, max_snap_km)
+    results = routing.map_over_graph(graph, _isochrone_task, origins, context=context,
+                                     processes=processes, min_items_per_process=min_origins_per_process)
+    return [Isochrone(list(snap_km), snap_km, cutoff, weight, costs, _coordinates(graph, costs))
+            for snap_km, costs in results]
@@ -0,0 +1,143 @@
+"""
+Índice trecho × linha da rede de transporte.
+
+Cada trecho (par ordenado de paradas consecutivas em algum itinerário) recebe um número,
+e cada linha ('numero_linha') também. O índice guarda a relação nas duas direções:
+    - bitset por trecho (int do Python, bit i = linha i): "quais linhas cobrem este trecho?"
+      e "a linha X cobre este trecho?" em tempo constante;
+    - bitset por linha (bit j = trecho j): "trechos compartilhados pelas linhas A e B" com
+      um único AND;
+    - matriz esparsa trechos × linhas (scipy.sparse, CSR) para análises em lote.
+É construído em uma única passada vetorizada sobre a tabela de paradas (ou a partir do
+atributo 'trechos_linha' das arestas do grafo), sem perder linhas que compartilham trechos.
+"""
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import routing
+from graph_analysis import LINE_KEY_SEPARATOR
+
+
+class LineSegmentIndex:
+    """
+    Relação trecho × linha.
+
+    Atributos:
+        segments: Lista de trechos (u, v), na ordem dos índices.
+        lines: Lista de linhas ('numero_linha'), na ordem dos índices.
+        matrix: scipy.sparse.csr_matrix booleana (trechos × linhas).
+        segment_lengths_km: Array com a extensão de cada trecho (haversine, km).
+    """
+
+    def __init__(self, segments: list[tuple], lines: list[str], segment_codes: np.ndarray, line_codes: np.ndarray,
+                 segment_lengths_km: np.ndarray | None = None):
+        self.segments = segments
+        self.lines = lines
+        self.segment_lengths_km = segment_lengths_km if segment_lengths_km is not None else np.zeros(len(segments))
+        self.segment_position = {segment: i for i, segment in enumerate(segments)}
+        self.line_position = {line: i for i, line in enumerate(lines)}
+
+        pares = np.unique(np.stack([segment_codes, line_codes], axis=1), axis=0) if len(segment_codes) else np.empty((0, 2), dtype=np.int64)
+        self.matrix = sparse.csr_matrix((np.ones(len(pares), dtype=bool), (pares[:, 0], pares[:, 1])),
+                                        shape=(len(segments), len(lines)))
+
+        # Bitsets nas duas direções, montados a partir das listas de índices da CSR/CSC
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        self._segment_bits = [sum(1 << int(j) for j in indices[indptr[i]:indptr[i + 1]]) for i in range(len(segments))]
+        csc = self.matrix.tocsc()
+        self._line_bits = [sum(1 << int(i) for i in csc.indices[csc.indptr[j]:csc.indptr[j + 1]]) for j in range(len(lines))]
+
+    @classmethod
+    def from_stops(cls, stops: pd.DataFrame, node_key: str = 'nome') -> "LineSegmentIndex":
+        """
+        Constrói o índice a partir da tabela de paradas (stop_data.load_stops), em uma passada vetorizada.
+        node_key: 'nome' (trechos entre 'parada_nome') ou 'coordenada' (trechos entre (lat, lon)),
+        como em stop_data.build_graph.
+        """
+        df = stops.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable')
+        if node_key == 'nome':
+            nos = pd.Series(df['parada_nome'].to_numpy(), index=df.index)
+        else:
+            nos = pd.Series(list(zip(df['latitude'], df['longitude'])), index=df.index)
+        anteriores = nos.shift()
+        mesma_sequencia = (df['numero_linha'].eq(df['numero_linha'].shift())
+                           & df['sentido'].eq(df['sentido'].shift()))
+        mask = (mesma_sequencia & (anteriores != nos) & nos.notna() & anteriores.notna()).to_numpy()
+
+        trechos = pd.Series(list(zip(anteriores.to_numpy()[mask], nos.to_numpy()[mask])), dtype=object)
+        segment_codes, segments = pd.factorize(trechos)
+        line_codes, lines = pd.factorize(df['numero_linha'].astype(str).to_numpy()[mask], sort=True)
+
+        lat, lon = df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float)
+        extensoes = routing.haversine_km(np.roll(lat, 1), np.roll(lon, 1), lat, lon)[mask]
+        lengths = np.zeros(len(segments))
+        lengths[segment_codes] = extensoes
+        return cls(list(segments), list(lines), segment_codes, line_codes, lengths)
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph) -> "LineSegmentIndex":
+        """Constrói o índice a partir do atributo 'trechos_linha' das arestas (graph_analysis.create_transport_graph)."""
+        segments = []
+        segment_codes = []
+        line_names = []
+        for i, (u, v, data) in enumerate(graph.edges(data=True)):
+            segments.append((u, v))
+            for trecho in data.get('trechos_linha', []):
+                segment_codes.append(i)
+                line_names.append(trecho.partition(LINE_KEY_SEPARATOR)[0])
+        line_codes, lines = pd.factorize(np.array(line_names, dtype=object), sort=True)
+
+        coords = routing.get_coordinate_index(graph)
+        origem = np.array([coords.position[u] for u, _ in segments], dtype=np.int64)
+        destino = np.array([coords.position[v] for _, v in segments], dtype=np.int64)
+        lengths = routing.haversine_km(coords.latitudes[origem], coords.longitudes[origem],
+                                       coords.latitudes[destino], coords.longitudes[destino])
+        return cls(segments, list(lines), np.array(segment_codes, dtype=np.int64), line_codes, lengths)
+
+    def lines_on(self, u, v) -> list[str]:
+        """Linhas que percorrem o trecho (u, v); lista vazia se o trecho não existir."""
+        i = self.segment_position.get((u, v))
+        if i is None:
+            return []
+        return self._decode(self._segment_bits[i], self.lines)
+
+    def covers(self, u, v, line: str) -> bool:
+        """True se a linha percorre o trecho (u, v)."""
+        i = self.segment_position.get((u, v))
+        j = self.line_position.get(line)
+        if i is None or j is None:
+            return False
+        return bool((self._segment_bits[i] >> j) & 1)
+
+    def segments_of(self, line: str) -> list[tuple]:
+        """Trechos percorridos pela linha."""
+        j = self.line_position.get(line)
+        return [] if j is None else self._decode(self._line_bits[j], self.segments)
+
+    def shared_segments(self, line_a: str, line_b: str) -> list[tuple]:
+        """Trechos percorridos pelas duas linhas."""
+        a = self.line_position.get(line_a)
+        b = self.line_position.get(line_b)
+        if a is None or b is None:
+            return []
+        return self._decode(self._line_bits[a] & self._line_bits[b], self.segments)
+
+    def shared_count(self, line_a: str, line_b: str) -> int:
+        """Quantidade de trechos percorridos pelas duas linhas."""
+        a = self.line_position.get(line_a)
+        b = self.line_position.get(line_b)
+        if a is None or b is None:
+            return 0
+        return (self._line_bits[a] & self._line_bits[b]).bit_count()
+
+    @staticmethod
+    def _decode(bits: int, values: list) -> list:
+        """Valores correspondentes aos bits ligados."""
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(values[low.bit_length() - 1])
+            bits ^= low
+        return result
@@ -0,0 +1,339 @@
+"""
+Mapa da rede com uma camada por linha de ônibus, carregada sob demanda.
+
+Em vez de embutir a rede inteira no HTML, cada linha ('numero_linha') é gravada em um arquivo
+próprio com o GeoJSON compacto da linha (trechos e paradas), e um manifesto (linhas.json) lista
+os arquivos com o hash do conteúdo, a cor e as contagens de cada linha. O HTML é só uma casca:
+lê o manifesto, monta o controle de camadas e carrega o arquivo de uma linha apenas quando ela é
+ligada no controle.
+
+Os arquivos das linhas e a cópia do manifesto lida pelo navegador (linhas.js) são scripts que
+entregam os dados a uma função da página (LINE_CALLBACK, MANIFEST_CALLBACK), carregados pela
+inserção de um <script>: ao contrário de fetch(), isso funciona também com o mapa aberto
+direto do disco (file://), sem servidor HTTP.
+
+write_line_layers compara o hash de cada linha com o do manifesto e só regrava os arquivos que
+mudaram; depois de uma atualização incremental do grafo (graph_analysis.patch_graph_lines),
+basta passar em `lines` as linhas afetadas (affected_lines) para refazer só as camadas delas.
+"""
+import hashlib
+import json
+import os
+
+import folium
+import networkx as nx
+from branca.element import MacroElement
+from jinja2 import Template
+
+import graph_analysis
+import map_layers
+import regions
+import routing
+
+MANIFEST_FILENAME = "linhas.json"
+MANIFEST_SCRIPT_FILENAME = "linhas.js"  # Mesmo manifesto, carregado pela página como <script>
+LINE_FILE_PREFIX = "linha_"
+# Funções globais da página chamadas pelos scripts de dados: manifesto(dados) e linha(numero, dados)
+MANIFEST_CALLBACK = "__manifestoLinhas"
+LINE_CALLBACK = "__dadosLinha"
+# Paleta das linhas (a cor de cada linha é fixa: escolhida pelo hash do número da linha)
+LINE_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b',
+               '#e377c2', '#7f7f7f', '#bcbd22', '#17becf', '#003f5c', '#a05195']
+LINE_STOP_POPUP_FIELDS = [
+    ("Parada", 'nome', None, ""),
+    ("Endereço", 'endereco', None, ""),
+    ("Latitude", 'lat', 5, ""),
+    ("Longitude", 'lon', 5, ""),
+    ("Sentido(s) da linha", 'sentidos', None, ""),
+]
+LINE_SEGMENT_POPUP_FIELDS = [
+    ("Linha", 'linha', None, ""),
+    ("Sentido(s)", 'sentidos', None, ""),
+    ("Trecho", 'trecho', None, ""),
+    ("Distância", 'distancia_km', 2, " km"),
+    ("Todas as Linhas (neste trecho)", 'linhas', None, ""),
+]
+
+
+def line_color(numero_linha) -> str:
+    """Cor fixa da linha na paleta LINE_COLORS."""
+    digest = hashlib.sha1(str(numero_linha).encode('utf-8')).hexdigest()
+    return LINE_COLORS[int(digest[:8], 16) % len(LINE_COLORS)]
+
+
+def line_file_name(numero_linha) -> str:
+    """Nome do arquivo (script com o GeoJSON) da linha."""
+    return f"{LINE_FILE_PREFIX}{regions.slugify(str(numero_linha))}.js"
+
+
+def _script(callback: str, *args) -> bytes:
+    """Script de dados: chamada de `callback` com os argumentos em JSON compacto."""
+    argumentos = ",".join(map_layers.script_json(a) for a in args)
+    return f"{callback}({argumentos});\n".encode('utf-8')
+
+
+def _edges_by_line(graph: nx.DiGraph) -> dict[str, dict[tuple, list]]:
+    """numero_linha -> {(u, v): [sentidos]}, a partir do índice linha -> arestas do grafo."""
+    por_linha: dict[str, dict[tuple, list]] = {}
+    for (numero_linha, sentido), arestas in graph_analysis.line_edge_index(graph).items():
+        trechos = por_linha.setdefault(numero_linha, {})
+        for aresta in arestas:
+            if graph.has_edge(*aresta):
+                trechos.setdefault(aresta, []).append(sentido)
+    return {linha: trechos for linha, trechos in por_linha.items() if trechos}
+
+
+def line_feature_collection(graph: nx.DiGraph, numero_linha, edges: dict[tuple, list] | None = None) -> dict:
+    """
+    FeatureCollection de uma linha: um LineString por trecho e um Point por parada da linha,
+    em ordem determinística (o mesmo grafo gera sempre o mesmo arquivo).
+
+    Args:
+        graph: Grafo criado por graph_analysis.create_transport_graph.
+        numero_linha: Linha ('numero_linha').
+        edges: Trechos da linha, {(u, v): [sentidos]}; None os obtém do grafo.
+    """
+    numero_linha = str(numero_linha)
+    if edges is None:
+        edges = _edges_by_line(graph).get(numero_linha, {})
+    casas = map_layers.COORD_DECIMALS
+    coords, sentidos_parada = {}, {}
+    for (u, v), sentidos in edges.items():
+        for node in (u, v):
+            if node not in coords:
+                latlon = routing.node_coordinates(graph.nodes[node])
+                coords[node] = None if latlon is None else [round(latlon[1], casas), round(latlon[0], casas)]
+            sentidos_parada.setdefault(node, set()).update(sentidos)
+
+    segments = []
+    for (u, v) in sorted(edges, key=str):
+        if coords[u] is None or coords[v] is None:
+            continue
+        data = graph[u][v]
+        peso = data.get('weight')
+        segments.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [coords[u], coords[v]]},
+                         'properties': {
+                             'linha': numero_linha, 'sentidos': ", ".join(sorted(map(str, edges[(u, v)]))),
+                             'trecho': f"{u} → {v}",
+                             'distancia_km': round(float(peso), 4) if isinstance(peso, (int, float)) else None,
+                             'linhas': ", ".join(sorted(map(str, data.get('linhas_passantes', []))))}})
+    stops = []
+    for node in sorted(coords, key=str):
+        if coords[node] is None:
+            continue
+        stops.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': coords[node]},
+                      'properties': {'nome': str(node), 'endereco': graph.nodes[node].get('nome_completo', str(node)),
+                                     'sentidos': ", ".join(sorted(map(str, sentidos_parada[node])))}})
+    return {'type': 'FeatureCollection', 'features': segments + stops}
+
+
+def affected_lines(graph: nx.DiGraph, alteracoes: dict) -> list[str]:
+    """
+    Linhas cujas camadas mudam com uma atualização de graph_analysis.patch_graph_lines: as linhas
+    reprocessadas e as que passam pelos trechos adicionados ou alterados (o campo 'linhas' dos
+    trechos compartilhados muda junto).
+    """
+    linhas = {str(l) for l in alteracoes.get('linhas', [])}
+    for u, v in alteracoes.get('arestas_adicionadas', set()) | alteracoes.get('arestas_alteradas', set()):
+        if graph.has_edge(u, v):
+            linhas.update(map(str, graph[u][v].get('linhas_passantes', [])))
+    return sorted(linhas)
+
+
+def read_manifest(output_dir: str) -> dict:
+    """Manifesto de um diretório de camadas: numero_linha -> entrada (vazio se não existir ou for ilegível)."""
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return {entrada['linha']: entrada for entrada in json.load(f).get('linhas', [])}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"(Mapa por linha) Manifesto '{path}' ilegível ({e}); todas as camadas serão regravadas.")
+        return {}
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_line_layers(graph: nx.DiGraph, output_dir: str, lines: list | None = None) -> dict[str, list]:
+    """
+    Grava um script com o GeoJSON compacto de cada linha em `output_dir` e atualiza o manifesto
+    (linhas.json e a cópia linhas.js lida pelo navegador).
+
+    Args:
+        graph: Grafo criado por graph_analysis.create_transport_graph (completo ou de uma região).
+        output_dir: Diretório das camadas (criado se não existir).
+        lines: Linhas a refazer (ex.: affected_lines do resultado de patch_graph_lines). None refaz
+            todas as linhas do grafo e remove as camadas de linhas que não existem mais.
+
+    Returns:
+        Dicionário com as listas de linhas 'gravadas', 'inalteradas' (mesmo conteúdo já gravado) e 'removidas'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifesto = read_manifest(output_dir)
+    edges = _edges_by_line(graph)
+    if lines is None:
+        alvo = sorted(edges) + sorted(set(manifesto) - set(edges))  # inclui as linhas que saíram do grafo
+    else:
+        alvo = sorted({str(l) for l in lines})
+    resultado = {'gravadas': [], 'inalteradas': [], 'removidas': []}
+
+    for numero_linha in alvo:
+        arquivo = line_file_name(numero_linha)
+        path = os.path.join(output_dir, arquivo)
+        entrada = manifesto.get(numero_linha)
+        # Arquivo anterior da linha, se tinha outro nome (ex.: .geojson de versões antigas)
+        antigo = None if entrada is None else os.path.join(output_dir, os.path.basename(entrada.get('arquivo', arquivo)))
+        if numero_linha not in edges:
+            if entrada is not None:
+                manifesto.pop(numero_linha)
+                for caminho in {path, antigo}:
+                    if os.path.exists(caminho):
+                        os.remove(caminho)
+                resultado['removidas'].append(numero_linha)
+            continue
+        fc = line_feature_collection(graph, numero_linha, edges[numero_linha])
+        data = _script(LINE_CALLBACK, numero_linha, fc)
+        digest = hashlib.sha1(data).hexdigest()[:16]
+        if entrada is not None and entrada.get('hash') == digest and os.path.exists(path):
+            resultado['inalteradas'].append(numero_linha)
+            continue
+        _write_atomic(path, data)
+        if antigo is not None and antigo != path and os.path.exists(antigo):
+            os.remove(antigo)
+        tipos = [f['geometry']['type'] for f in fc['features']]
+        manifesto[numero_linha] = {'linha': numero_linha, 'arquivo': arquivo, 'hash': digest,
+                                   'cor': line_color(numero_linha), 'paradas': tipos.count('Point'),
+                                   'trechos': tipos.count('LineString'), 'bytes': len(data)}
+        resultado['gravadas'].append(numero_linha)
+
+    entradas = [manifesto[l] for l in sorted(manifesto)]
+    _write_atomic(os.path.join(output_dir, MANIFEST_FILENAME),
+                  json.dumps({'linhas': entradas}, ensure_ascii=False, indent=1).encode('utf-8'))
+    _write_atomic(os.path.join(output_dir, MANIFEST_SCRIPT_FILENAME), _script(MANIFEST_CALLBACK, {'linhas': entradas}))
+    print(f"(Mapa por linha) Camadas em '{output_dir}': {len(resultado['gravadas'])} gravada(s), "
+          f"{len(resultado['inalteradas'])} inalterada(s), {len(resultado['removidas'])} removida(s).")
+    return resultado
+
+
+class LazyLineLayers(MacroElement):
+    """
+    Controle de camadas com uma camada por linha, lida do manifesto em `data_url`; o script com
+    o GeoJSON de uma linha só é carregado quando a camada é ligada pela primeira vez.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            {{ this.feature_js }}
+            var mapa = {{ this._parent.get_name() }};
+            var base = {{ this.data_url|tojson }};
+            var estiloAresta = {{ this.edge_styles|tojson }};
+            var estiloNo = {{ this.node_styles|tojson }};
+            var popupTrecho = comPopup({{ this.segment_popup_fields|tojson }}, "trecho");
+            var popupParada = comPopup({{ this.stop_popup_fields|tojson }}, "nome");
+            var camadas = {};
+            function comCor(estilos, cor) {
+                var resultado = {};
+                Object.keys(estilos).forEach(function(k) {
+                    resultado[k] = Object.assign({}, estilos[k], {color: cor, fillColor: cor});
+                });
+                return resultado;
+            }
+            // Elemento script inserido na página: funciona também com o mapa aberto como file://
+            function carregarScript(src, aoFalhar) {
+                var script = document.createElement("script");
+                script.src = src;
+                script.onerror = aoFalhar;
+                document.head.appendChild(script);
+            }
+            var controle = L.control.layers(null, null, {collapsed: {{ this.collapsed|tojson }}}).addTo(mapa);
+            window[{{ this.line_callback|tojson }}] = function(linha, dados) {
+                if (camadas[linha]) { camadas[linha].addData(dados); }
+            };
+            window[{{ this.manifest_callback|tojson }}] = function(manifesto) {
+                manifesto.linhas.forEach(function(info) {
+                    var camada = L.geoJSON(null, {
+                        style: estiloTrecho(comCor(estiloAresta, info.cor)),
+                        pointToLayer: paradaCircular(comCor(estiloNo, info.cor)),
+                        onEachFeature: function(f, layer) {
+                            (f.geometry.type === "Point" ? popupParada : popupTrecho)(f, layer);
+                        }
+                    });
+                    camadas[info.linha] = camada;
+                    var carregada = false;
+                    camada.on("add", function() {
+                        if (carregada) { return; }
+                        carregada = true;
+                        // O hash do conteúdo na URL invalida o cache do navegador quando a linha é regravada
+                        carregarScript(base + "/" + info.arquivo + "?v=" + info.hash, function() {
+                            carregada = false;
+                            console.error("Linha " + info.linha + ": arquivo " + info.arquivo + " não encontrado.");
+                        });
+                    });
+                    controle.addOverlay(camada, '<span style="color:' + info.cor + '">&#9632;</span> '
+                        + info.linha + ' (' + info.paradas + ' paradas)');
+                });
+            };
+            carregarScript(base + "/" + {{ this.manifest_filename|tojson }} + "?v=" + Date.now(), function() {
+                console.error("Manifesto das linhas não encontrado em " + base + ".");
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, data_url: str, collapsed: bool = False, node_styles: dict | None = None,
+                 edge_styles: dict | None = None):
+        super().__init__()
+        self._name = "LazyLineLayers"
+        self.feature_js = map_layers.FEATURE_JS
+        self.data_url = data_url.rstrip('/')
+        self.manifest_filename = MANIFEST_SCRIPT_FILENAME
+        self.manifest_callback = MANIFEST_CALLBACK
+        self.line_callback = LINE_CALLBACK
+        self.collapsed = collapsed
+        self.node_styles = node_styles or {'padrao': {'radius': 4, 'fillOpacity': 0.8, 'weight': 2}}
+        self.edge_styles = edge_styles or {'padrao': {'weight': 4, 'opacity': 0.8}}
+        self.stop_popup_fields = [list(f) for f in LINE_STOP_POPUP_FIELDS]
+        self.segment_popup_fields = [list(f) for f in LINE_SEGMENT_POPUP_FIELDS]
+
+
+def create_line_layers_map(graph: nx.DiGraph, map_filename: str, data_dir: str | None = None,
+                           lines: list | None = None, tile_provider: str = "OpenStreetMap",
+                           collapsed: bool = False) -> dict[str, list] | None:
+    """
+    Gera o mapa com uma camada por linha: os arquivos das linhas (write_line_layers) e a casca
+    HTML, que pode ser aberta direto do disco.
+
+    Args:
+        graph: Grafo criado por graph_analysis.create_transport_graph.
+        map_filename: Arquivo HTML da casca.
+        data_dir: Diretório das camadas. None usa '<map_filename sem extensão>_linhas'.
+        lines: Linhas a refazer (ver write_line_layers). None refaz todas.
+        tile_provider: Provedor de tiles do Folium.
+        collapsed: Se o controle de camadas começa recolhido.
+
+    Returns:
+        O resultado de write_line_layers, ou None se o grafo não tiver paradas com coordenadas.
+    """
+    coords = routing.get_coordinate_index(graph)
+    if not len(coords.nodes):
+        print("(Mapa por linha) O grafo não tem paradas com coordenadas. Mapa não será gerado.")
+        return None
+    if data_dir is None:
+        data_dir = os.path.splitext(map_filename)[0] + "_linhas"
+    resultado = write_line_layers(graph, data_dir, lines)
+
+    m = folium.Map(location=[float(coords.latitudes.mean()), float(coords.longitudes.mean())],
+                   zoom_start=12, tiles=tile_provider)
+    html_dir = os.path.dirname(os.path.abspath(map_filename))
+    data_url = os.path.relpath(os.path.abspath(data_dir), html_dir).replace(os.sep, '/')
+    LazyLineLayers(data_url, collapsed=collapsed).add_to(m)
+    m.save(map_filename)
+    print(f"(Mapa por linha) Mapa salvo em '{map_filename}' (camadas em '{data_dir}').")
+    return resultado
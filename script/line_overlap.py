@@ -0,0 +1,166 @@
+"""
+Sobreposição e redundância entre as linhas de toda a rede.
+
+Todas as métricas par a par saem de produtos de matrizes esparsas de incidência:
+    - T (trechos × linhas, de line_index.LineSegmentIndex): Tᵀ·T conta os trechos
+      compartilhados por cada par de linhas e Tᵀ·diag(extensão)·T soma a extensão
+      compartilhada;
+    - P (paradas × linhas): Pᵀ·P conta as paradas compartilhadas.
+O custo depende apenas do número de pares que de fato se sobrepõem (não há laço sobre
+todos os pares de linhas), então a análise continua rápida com mais linhas e operadoras.
+
+Trechos mais longos que `max_segment_m` (stop_data.MAX_PLAUSIBLE_SEGMENT_M) são erros de
+geocodificação: continuam contando como trechos compartilhados, mas não entram nas extensões
+e são sinalizados (coluna 'trechos_implausiveis' por linha, 'trecho_implausivel' nos corredores).
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from line_index import LineSegmentIndex
+from stop_data import MAX_PLAUSIBLE_SEGMENT_M
+
+
+class LineOverlapResult:
+    """
+    Resultado da análise de sobreposição.
+
+    Atributos:
+        pares: DataFrame com um par de linhas por registro (apenas pares com alguma
+               parada ou trecho em comum), ordenado pela extensão compartilhada.
+        redundancia: DataFrame por linha: extensão total e fração percorrida também por outra linha.
+        corredores: DataFrame por trecho percorrido por 2+ linhas, ordenado pelo número de linhas.
+    """
+
+    def __init__(self, pares: pd.DataFrame, redundancia: pd.DataFrame, corredores: pd.DataFrame):
+        self.pares = pares
+        self.redundancia = redundancia
+        self.corredores = corredores
+
+    def top(self, n: int = 10, metric: str = 'extensao_compartilhada_km') -> pd.DataFrame:
+        """Os `n` pares de linhas com maior valor na métrica escolhida (coluna de `pares`)."""
+        return self.pares.nlargest(n, metric)
+
+
+def _stop_line_matrix(stops: pd.DataFrame, lines: list[str], node_key: str) -> sparse.csr_matrix:
+    """Matriz booleana paradas × linhas (colunas na mesma ordem de `lines`)."""
+    if node_key == 'nome':
+        paradas = stops['parada_nome'].to_numpy()
+    else:
+        paradas = pd.Series(list(zip(stops['latitude'], stops['longitude'])), dtype=object).to_numpy()
+    stop_codes, stop_values = pd.factorize(paradas)
+    line_codes = pd.Index(lines).get_indexer(stops['numero_linha'].astype(str))
+    valid = (stop_codes >= 0) & (line_codes >= 0)
+    matrix = sparse.csr_matrix((np.ones(int(valid.sum()), dtype=np.int64), (stop_codes[valid], line_codes[valid])),
+                               shape=(len(stop_values), len(lines)))
+    matrix.data[:] = 1  # várias ocorrências da mesma parada na linha contam uma vez
+    return matrix
+
+
+def compute_line_overlap(stops: pd.DataFrame, node_key: str = 'nome',
+                         max_segment_m: float = MAX_PLAUSIBLE_SEGMENT_M) -> LineOverlapResult:
+    """
+    Calcula a sobreposição entre todos os pares de linhas.
+
+    Args:
+        stops: Tabela de paradas (stop_data.load_stops).
+        node_key: Identificação das paradas: 'nome' ('parada_nome') ou 'coordenada' ((lat, lon)).
+        max_segment_m: Trechos mais longos (em metros) ficam fora das extensões e são sinalizados.
+
+    Returns:
+        LineOverlapResult. Em `pares`: paradas e trechos compartilhados, Jaccard de cada
+        um, extensão compartilhada (km) e a fração da menor linha que ela representa.
+    """
+    index = LineSegmentIndex.from_stops(stops, node_key=node_key)
+    lines = index.lines
+    T = index.matrix.astype(np.int64)
+    implausible = index.segment_lengths_km * 1000.0 > max_segment_m
+    lengths = np.where(implausible, 0.0, index.segment_lengths_km)
+    P = _stop_line_matrix(stops, lines, node_key)
+
+    shared_segments = (T.T @ T).tocsr()
+    shared_length = (T.T @ sparse.diags(lengths) @ T).tocsr()
+    shared_stops = (P.T @ P).tocsr()
+
+    segment_totals = shared_segments.diagonal()
+    stop_totals = shared_stops.diagonal()
+    length_totals = shared_length.diagonal()
+
+    # Pares (a < b) com alguma sobreposição: união dos padrões de esparsidade
+    pattern = sparse.triu((shared_stops + shared_segments) > 0, k=1).tocoo()
+    a, b = pattern.row, pattern.col
+    seg = np.asarray(shared_segments[a, b]).ravel()
+    stp = np.asarray(shared_stops[a, b]).ravel()
+    ext = np.asarray(shared_length[a, b]).ravel()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccard_trechos = np.nan_to_num(seg / (segment_totals[a] + segment_totals[b] - seg))
+        jaccard_paradas = np.nan_to_num(stp / (stop_totals[a] + stop_totals[b] - stp))
+        fracao_menor = np.nan_to_num(ext / np.minimum(length_totals[a], length_totals[b]))
+
+    nomes = _line_names(stops)
+    lines_arr = np.array(lines, dtype=object)
+    pares = pd.DataFrame({
+        'linha_a': lines_arr[a],
+        'linha_b': lines_arr[b],
+        'nome_linha_a': [nomes.get(l, '') for l in lines_arr[a]],
+        'nome_linha_b': [nomes.get(l, '') for l in lines_arr[b]],
+        'paradas_compartilhadas': stp,
+        'jaccard_paradas': jaccard_paradas,
+        'trechos_compartilhados': seg,
+        'jaccard_trechos': jaccard_trechos,
+        'extensao_compartilhada_km': ext,
+        'fracao_menor_linha': fracao_menor,
+    }).sort_values(by=['extensao_compartilhada_km', 'jaccard_trechos'], ascending=False, kind='stable').reset_index(drop=True)
+
+    # Redundância por linha: extensão percorrida também por alguma outra linha
+    lines_per_segment = np.asarray(T.sum(axis=1)).ravel()
+    shared_mask = (lines_per_segment > 1).astype(float)
+    extensao_redundante = T.T @ (lengths * shared_mask)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fracao_redundante = np.nan_to_num(extensao_redundante / length_totals)
+    redundancia = pd.DataFrame({
+        'linha': lines,
+        'nome_linha': [nomes.get(l, '') for l in lines],
+        'trechos': segment_totals,
+        'paradas': stop_totals,
+        'extensao_km': length_totals,
+        'extensao_redundante_km': extensao_redundante,
+        'fracao_redundante': fracao_redundante,
+        'trechos_implausiveis': T.T @ implausible.astype(np.int64),
+    }).sort_values(by='fracao_redundante', ascending=False, kind='stable').reset_index(drop=True)
+
+    # Corredores: trechos percorridos por várias linhas
+    multi = np.flatnonzero(lines_per_segment > 1)
+    corredores = pd.DataFrame({
+        'origem': [index.segments[i][0] for i in multi],
+        'destino': [index.segments[i][1] for i in multi],
+        'num_linhas': lines_per_segment[multi],
+        'linhas': [", ".join(index.lines_on(*index.segments[i])) for i in multi],
+        'extensao_km': np.where(implausible[multi], np.nan, lengths[multi]),
+        'trecho_implausivel': implausible[multi],
+    }).sort_values(by=['num_linhas', 'extensao_km'], ascending=False, kind='stable',
+                   na_position='last').reset_index(drop=True)
+
+    return LineOverlapResult(pares, redundancia, corredores)
+
+
+def _line_names(stops: pd.DataFrame) -> dict:
+    """numero_linha -> nome_linha (primeira ocorrência)."""
+    if 'nome_linha' not in stops.columns:
+        return {}
+    nomes = stops.drop_duplicates(subset=['numero_linha'])
+    return dict(zip(nomes['numero_linha'].astype(str), nomes['nome_linha'].fillna('')))
+
+
+def export_overlap(result: LineOverlapResult, output_prefix: str) -> list[str]:
+    """
+    Grava os três rankings em CSV: <prefixo>_pares.csv, <prefixo>_redundancia.csv e
+    <prefixo>_corredores.csv. Retorna os caminhos gravados.
+    """
+    paths = []
+    for name, df in [('pares', result.pares), ('redundancia', result.redundancia), ('corredores', result.corredores)]:
+        path = f"{output_prefix}_{name}.csv"
+        df.to_csv(path, index=False, float_format='%.4f')
+        paths.append(path)
+    return paths
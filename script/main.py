@@ -7,7 +7,6 @@ retrieves the stops for each line, and consolidates the data into a CSV file.
 import time
 import pandas as pd # Importar pandas
 import os # Adicionado para verificações de arquivo
-import pickle # Para salvar/carregar o grafo NetworkX
 import networkx as nx # Para type hinting e manipulação do grafo
 import argparse # Adicionar import do argparse
 
@@ -16,48 +15,12 @@ from moovit_scraper import MoovitScraper
 from data_exporter import DataExporter
 from geocoder import GeoCoder # Importar GeoCoder
 import graph_analysis as graph_analysis # Para gerar o mapa
-
-# --- Funções de Cache para o Grafo NetworkX ---
-# Estas funções são movidas para cá para serem usadas pelo AppController
-def save_graph_to_cache(graph: nx.DiGraph, cache_path: str):
-    """Salva o grafo NetworkX em um arquivo usando pickle."""
-    try:
-        with open(cache_path, 'wb') as f:
-            pickle.dump(graph, f, pickle.HIGHEST_PROTOCOL)
-        print(f"Grafo salvo em cache em '{cache_path}'")
-    except Exception as e:
-        print(f"Erro ao salvar o grafo no cache '{cache_path}': {e}")
-
-def load_graph_from_cache(cache_path: str, source_csv_path: str) -> nx.DiGraph | None:
-    """
-    Carrega o grafo NetworkX do cache se existir e for mais recente que o CSV de origem.
-    Retorna o grafo carregado ou None.
-    """
-    if not os.path.exists(cache_path):
-        print(f"(Cache do Grafo) Arquivo '{cache_path}' não encontrado.")
-        return None
-    
-    if not os.path.exists(source_csv_path):
-        print(f"(Cache do Grafo) Arquivo CSV de origem '{source_csv_path}' não encontrado. Cache do grafo invalidado.")
-        return None
-        
-    try:
-        cache_mod_time = os.path.getmtime(cache_path)
-        csv_mod_time = os.path.getmtime(source_csv_path)
-        
-        if cache_mod_time > csv_mod_time:
-            print(f"(Cache do Grafo) Carregando grafo do cache '{cache_path}' (válido)...")
-            with open(cache_path, 'rb') as f:
-                G = pickle.load(f)
-            print("(Cache do Grafo) Grafo carregado com sucesso.")
-            return G
-        else:
-            print(f"(Cache do Grafo) Cache '{cache_path}' desatualizado em relação a '{source_csv_path}'.")
-            return None
-    except Exception as e:
-        print(f"(Cache do Grafo) Erro ao carregar/validar: {e}.")
-        return None
-# --- Fim das Funções de Cache ---
+import reachability # Índice de alcançabilidade do grafo
+import stop_data # Tabela de paradas validada e construtor do grafo (com cache)
+import connections # Colunas do arquivo de horários (tabela de conexões)
+import regions # Regiões nomeadas (polígonos GeoJSON) para os mapas e CSVs regionais
+import line_layers # Mapa com uma camada por linha, carregada sob demanda
+import stop_clustering # Deduplicação de paradas (mesma parada física com nomes/coordenadas ligeiramente diferentes)
 
 class AppController:
     """
@@ -68,14 +31,23 @@ class AppController:
     EPT_LINES_URL = "https://moovitapp.com/index/pt-br/transporte_p%C3%BAblico-lines-Rio_de_Janeiro-322-1036555"
     CSV_RAW_FILENAME = "script/data/moovit_stops_raw.csv" # Cache para dados brutos
     CSV_GEOCODED_FILENAME = "script/data/moovit_stops_geocoded.csv" # Arquivo de dados geocodificados
-    CSV_GEOCODED_FILTERED_FILENAME = "script/data/moovit_stops_geocoded_filtered.csv" # Arquivo de dados filtrados para Itaipuaçu
-    CACHE_GRAFO_FILENAME = "script/cache/cached_moovit_graph.gpickle" # Cache para o grafo NetworkX
+    CSV_GEOCODED_FILTERED_FILENAME = "script/data/moovit_stops_geocoded_filtered.csv" # Arquivo de dados filtrados da região principal (Itaipuaçu)
+    CSV_SCHEDULES_FILENAME = "script/data/moovit_schedules_raw.csv" # Horários/frequências das linhas (quando publicados)
+    CSV_STOP_ALIASES_FILENAME = "script/data/moovit_stops_aliases.csv" # Nome/coordenada original -> parada canônica
+    TOLERANCIA_AGRUPAMENTO_PARADAS_M = 25.0 # Registros da mesma parada (nome normalizado igual) a até esta distância são unidos
+    CACHE_GRAFO_DIR = "script/cache/graphs" # Cache versionado do grafo (arrays colunares .npz, chave = hash do CSV)
+    CACHE_GRAFO_MAX_VERSOES = 5 # Versões mantidas no cache antes do descarte LRU
+    MAX_FRACAO_LINHAS_INCREMENTAL = 0.25 # Acima desta fração de linhas alteradas, reconstrói o grafo inteiro
     MAP_HTML_FILENAME = "script/map_moovit_stops.html" # Nome do arquivo do mapa final
-    MAP_HTML_FILTERED_FILENAME = "script/map_moovit_stops_itaipuacu.html" # Nome do mapa filtrado
-
-    # Coordenadas do delimitador para Itaipuaçu (Recanto de Itaipuaçu até Restringa de Maricá, ate Inicio de São José do Imabssai e até Inoa)
-    LAT_MIN_ITA, LAT_MAX_ITA = -22.990, -22.900
-    LON_MIN_ITA, LON_MAX_ITA = -43.030, -42.870
+    MAP_RENDER_MODE = "geojson" # 'geojson' (camada GeoJSON, map_layers) ou 'marcadores' (um objeto Folium por parada/trecho)
+    MAP_AGRUPAR_PARADAS = False # No modo 'geojson', agrupa as paradas (leaflet.markercluster)
+    MAP_LINHAS_HTML_FILENAME = "script/map_moovit_linhas.html" # Mapa da rede completa com uma camada por linha (abre direto do disco)
+    MAP_LINHAS_DIR = "script/map_moovit_linhas" # Um arquivo por linha + manifesto; só as linhas alteradas são regravadas
+    # Regiões (polígonos GeoJSON, um ou mais por arquivo): um CSV e um mapa por região em cada execução
+    REGIONS_DIR = "script/data/regioes"
+    MAP_HTML_REGION_PATTERN = "script/map_moovit_stops_{regiao}.html" # Mapa de cada região (identificador da região)
+    CSV_GEOCODED_REGION_PATTERN = "script/data/moovit_stops_geocoded_{regiao}.csv" # Dados filtrados de cada região
+    REGIAO_PRINCIPAL = "itaipuacu" # Região cujo CSV é gravado em CSV_GEOCODED_FILTERED_FILENAME (entrada das análises em tests/)
 
     def __init__(self):
         """
@@ -85,6 +57,8 @@ class AppController:
         self.exporter = DataExporter()
         self.geocoder = GeoCoder(user_agent_suffix="MoovitMaricaScraper/1.0 (seuemail@example.com)", ) # Atualize com seu email
         self.all_stops_data_list = [] # Armazena a lista de dicionários de paradas
+        self.all_schedules_data_list = [] # Armazena os horários/frequências extraídos das linhas
+        self.reachability_index: reachability.ReachabilityIndex | None = None # Construído ao carregar o grafo
 
     def run(self, force_rescrape=False, force_regeocode=False):
         """
@@ -104,7 +78,7 @@ class AppController:
         if not force_regeocode and not force_rescrape and os.path.exists(self.CSV_GEOCODED_FILENAME):
             print(f"Arquivo geocodificado final '{self.CSV_GEOCODED_FILENAME}' já existe. Tentando carregar para o mapa...")
             try:
-                geocoded_stops_df = pd.read_csv(self.CSV_GEOCODED_FILENAME)
+                geocoded_stops_df = stop_data.load_stops(self.CSV_GEOCODED_FILENAME)
                 print(f"Dados geocodificados carregados de '{self.CSV_GEOCODED_FILENAME}'. {len(geocoded_stops_df)} registros.")
             except Exception as e:
                 print(f"Erro ao carregar '{self.CSV_GEOCODED_FILENAME}': {e}. Prosseguindo para possível recriação.")
@@ -154,6 +128,7 @@ class AppController:
                 lines_to_process = lines
 
                 self.all_stops_data_list = [] # Resetar lista antes de um novo scraping
+                self.all_schedules_data_list = []
                 print(f"\nIniciando processamento para {len(lines_to_process)} linhas...")
                 for i, line_info in enumerate(lines_to_process):
                     line_code = line_info.get('numero_linha')
@@ -188,6 +163,13 @@ class AppController:
                         else:
                             print(f"  -> Nenhuma parada encontrada ou extraída para {line_print_name}.")
 
+                        # Extrai horários/frequências, quando a página da linha os publica
+                        self.all_schedules_data_list.extend(self.scraper.extract_schedule_from_line_page(
+                            html_content=line_page_html,
+                            line_number_ref=line_code,
+                            line_url_ref=line_url
+                        ))
+
                         # Pausa entre o processamento de linhas para não sobrecarregar o servidor
                         if i < len(lines_to_process) - 1:
                             print(f"  Aguardando {self.scraper.sleep_duration}s...")
@@ -200,6 +182,16 @@ class AppController:
                     print("\nNenhum dado de parada foi coletado de nenhuma linha. Arquivos e mapa não serão criados.")
                     return
 
+                if self.all_schedules_data_list:
+                    try:
+                        schedules_df = pd.DataFrame(self.all_schedules_data_list)
+                        print(f"Salvando {len(schedules_df)} registros de horário em '{self.CSV_SCHEDULES_FILENAME}'...")
+                        self.exporter.export_to_csv(schedules_df, self.CSV_SCHEDULES_FILENAME, expected_columns=connections.SCHEDULE_COLUMNS)
+                    except Exception as e:
+                        print(f"Erro ao salvar horários em '{self.CSV_SCHEDULES_FILENAME}': {e}")
+                else:
+                    print("Nenhuma página de linha publicou horários; as consultas por horário usarão a frequência padrão.")
+
                 print("\nConvertendo dados de paradas coletados para DataFrame...")
                 stops_df = pd.DataFrame(self.all_stops_data_list)
                 
@@ -275,108 +267,100 @@ class AppController:
             print("Geração do mapa cancelada.")
             return
 
-        # Tentar carregar o grafo do cache
-        G_moovit: nx.DiGraph | None = load_graph_from_cache(self.CACHE_GRAFO_FILENAME, self.CSV_GEOCODED_FILENAME)
+        # Tabela validada e grafo pelo construtor compartilhado (memorizado em processo e no cache
+        # versionado em disco, com chave = hash do conteúdo dos dados + versão do construtor)
+        df_paradas_originais = stop_data.prepare_stops(df_para_grafo_e_mapa)
+        # Une os registros da mesma parada física antes de montar o grafo (ids canônicos + tabela de aliases)
+        df_para_grafo_e_mapa, df_aliases = stop_clustering.deduplicate_stops(
+            df_paradas_originais, tolerance_m=self.TOLERANCIA_AGRUPAMENTO_PARADAS_M)
+        self.exporter.export_to_csv(df_aliases, self.CSV_STOP_ALIASES_FILENAME,
+                                    expected_columns=stop_clustering.ALIAS_COLUMNS)
+        G_moovit: nx.DiGraph | None = stop_data.build_graph(
+            df_para_grafo_e_mapa, node_key='nome', weight_unit='km',
+            cache_dir=self.CACHE_GRAFO_DIR, max_entries=self.CACHE_GRAFO_MAX_VERSOES,
+            max_changed_fraction=self.MAX_FRACAO_LINHAS_INCREMENTAL)
 
-        if G_moovit is None:
-            print("(Mapa) Construindo o grafo de transporte...")
-            G_moovit = graph_analysis.create_transport_graph(df_para_grafo_e_mapa)
-            
-            if G_moovit is not None and G_moovit.number_of_nodes() > 0:
-                save_graph_to_cache(G_moovit, self.CACHE_GRAFO_FILENAME)
-            elif G_moovit is None or G_moovit.number_of_nodes() == 0:
-                print("(Mapa) Falha ao criar o grafo ou o grafo está vazio. Mapa não será gerado.")
-                return
-        
         if G_moovit is None or G_moovit.number_of_nodes() == 0:
              print("(Mapa) O grafo está vazio ou não pôde ser construído/carregado. Mapa não será gerado.")
              return
 
         print(f"(Mapa) Grafo completo carregado/criado com {G_moovit.number_of_nodes()} nós e {G_moovit.number_of_edges()} arestas.")
 
-        # --- Filtragem para Itaipuaçu ---
-        print("\n--- Aplicando filtro para a região de Itaipuaçu ---")
-        
-        def inside_bbox(node_data):
-            # NetworkX armazena lon, lat em 'pos', mas também temos 'latitude' e 'longitude' diretamente
-            lat = node_data.get('latitude')
-            lon = node_data.get('longitude')
-            if lat is None or lon is None:
-                # Tentar obter de 'pos' se disponível e 'latitude'/'longitude' não estiverem
-                pos = node_data.get('pos') # Espera-se (lon, lat)
-                if pos and isinstance(pos, tuple) and len(pos) == 2:
-                    lon, lat = pos[0], pos[1] # Ordem em 'pos' é (lon, lat)
-                else:
-                    return False # Não há dados de coordenadas suficientes
-            return (self.LAT_MIN_ITA <= lat <= self.LAT_MAX_ITA and
-                    self.LON_MIN_ITA <= lon <= self.LON_MAX_ITA)
+        # Índice de alcançabilidade construído no carregamento: consultas sem caminho são rejeitadas em O(1)
+        self.reachability_index = reachability.attach_index(G_moovit)
+        self.reachability_index.print_summary()
+
+        # Mapa por linha da rede completa: casca HTML leve e um arquivo por linha, carregado só quando
+        # a linha é ligada no controle de camadas (arquivos de linhas sem alteração não são regravados)
+        line_layers.create_line_layers_map(G_moovit, self.MAP_LINHAS_HTML_FILENAME, self.MAP_LINHAS_DIR)
+
+        # --- Filtragem por região ---
+        # Regiões definidas por polígonos GeoJSON; cada parada é atribuída a todas as regiões que
+        # a contêm em uma única consulta vetorizada (regions.assign_regions)
+        regioes = regions.load_regions(self.REGIONS_DIR)
+        if not regioes:
+            print(f"(Mapa) Nenhuma região encontrada em '{self.REGIONS_DIR}'. Gerando apenas o mapa completo.")
+            self._create_map(G_moovit, df_para_grafo_e_mapa, self.MAP_HTML_FILENAME)
+            return
 
-        ita_nodes = [node_name for node_name, data in G_moovit.nodes(data=True) if inside_bbox(data)]
-        
-        if not ita_nodes:
-            print("(Mapa) Nenhum nó encontrado dentro do delimitador de Itaipuaçu. Mapa filtrado e CSV não serão gerados.")
-            # Ainda assim, podemos gerar o mapa completo se desejado, ou parar aqui.
-            # Por ora, vamos gerar o mapa completo como fallback.
-            # Se quiser evitar isso, adicione um 'return' aqui.
-            print("(Mapa) Gerando mapa completo como fallback, pois a área filtrada é vazia.")
-            G_para_mapa = G_moovit
-            df_para_mapa_final = df_para_grafo_e_mapa
-            map_filename_final = self.MAP_HTML_FILENAME
-        else:
-            G_itaipuacu = G_moovit.subgraph(ita_nodes).copy()
-            print(f"(Mapa) Subgrafo de Itaipuaçu criado com {G_itaipuacu.number_of_nodes()} nós e {G_itaipuacu.number_of_edges()} arestas.")
-
-            # Filtrar o DataFrame para conter apenas as paradas do subgrafo de Itaipuaçu
+        print(f"\n--- Aplicando filtro para {len(regioes)} região(ões): {', '.join(r.name for r in regioes)} ---")
+        # Cada região é lida só dos ladrilhos do grafo que cruzam seu retângulo envolvente
+        subgrafos = stop_data.load_region_graphs(df_para_grafo_e_mapa, regioes, node_key='nome', weight_unit='km',
+                                                 cache_dir=self.CACHE_GRAFO_DIR)
+        # Parada canônica (nó do grafo) de cada registro original, para os CSVs das regiões
+        nomes_canonicos = stop_clustering.canonical_stop_names(df_paradas_originais, df_aliases)
+        mapas_gerados = 0
+        for regiao in regioes:
+            G_regiao = subgrafos[regiao.name]
+            if G_regiao.number_of_nodes() == 0:
+                print(f"(Mapa) Nenhum nó encontrado na região '{regiao.name}'. Mapa e CSV da região não serão gerados.")
+                continue
+            print(f"(Mapa) Subgrafo de {regiao.name} criado com {G_regiao.number_of_nodes()} nós e {G_regiao.number_of_edges()} arestas.")
+
+            # Filtrar o DataFrame para conter apenas as paradas do subgrafo da região
             # Usamos 'parada_nome' que é a chave dos nós no grafo
-            df_geocoded_filtered_ita = df_para_grafo_e_mapa[df_para_grafo_e_mapa['parada_nome'].isin(ita_nodes)].copy()
-            
-            if not df_geocoded_filtered_ita.empty:
-                print(f"(Mapa) Salvando dados geocodificados filtrados para Itaipuaçu em '{self.CSV_GEOCODED_FILTERED_FILENAME}'...")
+            df_regiao = df_para_grafo_e_mapa[df_para_grafo_e_mapa['parada_nome'].isin(G_regiao.nodes)].copy()
+            csv_regiao = (self.CSV_GEOCODED_FILTERED_FILENAME if regiao.slug == self.REGIAO_PRINCIPAL
+                          else self.CSV_GEOCODED_REGION_PATTERN.format(regiao=regiao.slug))
+            if not df_regiao.empty:
+                print(f"(Mapa) Salvando dados geocodificados filtrados para {regiao.name} em '{csv_regiao}'...")
                 try:
                     # Usar as colunas originais esperadas para manter a consistência
                     expected_columns_export = [
                         'numero_linha', 'nome_linha', 'url_linha', 'sentido', 'ordem_parada', 'nome_parada',
                         'latitude', 'longitude', 'endereco_geocodificado'
                     ]
+                    # O CSV guarda os registros originais (nomes e coordenadas publicados, sem
+                    # deduplicação) cujas paradas canônicas são nós do subgrafo da região
+                    df_export = df_paradas_originais[nomes_canonicos.isin(G_regiao.nodes)]
+                    # O grafo usa 'parada_nome'; o CSV mantém o nome original da coluna
+                    df_export = df_export.rename(columns={'parada_nome': 'nome_parada'})
                     # Garantir que apenas colunas existentes no df filtrado sejam pedidas
-                    cols_to_export = [col for col in expected_columns_export if col in df_geocoded_filtered_ita.columns]
-                    
-                    self.exporter.export_to_csv(df_geocoded_filtered_ita, self.CSV_GEOCODED_FILTERED_FILENAME, expected_columns=cols_to_export)
-                    print(f"(Mapa) Dados filtrados salvos em '{self.CSV_GEOCODED_FILTERED_FILENAME}'. {len(df_geocoded_filtered_ita)} registros.")
+                    cols_to_export = [col for col in expected_columns_export if col in df_export.columns]
+
+                    self.exporter.export_to_csv(df_export, csv_regiao, expected_columns=cols_to_export)
+                    print(f"(Mapa) Dados filtrados salvos em '{csv_regiao}'. {len(df_export)} registros.")
                 except Exception as e:
                     print(f"(Mapa) Erro ao salvar CSV filtrado: {e}")
             else:
-                print("(Mapa) DataFrame filtrado para Itaipuaçu está vazio. CSV não será salvo.")
-            
-            G_para_mapa = G_itaipuacu
-            df_para_mapa_final = df_geocoded_filtered_ita # Usar o DataFrame filtrado para o mapa
-            map_filename_final = self.MAP_HTML_FILTERED_FILENAME
-
-        if G_para_mapa is not None and G_para_mapa.number_of_nodes() > 0:
-            if df_para_mapa_final.empty and G_para_mapa == G_itaipuacu : # Se o grafo filtrado existe mas o df ficou vazio
-                print("(Mapa) Atenção: O grafo filtrado de Itaipuaçu tem nós, mas o DataFrame correspondente está vazio.")
-                print("(Mapa) Verifique a consistência dos nomes das paradas entre o grafo e o DataFrame.")
-                print("(Mapa) O mapa de Itaipuaçu será gerado, mas pode não ter todos os popups/informações de aresta corretos se depender do DataFrame.")
-                # Para o mapa, precisamos de df_para_grafo_e_mapa (original) para detalhes das linhas, mesmo que filtrado
-                # A função create_interactive_map usa o df para buscar linhas por parada_nome.
-                # Se df_para_mapa_final está vazio, ele não encontrará informações.
-                # Uma opção é passar df_para_grafo_e_mapa, e a função create_interactive_map internamente fará a busca.
-                # Ou garantir que df_para_mapa_final contenha os dados necessários.
-                # Por simplicidade, vamos usar o df_geocoded_filtered_ita que deve ser o correto.
-                # Se ele estiver vazio, o mapa será gerado mas as informações de parada podem ser limitadas.
-
-
-            print(f"(Mapa) Gerando mapa interativo HTML em '{map_filename_final}'...")
-            
-            graph_analysis.create_interactive_map(
-                G_para_mapa, 
-                df_para_mapa_final if not df_para_mapa_final.empty else df_para_grafo_e_mapa, # Fallback para df original se o filtrado estiver vazio e G filtrado não.
-                path_to_highlight=None, 
-                map_filename=map_filename_final
-            )
-            print("(Mapa) Processo de criação do mapa concluído.")
-        else:
-             print("(Mapa) O grafo final para o mapa está vazio ou não pôde ser construído. Mapa não será gerado.")
+                # O grafo da região tem nós, mas o DataFrame correspondente está vazio: verifique a
+                # consistência dos nomes das paradas. O mapa usa a tabela completa para os popups.
+                print(f"(Mapa) Atenção: o grafo de {regiao.name} tem nós, mas o DataFrame correspondente está vazio. CSV não será salvo.")
+                df_regiao = df_para_grafo_e_mapa
+
+            self._create_map(G_regiao, df_regiao, self.MAP_HTML_REGION_PATTERN.format(regiao=regiao.slug))
+            mapas_gerados += 1
+
+        if mapas_gerados == 0:
+            print("(Mapa) Gerando mapa completo como fallback, pois nenhuma região tem paradas.")
+            self._create_map(G_moovit, df_para_grafo_e_mapa, self.MAP_HTML_FILENAME)
+
+    def _create_map(self, graph: nx.DiGraph, df_stops: pd.DataFrame, map_filename: str):
+        """Gera o mapa interativo HTML de um grafo (completo ou de uma região)."""
+        print(f"(Mapa) Gerando mapa interativo HTML em '{map_filename}'...")
+        graph_analysis.create_interactive_map(graph, df_stops, path_to_highlight=None, map_filename=map_filename,
+                                              render_mode=self.MAP_RENDER_MODE, cluster_stops=self.MAP_AGRUPAR_PARADAS)
+        print("(Mapa) Processo de criação do mapa concluído.")
 
 if __name__ == "__main__":
     # --- Configuração do ArgumentParser ---
@@ -0,0 +1,227 @@
+"""
+Camada de rede para mapas Folium em GeoJSON, com estilo e popups montados no navegador.
+
+O modo por marcadores de graph_analysis.create_interactive_map cria um objeto Folium (com seu
+próprio Popup em HTML) por parada e por trecho: o HTML cresce linearmente com muito texto
+repetido e o navegador cria milhares de objetos JavaScript declarados um a um. Aqui a rede é
+emitida como duas FeatureCollections (paradas e trechos) com as propriedades de cada feição;
+o estilo (padrão / destaque), os tooltips e os popups são gerados em JavaScript a partir
+dessas propriedades, e as paradas podem ser agrupadas (leaflet.markercluster). O GeoJSON vai
+no HTML em JSON compacto (script_json): sem espaços, acentos em UTF-8 e números arredondados.
+"""
+import json
+
+import folium
+import networkx as nx
+from folium.elements import JSCSSMixin
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+import routing
+
+# Casas decimais das coordenadas (5 casas = 1,1 m; mesma precisão exibida nos popups)
+COORD_DECIMALS = 5
+# Casas decimais das propriedades numéricas das feições (ex.: distancia_km; 4 casas = 0,1 m)
+PROPERTY_DECIMALS = 4
+# Caracteres escapados no JSON embutido em <script> ('</script>', '<!--' e separadores de linha)
+_SCRIPT_ESCAPES = {'<': '\\u003c', '>': '\\u003e', '&': '\\u0026', '\u2028': '\\u2028', '\u2029': '\\u2029'}
+
+# Estilos padrão (mesmas cores e espessuras do modo por marcadores)
+DEFAULT_NODE_STYLES = {
+    'padrao': {'radius': 5, 'color': 'blue', 'fillColor': 'blue', 'fillOpacity': 0.7, 'weight': 3},
+    'destaque': {'radius': 8, 'color': 'red', 'fillColor': 'red', 'fillOpacity': 0.7, 'weight': 3},
+}
+DEFAULT_EDGE_STYLES = {
+    'padrao': {'color': '#555555', 'weight': 2.5, 'opacity': 0.6},
+    'destaque': {'color': 'red', 'weight': 4, 'opacity': 0.85},
+}
+# Campos dos popups: (rótulo, propriedade, casas decimais ou None, sufixo)
+STOP_POPUP_FIELDS = [
+    ("Parada", 'nome', None, ""),
+    ("Endereço", 'endereco', None, ""),
+    ("Latitude", 'lat', 5, ""),
+    ("Longitude", 'lon', 5, ""),
+    ("Linhas (EPT)", 'linhas', None, ""),
+]
+SEGMENT_POPUP_FIELDS = [
+    ("Trecho", 'trecho', None, ""),
+    ("Distância", 'distancia_km', 2, " km"),
+    ("Linha Principal (neste trecho)", 'linha', None, ""),
+    ("Todas as Linhas (neste trecho)", 'linhas', None, ""),
+]
+
+
+# Funções JavaScript compartilhadas pelas camadas (NetworkGeoJsonLayer e line_layers):
+# popups/tooltips a partir das propriedades e estilos 'padrao'/'destaque' com 'cor'/'raio' por feição.
+FEATURE_JS = """
+            function formatar(campos, p) {
+                var linhas = [];
+                campos.forEach(function(c) {
+                    var valor = p[c[1]];
+                    if (valor === undefined) { return; }  // campo ausente na feição: omitido
+                    if (valor === null) { valor = "N/A"; }
+                    else if (c[2] !== null && typeof valor === "number") { valor = valor.toFixed(c[2]) + c[3]; }
+                    else { valor = valor + c[3]; }
+                    linhas.push("<b>" + c[0] + ":</b> " + valor);
+                });
+                return linhas.join("<br>");
+            }
+            function comPopup(campos, tooltip) {
+                return function(feature, layer) {
+                    var p = feature.properties;
+                    if (feature.geometry.type === "Point") {
+                        // Latitude/longitude dos popups vêm da própria geometria
+                        p = Object.assign({lat: feature.geometry.coordinates[1], lon: feature.geometry.coordinates[0]}, p);
+                    }
+                    layer.bindPopup(formatar(campos, p), {maxWidth: 300});
+                    if (tooltip && p[tooltip] !== undefined) { layer.bindTooltip(String(p[tooltip]), {sticky: true}); }
+                };
+            }
+            function estiloTrecho(estilos) {
+                return function(f) {
+                    var p = f.properties;
+                    var estilo = Object.assign({}, estilos[p.destaque ? "destaque" : "padrao"]);
+                    if (p.cor) { estilo.color = p.cor; }
+                    return estilo;
+                };
+            }
+            function paradaCircular(estilos) {
+                return function(f, latlng) {
+                    var p = f.properties;
+                    var estilo = Object.assign({}, estilos[p.destaque ? "destaque" : "padrao"]);
+                    if (p.cor) { estilo.color = p.cor; estilo.fillColor = p.cor; }
+                    if (p.raio) { estilo.radius = p.raio; }
+                    return L.circleMarker(latlng, estilo);
+                };
+            }
+"""
+
+
+def _round(value: float) -> float:
+    return round(float(value), COORD_DECIMALS)
+
+
+def script_json(value) -> str:
+    """
+    JSON compacto para embutir em <script>: sem espaços, com acentos em UTF-8 (ensure_ascii=False)
+    e com '<', '>', '&', U+2028 e U+2029 escapados como \\uXXXX (o texto não fecha a tag nem
+    quebra a linha do JavaScript).
+    """
+    texto = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    for caractere, escape in _SCRIPT_ESCAPES.items():
+        texto = texto.replace(caractere, escape)
+    return texto
+
+
+def _round_properties(props: dict) -> dict:
+    """Arredonda as propriedades float a PROPERTY_DECIMALS casas."""
+    return {k: round(v, PROPERTY_DECIMALS) if isinstance(v, float) else v for k, v in props.items()}
+
+
+def network_feature_collections(graph: nx.DiGraph, stop_properties=None, edge_properties=None,
+                                highlight_nodes=(), highlight_edges=()) -> tuple[dict, dict]:
+    """
+    FeatureCollections (paradas, trechos) da rede. Paradas ou trechos sem coordenadas são omitidos;
+    coordenadas e propriedades float são arredondadas (COORD_DECIMALS, PROPERTY_DECIMALS).
+
+    Args:
+        graph: Grafo com 'latitude'/'longitude' (ou 'lat'/'lon') nos nós.
+        stop_properties: Função (nó, atributos) -> dict com as propriedades da parada.
+        edge_properties: Função (u, v, atributos) -> dict com as propriedades do trecho.
+        highlight_nodes, highlight_edges: Paradas / trechos (u, v) marcados com 'destaque' = 1.
+    """
+    highlight_nodes, highlight_edges = set(highlight_nodes), set(highlight_edges)
+    coords = {}
+    stops = []
+    for node, data in graph.nodes(data=True):
+        latlon = routing.node_coordinates(data)
+        if latlon is None:
+            continue
+        lat, lon = latlon
+        coords[node] = [_round(lon), _round(lat)]
+        props = _round_properties(stop_properties(node, data)) if stop_properties else {'nome': str(node)}
+        if node in highlight_nodes:
+            props['destaque'] = 1
+        stops.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': coords[node]}, 'properties': props})
+    segments = []
+    for u, v, data in graph.edges(data=True):
+        if u not in coords or v not in coords:
+            continue
+        props = _round_properties(edge_properties(u, v, data)) if edge_properties else {}
+        if (u, v) in highlight_edges:
+            props['destaque'] = 1
+        segments.append({'type': 'Feature', 'geometry': {'type': 'LineString', 'coordinates': [coords[u], coords[v]]},
+                         'properties': props})
+    return ({'type': 'FeatureCollection', 'features': stops}, {'type': 'FeatureCollection', 'features': segments})
+
+
+class NetworkGeoJsonLayer(JSCSSMixin):
+    """
+    Elemento Folium com as paradas e os trechos da rede em GeoJSON.
+
+    Args:
+        stops, segments: FeatureCollections de network_feature_collections.
+        stop_popup_fields, segment_popup_fields: Campos dos popups (rótulo, propriedade, decimais, sufixo);
+            propriedades ausentes na feição são omitidas e propriedades None aparecem como "N/A".
+        stop_tooltip, segment_tooltip: Propriedade usada como tooltip.
+        node_styles, edge_styles: Estilos Leaflet 'padrao' e 'destaque' (feições com 'destaque' = 1);
+            uma feição também pode trazer 'cor' e 'raio' próprios nas propriedades.
+        cluster: Agrupa as paradas (leaflet.markercluster) até o zoom `disable_clustering_at_zoom`.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            {{ this.feature_js }}
+            var trechos = L.geoJSON({{ this.segments_json }}, {
+                style: estiloTrecho({{ this.edge_styles|tojson }}),
+                onEachFeature: comPopup({{ this.segment_popup_fields|tojson }}, {{ this.segment_tooltip|tojson }})
+            });
+            var paradas = L.geoJSON({{ this.stops_json }}, {
+                pointToLayer: paradaCircular({{ this.node_styles|tojson }}),
+                onEachFeature: comPopup({{ this.stop_popup_fields|tojson }}, {{ this.stop_tooltip|tojson }})
+            });
+            trechos.addTo({{ this._parent.get_name() }});
+            {%- if this.cluster %}
+            var grupo = L.markerClusterGroup({disableClusteringAtZoom: {{ this.disable_clustering_at_zoom }}});
+            grupo.addLayer(paradas);
+            grupo.addTo({{ this._parent.get_name() }});
+            {%- else %}
+            paradas.addTo({{ this._parent.get_name() }});
+            {%- endif %}
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, stops: dict, segments: dict, stop_popup_fields=STOP_POPUP_FIELDS,
+                 segment_popup_fields=SEGMENT_POPUP_FIELDS, stop_tooltip: str | None = 'nome',
+                 segment_tooltip: str | None = 'trecho', node_styles: dict | None = None,
+                 edge_styles: dict | None = None, cluster: bool = False, disable_clustering_at_zoom: int = 16):
+        super().__init__()
+        self._name = "NetworkGeoJsonLayer"
+        self.feature_js = FEATURE_JS
+        self.stops = stops
+        self.segments = segments
+        self.stops_json = script_json(stops)
+        self.segments_json = script_json(segments)
+        self.stop_popup_fields = [list(f) for f in stop_popup_fields]
+        self.segment_popup_fields = [list(f) for f in segment_popup_fields]
+        self.stop_tooltip = stop_tooltip
+        self.segment_tooltip = segment_tooltip
+        self.node_styles = node_styles or DEFAULT_NODE_STYLES
+        self.edge_styles = edge_styles or DEFAULT_EDGE_STYLES
+        self.cluster = cluster
+        self.disable_clustering_at_zoom = int(disable_clustering_at_zoom)
+        # Recursos do leaflet.markercluster só quando o agrupamento é usado
+        self.default_js = list(MarkerCluster.default_js) if cluster else []
+        self.default_css = list(MarkerCluster.default_css) if cluster else []
+
+
+def add_network_layer(folium_map: folium.Map, graph: nx.DiGraph, stop_properties=None, edge_properties=None,
+                      highlight_nodes=(), highlight_edges=(), **layer_options) -> NetworkGeoJsonLayer:
+    """Adiciona a rede ao mapa como camada GeoJSON (network_feature_collections + NetworkGeoJsonLayer)."""
+    stops, segments = network_feature_collections(graph, stop_properties, edge_properties,
+                                                  highlight_nodes, highlight_edges)
+    layer = NetworkGeoJsonLayer(stops, segments, **layer_options)
+    layer.add_to(folium_map)
+    return layer
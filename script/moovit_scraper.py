@@ -10,6 +10,11 @@ class MoovitScraper:
     de ônibus do site Moovit.
     """
     BASE_URL = "https://moovitapp.com"
+    # Horários no formato "HH:MM" (ou "HHhMM") e frequências como "a cada 15 min" / "every 15 min"
+    _TIME_PATTERN = re.compile(r"\b([01]?\d|2[0-3])\s*[:h]\s*([0-5]\d)\b")
+    _HEADWAY_PATTERN = re.compile(r"(?:a cada|cada|every)\s+(\d{1,3})\s*min", re.IGNORECASE)
+    _WINDOW_PATTERN = re.compile(r"\b([01]?\d|2[0-3])[:h]([0-5]\d)\s*(?:-|–|—|às|a|to)\s*([01]?\d|2[0-3])[:h]([0-5]\d)\b")
+    _SCHEDULE_SELECTORS = ["[class*='schedule']", "[class*='timetable']", "[class*='departure']", "[class*='frequency']", "[class*='hours']"]
 
     def __init__(self, sleep_duration: float = 2.5, retries: int = 3, request_delay: int = 5):
         """
@@ -210,6 +215,29 @@ class MoovitScraper:
                 seen_identifiers.add(identifier_for_dedup)
         return final_lines_deduplicated
 
+    def _extract_direction_name(self, wrapper_div: Tag, line_url_ref: str, verbose: bool = True) -> str:
+        """
+        Extrai o nome da direção (sentido) do cabeçalho de um 'div.stops-wrapper'.
+        Retorna "Direção Desconhecida" se o cabeçalho não for encontrado.
+        """
+        header_div = wrapper_div.find("div", class_="stops-header")
+        current_direction_name = "Direção Desconhecida"
+        if header_div and isinstance(header_div, Tag):
+            h2_tag = header_div.find("h2")
+            if h2_tag and isinstance(h2_tag, Tag):
+                direction_text = h2_tag.get_text(strip=True)
+                if "Sentido: " in direction_text:
+                    current_direction_name = direction_text.split("Sentido: ", 1)[1].split("(", 1)[0].strip()
+                elif direction_text: # Fallback se "Sentido: " não estiver presente
+                    current_direction_name = direction_text.split("(", 1)[0].strip()
+                if verbose:
+                    print(f"    Processando direção: {current_direction_name}")
+            elif verbose:
+                print(f"      Tag H2 para o título da direção não encontrada em div.stops-header para {line_url_ref}")
+        elif verbose:
+            print(f"      Div de cabeçalho da direção (div.stops-header) não encontrado para {line_url_ref}.")
+        return current_direction_name
+
     def extract_stops_from_line_page(self, html_content: str,
                                      line_number_ref: str | None,
                                      line_name_ref: str | None,
@@ -246,21 +274,7 @@ class MoovitScraper:
             if not isinstance(wrapper_div, Tag):
                 continue
 
-            header_div = wrapper_div.find("div", class_="stops-header")
-            current_direction_name = "Direção Desconhecida"
-            if header_div and isinstance(header_div, Tag):
-                h2_tag = header_div.find("h2")
-                if h2_tag and isinstance(h2_tag, Tag):
-                    direction_text = h2_tag.get_text(strip=True)
-                    if "Sentido: " in direction_text:
-                        current_direction_name = direction_text.split("Sentido: ", 1)[1].split("(", 1)[0].strip()
-                    elif direction_text: # Fallback se "Sentido: " não estiver presente
-                        current_direction_name = direction_text.split("(", 1)[0].strip()
-                    print(f"    Processando direção: {current_direction_name}")
-                else:
-                    print(f"      Tag H2 para o título da direção não encontrada em div.stops-header para {line_url_ref}")
-            else:
-                print(f"      Div de cabeçalho da direção (div.stops-header) não encontrado para {line_url_ref}.")
+            current_direction_name = self._extract_direction_name(wrapper_div, line_url_ref)
 
             stops_list_ul = wrapper_div.select_one("ul[class*='stops-list']")
             if not stops_list_ul or not isinstance(stops_list_ul, Tag):
@@ -299,4 +313,78 @@ class MoovitScraper:
 
         if not stops_data and direction_wrappers: # Avisa se encontrou direções mas nenhuma parada
             print(f"  AVISO: Nenhuma parada individual extraída para a linha {line_number_ref or line_name_ref} em {line_url_ref}, apesar dos wrappers de direção estarem presentes.")
-        return stops_data 
\ No newline at end of file
+        return stops_data 
+
+    def extract_schedule_from_line_page(self, html_content: str,
+                                        line_number_ref: str | None,
+                                        line_url_ref: str) -> list[dict]:
+        """
+        Extrai horários de partida ou frequências (headways) de uma página de detalhes da linha,
+        quando a página os exibe. Procura blocos de horário dentro de cada 'div.stops-wrapper'
+        (associados à direção) e, se não houver, na página inteira (valendo para todos os sentidos).
+
+        Args:
+            html_content: O conteúdo HTML da página de detalhes da linha.
+            line_number_ref: O código/número da linha (ex: "E06").
+            line_url_ref: A URL da página da linha (para contexto em logs).
+
+        Returns:
+            Uma lista de dicionários com as chaves "numero_linha", "url_linha", "sentido"
+            (None = todos os sentidos), "tipo" ('partida' ou 'frequencia'), "horario"
+            (partidas), "inicio", "fim" e "intervalo_min" (frequências; "inicio"/"fim" são None
+            quando a página não informa a janela). Lista vazia se a página não expõe horários.
+        """
+        if not html_content:
+            return []
+
+        soup = BeautifulSoup(html_content, "html.parser")
+        schedule_data = []
+        for wrapper_div in soup.find_all("div", class_="stops-wrapper"):
+            if not isinstance(wrapper_div, Tag):
+                continue
+            direction_name = self._extract_direction_name(wrapper_div, line_url_ref, verbose=False)
+            schedule_data.extend(self._parse_schedule_blocks(wrapper_div, line_number_ref, line_url_ref, direction_name))
+
+        if not schedule_data:
+            schedule_data = self._parse_schedule_blocks(soup, line_number_ref, line_url_ref, None)
+
+        if schedule_data:
+            print(f"  Encontrados {len(schedule_data)} registros de horário para a linha {line_number_ref}.")
+        return schedule_data
+
+    def _parse_schedule_blocks(self, root: Tag, line_number_ref: str | None, line_url_ref: str,
+                               direction_name: str | None) -> list[dict]:
+        """Lê horários e frequências dos blocos de horário sob `root`."""
+        blocks = []
+        for selector in self._SCHEDULE_SELECTORS:
+            blocks.extend(b for b in root.select(selector) if not any(b in p.descendants for p in blocks))
+        records = []
+        seen = set()
+        base = {"numero_linha": line_number_ref, "url_linha": line_url_ref, "sentido": direction_name,
+                "horario": None, "inicio": None, "fim": None, "intervalo_min": None}
+        for block in blocks:
+            text = block.get_text(" ", strip=True)
+            headway = self._HEADWAY_PATTERN.search(text)
+            if headway:
+                # Frequência sem janela ("a cada 15 min"): inicio/fim vazios, e a janela de operação
+                # do dia é aplicada em connections.build_connections
+                window = self._WINDOW_PATTERN.search(text)
+                if window:
+                    h1, m1, h2, m2 = window.groups()
+                    key = ("frequencia", f"{int(h1):02d}:{m1}", f"{int(h2):02d}:{m2}", int(headway.group(1)))
+                    # Os horários da janela não são partidas
+                    text = text[:window.start()] + " " + text[window.end():]
+                else:
+                    key = ("frequencia", None, None, int(headway.group(1)))
+                    print(f"  Aviso: frequência de {key[3]} min sem horário de início/fim na linha "
+                          f"{line_number_ref} ({line_url_ref}); será usada a janela de operação padrão.")
+                if key not in seen:
+                    seen.add(key)
+                    records.append({**base, "tipo": "frequencia", "inicio": key[1], "fim": key[2],
+                                    "intervalo_min": key[3]})
+            for h, m in self._TIME_PATTERN.findall(text):
+                key = ("partida", f"{int(h):02d}:{m}")
+                if key not in seen:
+                    seen.add(key)
+                    records.append({**base, "tipo": "partida", "horario": key[1]})
+        return records
@@ -0,0 +1,276 @@
+"""
+Alocação de demanda origem-destino (OD) na rede de transporte.
+
+Lê um arquivo local de viagens (coordenadas de origem e destino com o número de viagens),
+ajusta todas as pontas à parada mais próxima em uma única consulta em lote à KD-tree das
+paradas (spatial_index.StopSpatialIndex.nearest_many) e aloca as viagens no caminho mínimo
+(tudo-ou-nada), acumulando o fluxo em cada aresta do grafo. Trechos mais longos que
+routing.MAX_PLAUSIBLE_SEGMENT_M (erros de geocodificação) ficam fora da rede roteável.
+
+As viagens são agregadas por par de paradas e roteadas por origem: uma única árvore de
+caminhos mínimos por parada de origem (scipy.sparse.csgraph.dijkstra) atende todos os seus
+destinos, e o fluxo de cada aresta da árvore é a demanda da subárvore abaixo dela (acumulada
+das folhas para a raiz). As origens são divididas em lotes distribuídos entre processos
+(routing.map_over_graph). Centenas de milhares de viagens são alocadas em segundos.
+"""
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+import graph_analysis
+import routing
+import spatial_index
+
+DEFAULT_MAX_SNAP_KM = 1.0
+OD_COLUMNS = ['lat_origem', 'lon_origem', 'lat_destino', 'lon_destino', 'viagens']
+# Nomes alternativos aceitos no arquivo de demanda
+OD_COLUMN_ALIASES = {
+    'origem_lat': 'lat_origem', 'origem_lon': 'lon_origem', 'destino_lat': 'lat_destino', 'destino_lon': 'lon_destino',
+    'o_lat': 'lat_origem', 'o_lon': 'lon_origem', 'd_lat': 'lat_destino', 'd_lon': 'lon_destino',
+    'origin_lat': 'lat_origem', 'origin_lon': 'lon_origem', 'dest_lat': 'lat_destino', 'dest_lon': 'lon_destino',
+    'trips': 'viagens', 'count': 'viagens',
+}
+SEGMENT_COLUMNS = ['de', 'para', 'viagens', 'distancia_km', 'passageiros_km', 'linhas']
+LINE_COLUMNS = ['linha', 'trechos', 'trechos_carregados', 'viagens_trecho_max', 'passageiros_km']
+MIN_EDGE_WEIGHT = 1e-9
+
+
+def load_od_demand(filepath: str) -> pd.DataFrame:
+    """
+    Carrega a demanda OD de um CSV local com as colunas OD_COLUMNS (ou aliases de
+    OD_COLUMN_ALIASES). Sem a coluna 'viagens', cada linha vale uma viagem. Linhas sem
+    coordenadas ou com viagens <= 0 são descartadas.
+    """
+    df = pd.read_csv(filepath)
+    df = df.rename(columns={k: v for k, v in OD_COLUMN_ALIASES.items() if k in df.columns and v not in df.columns})
+    if 'viagens' not in df.columns:
+        df['viagens'] = 1.0
+    faltando = [col for col in OD_COLUMNS if col not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes no arquivo de demanda: {faltando}")
+    df = df[OD_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    validas = df.notna().all(axis=1) & (df['viagens'] > 0)
+    if (~validas).any():
+        print(f"(Demanda OD) {int((~validas).sum())} linhas descartadas (coordenadas ausentes ou viagens <= 0).")
+    return df[validas].reset_index(drop=True)
+
+
+def snap_demand(graph: nx.DiGraph, demand: pd.DataFrame, max_snap_km: float = DEFAULT_MAX_SNAP_KM) -> pd.DataFrame:
+    """
+    Ajusta origens e destinos à parada mais próxima (consulta em lote à KD-tree do grafo).
+
+    Returns:
+        Cópia da demanda com 'parada_origem'/'parada_destino' (posição em
+        spatial_index.get_spatial_index(graph).nodes, -1 se não há parada a até `max_snap_km`)
+        e 'acesso_km'/'egresso_km' (distância do ponto até a parada).
+    """
+    index = spatial_index.get_spatial_index(graph)
+    result = demand.copy()
+    for ponta, lat_col, lon_col, dist_col in [('parada_origem', 'lat_origem', 'lon_origem', 'acesso_km'),
+                                              ('parada_destino', 'lat_destino', 'lon_destino', 'egresso_km')]:
+        positions, dist_km = index.nearest_many(result[lat_col].to_numpy(), result[lon_col].to_numpy(), workers=-1)
+        positions[dist_km > max_snap_km] = -1
+        result[ponta] = positions
+        result[dist_col] = dist_km
+    return result
+
+
+class AssignmentResult:
+    """
+    Resultado da alocação da demanda.
+
+    Atributos:
+        segments: DataFrame por trecho (SEGMENT_COLUMNS), do mais carregado para o menos.
+        lines: DataFrame por linha (LINE_COLUMNS), da maior para a menor carga em passageiros-km.
+            O fluxo de um trecho servido por várias linhas é dividido igualmente entre elas.
+        summary: dict com viagens totais, alocadas, sem parada próxima, na mesma parada e sem caminho,
+            e o número de trechos descartados por excederem max_segment_m.
+        graph: Grafo usado na alocação.
+    """
+
+    def __init__(self, graph: nx.DiGraph, segments: pd.DataFrame, lines: pd.DataFrame, summary: dict):
+        self.graph = graph
+        self.segments = segments
+        self.lines = lines
+        self.summary = summary
+
+    def path_details(self, origin, destination, weight: str = 'weight') -> list[dict]:
+        """Trechos do caminho alocado entre duas paradas (graph_analysis.get_path_details)."""
+        try:
+            _, path = routing.dijkstra_path(self.graph, origin, destination, weight=weight)
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
+            return []
+        return graph_analysis.get_path_details(self.graph, path)
+
+    def add_to_map(self, folium_map, name: str = "Carregamento da demanda OD", color: str = "crimson",
+                   max_weight: float = 12.0):
+        """Adiciona os trechos carregados como camada do mapa Folium (espessura proporcional às viagens)."""
+        import folium
+        layer = folium.FeatureGroup(name=name)
+        carregados = self.segments[self.segments['viagens'] > 0]
+        maximo = float(carregados['viagens'].max()) if not carregados.empty else 1.0
+        for trecho in carregados.itertuples(index=False):
+            de, para = self.graph.nodes[trecho.de], self.graph.nodes[trecho.para]
+            folium.PolyLine(locations=[[de['latitude'], de['longitude']], [para['latitude'], para['longitude']]],
+                            color=color, weight=max(1.0, max_weight * trecho.viagens / maximo), opacity=0.7,
+                            tooltip=f"{trecho.de} -> {trecho.para}: {trecho.viagens:.0f} viagens ({trecho.linhas})"
+                            ).add_to(layer)
+        layer.add_to(folium_map)
+        return folium_map
+
+    def print_summary(self):
+        """Imprime o resumo da alocação em formato legível."""
+        s = self.summary
+        print(f"(Demanda OD) {s['viagens_total']:.0f} viagens: {s['viagens_alocadas']:.0f} alocadas, "
+              f"{s['viagens_sem_parada']:.0f} sem parada a até {s['max_snap_km']} km, "
+              f"{s['viagens_mesma_parada']:.0f} com origem e destino na mesma parada, "
+              f"{s['viagens_sem_caminho']:.0f} sem caminho na rede.")
+        print(f"(Demanda OD) {s['passageiros_km']:.0f} passageiros-km em {s['trechos_carregados']} trechos "
+              f"({s['pares_od']} pares de paradas, {s['origens']} árvores de caminhos mínimos).")
+        if s['trechos_descartados']:
+            print(f"(Demanda OD) {s['trechos_descartados']} trechos acima de {s['max_segment_m']:.0f} m "
+                  f"descartados (erro de geocodificação).")
+
+
+def _edge_arrays(graph: nx.DiGraph, nodes: list, weight: str,
+                 max_segment_m: float | None = None) -> tuple[sparse.csr_matrix, np.ndarray, list, int]:
+    """
+    Matriz de adjacência, chaves ordenadas das arestas (u * n + v), lista das arestas na mesma
+    ordem e número de arestas descartadas por serem mais longas que `max_segment_m` (distância
+    em linha reta entre as paradas; None não descarta nenhuma).
+    """
+    position = {node: i for i, node in enumerate(nodes)}
+    n = len(nodes)
+    edges = [(u, v) for u, v in graph.edges if u != v]
+    descartadas = 0
+    if max_segment_m is not None and edges:
+        coords = np.array([(graph.nodes[u]['latitude'], graph.nodes[u]['longitude'],
+                            graph.nodes[v]['latitude'], graph.nodes[v]['longitude']) for u, v in edges], dtype=float)
+        plausivel = ~(routing.haversine_km(*coords.T) * 1000.0 > max_segment_m)
+        descartadas = int((~plausivel).sum())
+        edges = [edge for edge, ok in zip(edges, plausivel.tolist()) if ok]
+    sources = np.array([position[u] for u, _ in edges], dtype=np.int64)
+    targets = np.array([position[v] for _, v in edges], dtype=np.int64)
+    weights = np.array([max(float(graph[u][v].get(weight, 1.0)), MIN_EDGE_WEIGHT) for u, v in edges])
+    keys = sources * n + targets
+    order = np.argsort(keys, kind='stable')
+    matrix = sparse.csr_matrix((weights, (sources, targets)), shape=(n, n))
+    return matrix, keys[order], [edges[i] for i in order], descartadas
+
+
+def _assign_batch(_graph, batch: list[tuple[int, np.ndarray, np.ndarray]], context) -> tuple[np.ndarray, float]:
+    """
+    Aloca a demanda de um lote de origens (tarefa de routing.map_over_graph).
+    Cada item do lote é (origem, destinos, viagens). Retorna (fluxo por aresta, viagens sem caminho).
+    """
+    matrix, edge_keys = context
+    n = matrix.shape[0]
+    flows = np.zeros(len(edge_keys))
+    unreachable = 0.0
+    origins = np.array([origin for origin, _, _ in batch], dtype=np.int64)
+    dist, pred = dijkstra(matrix, directed=True, indices=origins, return_predecessors=True)
+    for row, (origin, destinations, trips) in enumerate(batch):
+        reachable = np.isfinite(dist[row, destinations])
+        unreachable += float(trips[~reachable].sum())
+        # Demanda em cada nó; acumulada das folhas para a raiz (ordem decrescente de distância)
+        load = np.zeros(n)
+        np.add.at(load, destinations[reachable], trips[reachable])
+        order = np.argsort(-dist[row], kind='stable')
+        order = order[np.isfinite(dist[row, order]) & (order != origin)]
+        parents = pred[row, order]
+        for node, parent in zip(order.tolist(), parents.tolist()):
+            load[parent] += load[node]
+        carregados = load[order] > 0
+        keys = parents[carregados].astype(np.int64) * n + order[carregados]
+        np.add.at(flows, np.searchsorted(edge_keys, keys), load[order][carregados])
+    return flows, unreachable
+
+
+def assign_demand(graph: nx.DiGraph, demand: pd.DataFrame, weight: str = 'weight',
+                  max_snap_km: float = DEFAULT_MAX_SNAP_KM, batch_size: int = 32,
+                  processes: int | None = None, write_to_graph: bool = False,
+                  max_segment_m: float | None = routing.MAX_PLAUSIBLE_SEGMENT_M) -> AssignmentResult:
+    """
+    Aloca as viagens no caminho mínimo entre as paradas mais próximas da origem e do destino.
+
+    Args:
+        graph: Grafo de transporte (create_transport_graph / stop_data.build_graph).
+        demand: Demanda de load_od_demand (OD_COLUMNS).
+        weight: Atributo de peso das arestas.
+        max_snap_km: Distância máxima do ponto até a parada; viagens mais distantes não são alocadas.
+        batch_size: Origens por tarefa (cada tarefa calcula as árvores do lote de uma vez).
+        processes: Número de processos. None usa os.cpu_count(); 1 executa no processo atual.
+        write_to_graph: Grava o fluxo de cada aresta no atributo 'viagens_od' do grafo.
+        max_segment_m: Trechos mais longos (em metros, entre as coordenadas das paradas) são erros
+            de geocodificação e não recebem demanda; ficam fora de `segments`. None usa todos.
+
+    Returns:
+        AssignmentResult com as cargas por trecho e por linha.
+    """
+    snapped = snap_demand(graph, demand, max_snap_km)
+    index_nodes = spatial_index.get_spatial_index(graph).nodes
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    to_graph = np.array([position[node] for node in index_nodes] + [-1], dtype=np.int64)  # -1 -> -1
+    origem = to_graph[snapped['parada_origem'].to_numpy()]
+    destino = to_graph[snapped['parada_destino'].to_numpy()]
+    trips = snapped['viagens'].to_numpy(dtype=float)
+
+    sem_parada = (origem < 0) | (destino < 0)
+    mesma = ~sem_parada & (origem == destino)
+    valid = ~sem_parada & ~mesma
+
+    # Agrega por par de paradas e agrupa por origem
+    pares = (pd.DataFrame({'o': origem[valid], 'd': destino[valid], 'viagens': trips[valid]})
+             .groupby(['o', 'd'], sort=True)['viagens'].sum().reset_index())
+    por_origem = [(int(o), g['d'].to_numpy(dtype=np.int64), g['viagens'].to_numpy(dtype=float))
+                  for o, g in pares.groupby('o', sort=True)]
+    batches = [por_origem[i:i + batch_size] for i in range(0, len(por_origem), batch_size)]
+
+    matrix, edge_keys, edges, descartados = _edge_arrays(graph, nodes, weight, max_segment_m)
+    results = routing.map_over_graph(None, _assign_batch, batches, context=(matrix, edge_keys),
+                                     processes=processes, min_items_per_process=2)
+    flows = np.sum([f for f, _ in results], axis=0) if results else np.zeros(len(edges))
+    sem_caminho = float(sum(u for _, u in results))
+
+    km = np.array([float(graph[u][v].get('weight', np.nan)) for u, v in edges])
+    linhas = [[l for l in routing.edge_lines(graph[u][v]) if l is not None] for u, v in edges]
+    segments = pd.DataFrame({
+        'de': [u for u, _ in edges], 'para': [v for _, v in edges], 'viagens': flows,
+        'distancia_km': km, 'passageiros_km': flows * km,
+        'linhas': [", ".join(str(l) for l in ls) for ls in linhas],
+    }, columns=SEGMENT_COLUMNS)
+    if write_to_graph:
+        for (u, v), flow in zip(edges, flows.tolist()):
+            graph[u][v]['viagens_od'] = flow
+
+    # Carga por linha: fluxo de cada trecho dividido igualmente entre as linhas que o servem
+    por_linha = pd.DataFrame({
+        'linha': [str(l) for ls in linhas for l in ls],
+        'viagens': np.repeat(flows / np.maximum([len(ls) for ls in linhas], 1), [len(ls) for ls in linhas]),
+        'passageiros_km': np.repeat(flows * km / np.maximum([len(ls) for ls in linhas], 1), [len(ls) for ls in linhas]),
+    })
+    lines = (por_linha.groupby('linha', sort=True)
+             .agg(trechos=('viagens', 'size'), trechos_carregados=('viagens', lambda v: int((v > 0).sum())),
+                  viagens_trecho_max=('viagens', 'max'), passageiros_km=('passageiros_km', 'sum'))
+             .reset_index()
+             .sort_values(by='passageiros_km', ascending=False, kind='stable').reset_index(drop=True))
+
+    summary = {
+        'viagens_total': float(trips.sum()),
+        'viagens_alocadas': float(trips[valid].sum()) - sem_caminho,
+        'viagens_sem_parada': float(trips[sem_parada].sum()),
+        'viagens_mesma_parada': float(trips[mesma].sum()),
+        'viagens_sem_caminho': sem_caminho,
+        'passageiros_km': float(np.nansum(flows * km)),
+        'trechos_carregados': int((flows > 0).sum()),
+        'trechos_descartados': descartados,
+        'max_segment_m': max_segment_m,
+        'pares_od': len(pares),
+        'origens': len(por_origem),
+        'max_snap_km': max_snap_km,
+    }
+    segments = segments.sort_values(by='viagens', ascending=False, kind='stable').reset_index(drop=True)
+    return AssignmentResult(graph, segments, lines[LINE_COLUMNS], summary)
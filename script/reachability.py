@@ -0,0 +1,134 @@
+"""
+Índice de alcançabilidade da rede de transporte.
+
+Construído uma vez no carregamento do grafo, permite responder "existe caminho de u
+para v?" em tempo constante, sem executar nenhuma busca. Com isso, pares sem caminho
+são rejeitados antes do Dijkstra (que, nesse caso, exploraria todo o conjunto
+alcançável antes de desistir).
+
+Estrutura:
+    - Componentes fortemente conexas (CFCs): dentro de uma CFC, todos alcançam todos.
+    - DAG de condensação: um vértice por CFC, numerados em ordem topológica, de modo
+      que toda aresta vai de um número menor para um maior.
+    - Fecho transitivo compacto: para cada CFC c, um bitset (int do Python) das CFCs
+      alcançáveis, deslocado de c bits (só números >= c podem ser alcançados).
+"""
+import weakref
+
+import networkx as nx
+
+import routing
+
+
+class ReachabilityIndex:
+    """
+    Índice de alcançabilidade baseado na condensação em CFCs.
+
+    Atributos:
+        component: dict nó -> número da CFC (em ordem topológica da condensação).
+        members: lista de conjuntos de nós, um por CFC.
+        condensation: DAG de condensação (networkx.DiGraph) com nós 0..C-1.
+    """
+
+    def __init__(self, graph: nx.DiGraph):
+        sccs = list(nx.strongly_connected_components(graph))
+        dag = nx.condensation(graph, scc=sccs)
+
+        # Renumera as CFCs em ordem topológica: arestas sempre de menor para maior
+        topo = list(nx.topological_sort(dag))
+        renumber = {old: new for new, old in enumerate(topo)}
+        self.members = [set(dag.nodes[old]['members']) for old in topo]
+        self.condensation = nx.relabel_nodes(dag, renumber, copy=True)
+        self.component = {node: c for c, nodes in enumerate(self.members) for node in nodes}
+        self.num_nodes = graph.number_of_nodes()
+        self.state = routing.graph_state(graph)
+
+        # Fecho transitivo em ordem topológica reversa: reach[c] tem o bit (d - c) ligado
+        # para cada CFC d alcançável a partir de c (incluindo a própria c).
+        self._reach = [0] * len(topo)
+        for c in range(len(topo) - 1, -1, -1):
+            bits = 1
+            for d in self.condensation.successors(c):
+                bits |= self._reach[d] << (d - c)
+            self._reach[c] = bits
+
+    def can_reach(self, source, target) -> bool:
+        """True se existe caminho de `source` para `target`. Nós fora do índice retornam False."""
+        cs = self.component.get(source)
+        ct = self.component.get(target)
+        if cs is None or ct is None:
+            return False
+        if ct < cs:  # ordem topológica: impossível voltar
+            return False
+        return bool((self._reach[cs] >> (ct - cs)) & 1)
+
+    def reachable_count(self, source) -> int:
+        """Quantidade de nós alcançáveis a partir de `source` (incluindo ele próprio)."""
+        cs = self.component[source]
+        bits = self._reach[cs]
+        total = 0
+        offset = 0
+        while bits:
+            if bits & 1:
+                total += len(self.members[cs + offset])
+            bits >>= 1
+            offset += 1
+        return total
+
+    def summary(self) -> dict:
+        """Estrutura de componentes da rede."""
+        sizes = sorted((len(m) for m in self.members), reverse=True)
+        return {
+            'nos': self.num_nodes,
+            'cfcs': len(self.members),
+            'maior_cfc': sizes[0] if sizes else 0,
+            'cfcs_unitarias': sum(1 for s in sizes if s == 1),
+            'componentes_fracas': nx.number_weakly_connected_components(self.condensation) if sizes else 0,
+            'cfcs_fonte': sum(1 for c in self.condensation if self.condensation.in_degree(c) == 0),
+            'cfcs_sumidouro': sum(1 for c in self.condensation if self.condensation.out_degree(c) == 0),
+            'bytes_fecho': sum((bits.bit_length() + 7) // 8 for bits in self._reach),
+        }
+
+    def print_summary(self):
+        """Imprime a estrutura de componentes em formato legível."""
+        s = self.summary()
+        print(f"(Alcançabilidade) {s['nos']} nós em {s['cfcs']} componentes fortemente conexas "
+              f"(maior: {s['maior_cfc']} nós; {s['cfcs_unitarias']} unitárias).")
+        print(f"(Alcançabilidade) Componentes fracamente conexas: {s['componentes_fracas']}. "
+              f"CFCs sem entrada: {s['cfcs_fonte']}, sem saída: {s['cfcs_sumidouro']}. "
+              f"Fecho transitivo: {s['bytes_fecho']} bytes.")
+
+
+# Índices associados a objetos de grafo específicos. Subgrafos/cópias são objetos
+# diferentes e, portanto, nunca herdam um índice desatualizado.
+_attached_indexes: "weakref.WeakKeyDictionary[nx.DiGraph, ReachabilityIndex]" = weakref.WeakKeyDictionary()
+
+
+def attach_index(graph: nx.DiGraph) -> ReachabilityIndex:
+    """Constrói o índice do grafo (no carregamento) e o associa ao objeto do grafo."""
+    index = ReachabilityIndex(graph)
+    _attached_indexes[graph] = index
+    return index
+
+
+def get_attached_index(graph: nx.DiGraph) -> ReachabilityIndex | None:
+    """
+    Índice associado ao grafo, ou None se não houver ou se o grafo mudou desde a construção
+    (versão, número de nós ou de arestas diferentes; ver routing.graph_state).
+    """
+    index = _attached_indexes.get(graph)
+    if index is not None and index.state != routing.graph_state(graph):
+        return None
+    return index
+
+
+def detach_index(graph: nx.DiGraph):
+    """Descarta o índice do grafo (ex.: após alterar suas arestas)."""
+    _attached_indexes.pop(graph, None)
+
+
+def refresh_index(graph: nx.DiGraph) -> ReachabilityIndex | None:
+    """Reconstrói o índice se o grafo tiver um associado (ex.: após uma atualização incremental)."""
+    if graph not in _attached_indexes:
+        return None
+    return attach_index(graph)
@@ -0,0 +1,167 @@
+"""
+Regiões nomeadas (polígonos GeoJSON) e atribuição das paradas às regiões.
+
+Substitui o retângulo fixo de Itaipuaçu: cada arquivo .geojson de um diretório (ou um arquivo
+avulso) define uma ou mais regiões, uma por feição Polygon/MultiPolygon. O nome vem da
+propriedade 'nome' (ou 'name') da feição, ou do nome do arquivo.
+
+Todas as paradas são atribuídas a todas as regiões que as contêm em uma única consulta
+vetorizada a uma STRtree dos polígonos (shapely.STRtree.query com predicado 'intersects':
+paradas sobre o limite contam como dentro). Uma parada pode pertencer a várias regiões.
+"""
+import json
+import os
+import re
+import unicodedata
+
+import networkx as nx
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+import routing
+import tile_store
+
+GEOJSON_EXTENSIONS = ('.geojson', '.json')
+
+
+def slugify(name: str) -> str:
+    """Identificador da região para nomes de arquivo: sem acentos, minúsculas, '_' no lugar de separadores."""
+    texto = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r"[^a-z0-9]+", "_", texto).strip("_") or "regiao"
+
+
+class Region:
+    """
+    Região nomeada.
+
+    Atributos:
+        name: Nome da região.
+        slug: Identificador para nomes de arquivo (slugify(name)).
+        geometry: Polígono (shapely, coordenadas lon/lat).
+        properties: Propriedades da feição GeoJSON.
+    """
+
+    def __init__(self, name: str, geometry, properties: dict | None = None):
+        self.name = name
+        self.slug = slugify(name)
+        self.geometry = geometry
+        self.properties = properties or {}
+
+    @property
+    def bounds(self) -> tuple[float, float, float, float]:
+        """Retângulo envolvente no formato do projeto: (lat_min, lat_max, lon_min, lon_max)."""
+        lon_min, lat_min, lon_max, lat_max = self.geometry.bounds
+        return lat_min, lat_max, lon_min, lon_max
+
+    @classmethod
+    def from_bounds(cls, name: str, bounds: tuple[float, float, float, float]) -> "Region":
+        """Região retangular a partir de (lat_min, lat_max, lon_min, lon_max)."""
+        lat_min, lat_max, lon_min, lon_max = bounds
+        return cls(name, shapely.box(lon_min, lat_min, lon_max, lat_max))
+
+    def __repr__(self) -> str:
+        return f"Region({self.name!r})"
+
+
+def _regions_from_geojson(path: str) -> list[Region]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    tipo = data.get('type')
+    if tipo == 'FeatureCollection':
+        features = data.get('features') or []
+    elif tipo == 'Feature':
+        features = [data]
+    elif tipo in ('Polygon', 'MultiPolygon'):
+        features = [{'geometry': data, 'properties': {}}]
+    else:
+        features = []
+    stem = os.path.splitext(os.path.basename(path))[0]
+    regions = []
+    for i, feature in enumerate(features):
+        geometry = shape(feature['geometry']) if feature.get('geometry') else None
+        if geometry is None or geometry.geom_type not in ('Polygon', 'MultiPolygon') or geometry.is_empty:
+            continue
+        properties = feature.get('properties') or {}
+        name = properties.get('nome') or properties.get('name') or (stem if len(features) == 1 else f"{stem}_{i + 1}")
+        regions.append(Region(str(name), shapely.make_valid(geometry), properties))
+    return regions
+
+
+def load_regions(path: str) -> list[Region]:
+    """
+    Carrega as regiões de um arquivo GeoJSON ou de todos os arquivos GeoJSON de um diretório
+    (em ordem alfabética). Feições sem polígono são ignoradas; arquivos ilegíveis são informados
+    e ignorados.
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(GEOJSON_EXTENSIONS))
+    elif os.path.exists(path):
+        paths = [path]
+    else:
+        print(f"(Regiões) '{path}' não encontrado.")
+        return []
+    regions = []
+    for file_path in paths:
+        try:
+            regions.extend(_regions_from_geojson(file_path))
+        except (OSError, ValueError, shapely.errors.GEOSException) as e:
+            print(f"(Regiões) Erro ao ler '{file_path}': {e}.")
+    nomes = [r.slug for r in regions]
+    repetidos = sorted({n for n in nomes if nomes.count(n) > 1})
+    if repetidos:
+        print(f"(Regiões) Atenção: regiões com o mesmo identificador: {repetidos}.")
+    return regions
+
+
+def assign_regions(latitudes, longitudes, regions: list[Region]) -> np.ndarray:
+    """
+    Pertinência de cada ponto a cada região, em uma única consulta à STRtree dos polígonos.
+
+    Returns:
+        Array booleano (pontos x regiões). Pontos sem coordenada não pertencem a nenhuma região.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    membership = np.zeros((len(latitudes), len(regions)), dtype=bool)
+    valid = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+    if not regions or not len(valid):
+        return membership
+    tree = shapely.STRtree([r.geometry for r in regions])
+    points, polygons = tree.query(shapely.points(longitudes[valid], latitudes[valid]), predicate='intersects')
+    membership[valid[points], polygons] = True
+    return membership
+
+
+def region_subgraphs(graph: nx.DiGraph, regions: list[Region], include_boundary: bool = False) -> dict[str, nx.DiGraph]:
+    """
+    Subgrafo de cada região (nome -> grafo), com uma única atribuição vetorizada de todas as
+    paradas do grafo. Os subgrafos têm versão própria (tile_store.restrict_graph); com
+    `include_boundary`, as arestas que saem da região são mantidas, com as paradas externas
+    marcadas com 'borda' = True.
+    """
+    coords = routing.get_coordinate_index(graph)
+    membership = assign_regions(coords.latitudes, coords.longitudes, regions)
+    subgraphs = {}
+    for j, region in enumerate(regions):
+        nodes = [coords.nodes[i] for i in np.flatnonzero(membership[:, j]).tolist()]
+        subgraphs[region.name] = tile_store.restrict_graph(graph, nodes, f"poligono={region.slug}|{region.geometry.wkb_hex}",
+                                                           include_boundary)
+    return subgraphs
+
+
+def load_region_subgraphs(tiles: tile_store.TiledGraphStore, key: str, regions: list[Region],
+                          include_boundary: bool = False) -> dict[str, nx.DiGraph] | None:
+    """
+    Subgrafo de cada região lido do grafo particionado da versão `key`: para cada região, só os
+    ladrilhos que cruzam region.bounds (TiledGraphStore.load_tiles), seguidos do mesmo teste de
+    polígono de region_subgraphs. O resultado (paradas, arestas e versão) é igual ao de
+    region_subgraphs sobre o grafo completo. Retorna None se a versão não foi particionada.
+    """
+    subgraphs = {}
+    for region in regions:
+        G = tiles.load_tiles(key, region.bounds)
+        if G is None:
+            return None
+        subgraphs.update(region_subgraphs(G, [region], include_boundary))
+    return subgraphs
@@ -0,0 +1,233 @@
+"""
+Simulação de robustez da rede: impacto do fechamento de paradas e trechos.
+
+Para planejamento de contingência (obras, alagamentos), cada cenário remove paradas e/ou
+trechos do grafo e mede o que se perde:
+    - alcançabilidade: pares (origem, destino) de paradas remanescentes que deixam de ter caminho;
+    - custo: aumento do custo médio dos caminhos mínimos entre os pares que continuam conectados.
+
+A matriz de distâncias de todos os pares é calculada uma vez (scipy.sparse.csgraph.dijkstra,
+com a árvore de predecessores de cada origem). Em cada cenário só são recalculadas as origens
+cuja árvore de caminhos mínimos usa uma aresta ou parada removida; para as demais, as
+distâncias não mudam. Os cenários são distribuídos entre processos (routing.map_over_graph) e
+os aleatórios usam sementes determinísticas (mesmo resultado em qualquer execução).
+"""
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+
+import routing
+from gap_detection import street_key
+
+# Peso mínimo das arestas na matriz esparsa (pesos zero seriam confundidos com ausência de aresta)
+MIN_EDGE_WEIGHT = 1e-9
+SCENARIO_KINDS = ('parada', 'trecho', 'via', 'paradas_aleatorias', 'trechos_aleatorios')
+CRITICALITY_COLUMNS = ['posicao', 'tipo', 'descricao', 'paradas_removidas', 'arestas_removidas',
+                       'pares_alcancaveis', 'pares_perdidos', 'fracao_pares_perdidos',
+                       'custo_medio', 'aumento_custo_medio', 'origens_recalculadas']
+
+
+class BaselineDistances:
+    """
+    Distâncias de todos os pares do grafo intacto.
+
+    Atributos:
+        nodes: Lista de nós (a posição é o índice nas matrizes).
+        position: dict nó -> posição.
+        edge_sources, edge_targets, edge_weights: Arestas em arrays (posições de origem/destino e peso).
+        matrix: Matriz esparsa (CSR) de adjacência com os pesos.
+        distances: Array (n x n) com o custo mínimo entre cada par (inf se inalcançável).
+        predecessors: Array (n x n) com o predecessor de cada nó na árvore de cada origem (-9999 se nenhum).
+        row_pairs, row_cost: Por origem, destinos alcançáveis e soma dos custos até eles.
+        reachable_pairs: Pares (origem != destino) com caminho.
+    """
+
+    def __init__(self, graph: nx.DiGraph, weight: str = 'weight'):
+        self.nodes = list(graph.nodes)
+        self.position = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+        rows, cols, data = [], [], []
+        for u, v, attrs in graph.edges(data=True):
+            if u == v:
+                continue
+            rows.append(self.position[u])
+            cols.append(self.position[v])
+            data.append(max(float(attrs.get(weight, 1.0)), MIN_EDGE_WEIGHT))
+        self.edge_sources = np.array(rows, dtype=np.int64)
+        self.edge_targets = np.array(cols, dtype=np.int64)
+        self.edge_weights = np.array(data, dtype=float)
+        self.matrix = sparse.csr_matrix((self.edge_weights, (self.edge_sources, self.edge_targets)), shape=(n, n))
+        self.distances, self.predecessors = dijkstra(self.matrix, directed=True, return_predecessors=True)
+        finite = np.isfinite(self.distances)
+        np.fill_diagonal(finite, False)
+        # Totais por origem (pares alcançáveis e soma dos custos), atualizados incrementalmente nos cenários
+        self.row_pairs = finite.sum(axis=1)
+        self.row_cost = np.where(finite, self.distances, 0.0).sum(axis=1)
+        self.reachable_pairs = int(self.row_pairs.sum())
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def _scenario(tipo: str, descricao: str, nodes=(), edges=()) -> dict:
+    return {'tipo': tipo, 'descricao': descricao, 'nos': tuple(nodes), 'arestas': tuple(edges)}
+
+
+def _segment_edges(graph: nx.DiGraph, u, v) -> list[tuple]:
+    """Arestas de um trecho: (u, v) e, se existir, o sentido contrário (a via é fechada nos dois sentidos)."""
+    return [(u, v)] + ([(v, u)] if graph.has_edge(v, u) else [])
+
+
+def stop_scenarios(graph: nx.DiGraph, nodes: list | None = None) -> list[dict]:
+    """Um cenário por parada removida (todas as paradas do grafo, por padrão)."""
+    return [_scenario('parada', str(node), nodes=[node]) for node in (graph.nodes if nodes is None else nodes)]
+
+
+def segment_scenarios(graph: nx.DiGraph) -> list[dict]:
+    """Um cenário por trecho fechado (par de paradas vizinhas, nos dois sentidos)."""
+    scenarios, vistos = [], set()
+    for u, v in graph.edges:
+        if u == v or (v, u) in vistos:
+            continue
+        vistos.add((u, v))
+        seta = "<->" if graph.has_edge(v, u) else "->"
+        scenarios.append(_scenario('trecho', f"{u} {seta} {v}", edges=_segment_edges(graph, u, v)))
+    return scenarios
+
+
+def street_scenario(graph: nx.DiGraph, street: str) -> dict | None:
+    """
+    Fechamento de uma via inteira (ex.: "Rodovia Amaral Peixoto"): remove as paradas cujo nome
+    pertence à via (mesma chave de gap_detection.street_key). None se nenhuma parada for encontrada.
+    """
+    chave = street_key(street)
+    nodes = [node for node in graph.nodes if isinstance(node, str) and street_key(node) == chave]
+    if not nodes:
+        return None
+    return _scenario('via', street, nodes=nodes)
+
+
+def random_scenarios(graph: nx.DiGraph, n_scenarios: int, k: int, kind: str = 'paradas_aleatorias',
+                     seed: int = 42) -> list[dict]:
+    """
+    Cenários com `k` paradas ('paradas_aleatorias') ou `k` trechos ('trechos_aleatorios')
+    sorteados. O cenário i usa o gerador np.random.default_rng([seed, i]): os mesmos cenários
+    em qualquer execução, independentemente da ordem ou do número de processos.
+    """
+    if kind == 'paradas_aleatorias':
+        population = list(graph.nodes)
+    elif kind == 'trechos_aleatorios':
+        population = [s['arestas'] for s in segment_scenarios(graph)]
+    else:
+        raise ValueError(f"kind deve ser 'paradas_aleatorias' ou 'trechos_aleatorios', não '{kind}'.")
+    k = min(k, len(population))
+    scenarios = []
+    for i in range(n_scenarios):
+        chosen = np.random.default_rng([seed, i]).choice(len(population), size=k, replace=False)
+        if kind == 'paradas_aleatorias':
+            scenarios.append(_scenario(kind, f"sorteio {i} (semente {seed})", nodes=[population[j] for j in chosen]))
+        else:
+            edges = [edge for j in chosen for edge in population[j]]
+            scenarios.append(_scenario(kind, f"sorteio {i} (semente {seed})", edges=edges))
+    return scenarios
+
+
+def _evaluate_scenario(_graph, scenario: dict, base: BaselineDistances) -> dict:
+    """
+    Mede um cenário recalculando só as origens afetadas (tarefa de routing.map_over_graph).
+    Uma origem é afetada se sua árvore de caminhos mínimos usa uma aresta removida ou passa
+    por uma parada removida; nas demais, a árvore continua válida e as distâncias não mudam.
+    """
+    n = len(base)
+    removed = np.array([base.position[node] for node in scenario['nos'] if node in base.position], dtype=np.int64)
+    edges = [(base.position[u], base.position[v]) for u, v in scenario['arestas']
+             if u in base.position and v in base.position]
+
+    # Arestas mantidas: sem as removidas e sem as que tocam paradas removidas
+    keep = ~(np.isin(base.edge_sources, removed) | np.isin(base.edge_targets, removed))
+    affected = np.zeros(n, dtype=bool)
+    for i, j in edges:
+        keep &= ~((base.edge_sources == i) & (base.edge_targets == j))
+        affected |= base.predecessors[:, j] == i
+    if len(removed):
+        affected |= np.isin(base.predecessors, removed).any(axis=1)
+    alive = np.ones(n, dtype=bool)
+    alive[removed] = False
+    affected &= alive
+
+    # Origens não afetadas: totais do grafo intacto, sem as colunas das paradas removidas
+    intact = alive & ~affected
+    removed_d = base.distances[np.ix_(intact, removed)]
+    removed_finite = np.isfinite(removed_d)
+    pairs = int(base.row_pairs[intact].sum() - removed_finite.sum())
+    cost = float(base.row_cost[intact].sum() - removed_d[removed_finite].sum())
+    base_cost, lost = cost, 0
+
+    # Origens afetadas: uma busca por origem no grafo sem as arestas/paradas removidas
+    sources = np.flatnonzero(affected)
+    if len(sources):
+        matrix = sparse.csr_matrix((base.edge_weights[keep], (base.edge_sources[keep], base.edge_targets[keep])),
+                                   shape=(n, n))
+        new_d = dijkstra(matrix, directed=True, indices=sources)
+        old_d = base.distances[sources]
+        # Diagonal e colunas das paradas removidas ficam fora da contagem (inf nas duas matrizes)
+        for d in (new_d, old_d):
+            d[np.arange(len(sources)), sources] = np.inf
+            d[:, removed] = np.inf
+        connected = np.isfinite(new_d)
+        n_connected = int(connected.sum())
+        pairs += n_connected
+        cost += float(new_d.sum(where=connected))
+        base_cost += float(old_d.sum(where=connected))
+        lost = int(np.isfinite(old_d).sum()) - n_connected  # remover só aumenta distâncias
+
+    return {
+        'tipo': scenario['tipo'],
+        'descricao': scenario['descricao'],
+        'paradas_removidas': len(removed),
+        'arestas_removidas': len(edges),
+        'pares_alcancaveis': pairs,
+        'pares_perdidos': lost,
+        'fracao_pares_perdidos': lost / max(base.reachable_pairs, 1),
+        'custo_medio': cost / pairs if pairs else float('nan'),
+        'aumento_custo_medio': cost / base_cost - 1.0 if base_cost > 0 else 0.0,
+        'origens_recalculadas': len(sources),
+    }
+
+
+def simulate(graph: nx.DiGraph, scenarios: list[dict], weight: str = 'weight',
+             baseline: BaselineDistances | None = None, processes: int | None = None,
+             min_scenarios_per_process: int = 16) -> pd.DataFrame:
+    """
+    Avalia os cenários em paralelo e devolve a tabela de criticidade, do cenário mais
+    prejudicial para o menos (pares perdidos e, em seguida, aumento do custo médio).
+
+    Args:
+        graph: Grafo de transporte (não é alterado).
+        scenarios: Cenários de stop_scenarios, segment_scenarios, street_scenario, random_scenarios.
+        weight: Atributo de peso das arestas.
+        baseline: Distâncias do grafo intacto já calculadas (reutilizadas entre chamadas).
+        processes: Número de processos. None usa os.cpu_count(); 1 executa no processo atual.
+        min_scenarios_per_process: Abaixo deste número de cenários por processo, roda serialmente.
+
+    Returns:
+        DataFrame com CRITICALITY_COLUMNS.
+    """
+    base = baseline if baseline is not None else BaselineDistances(graph, weight)
+    rows = routing.map_over_graph(None, _evaluate_scenario, scenarios, context=base, processes=processes,
+                                  min_items_per_process=min_scenarios_per_process)
+    if not rows:
+        return pd.DataFrame(columns=CRITICALITY_COLUMNS)
+    table = pd.DataFrame(rows).sort_values(by=['pares_perdidos', 'aumento_custo_medio'],
+                                           ascending=False, kind='stable').reset_index(drop=True)
+    table.insert(0, 'posicao', np.arange(1, len(table) + 1))
+    return table[CRITICALITY_COLUMNS]
+
+
+def rank_criticality(graph: nx.DiGraph, weight: str = 'weight', include_stops: bool = True,
+                     include_segments: bool = True, processes: int | None = None) -> pd.DataFrame:
+    """Tabela de criticidade de todas as paradas e/ou todos os trechos, um de cada vez."""
+    scenarios = (stop_scenarios(graph) if include_stops else []) + (segment_scenarios(graph) if include_segments else [])
+    return simulate(graph, scenarios, weight=weight, processes=processes)
@@ -0,0 +1,193 @@
+"""
+Cache de resultados de rotas com descarte LRU.
+
+Consultas repetidas para pares populares (terminais, Centro) refazem a mesma busca a cada
+chamada. O RouteCache fica na frente de graph_analysis.find_shortest_path_dijkstra e
+get_path_details e guarda:
+    - pares (origem, destino) -> (custo, caminho) ou a mensagem de "sem caminho";
+    - árvores de caminhos mínimos por origem (distâncias e predecessores), que respondem
+      qualquer destino a partir daquela origem sem nova busca;
+    - detalhes de trechos de um caminho.
+
+A chave inclui a versão do grafo (graph_analysis.get_graph_version), o peso e a assinatura
+do modelo de peso (weight_models), então resultados de grafos/pesos diferentes não se
+misturam. Quando um grafo é alterado (graph_analysis.patch_graph_lines), as entradas da
+versão antiga são descartadas automaticamente. A chave inclui também o número de nós e de
+arestas (routing.graph_state), de modo que paradas ou trechos incluídos/removidos no lugar não
+usam resultados antigos; alterações que mantêm as contagens (ex.: mudar o peso de uma aresta)
+não são percebidas: use patch_graph_lines, mude graph['versao'] ou chame clear(). O tamanho é limitado pelo número de entradas
+e pelo total de nós guardados (aproximação do uso de memória: uma árvore guarda todos os nós
+alcançados, um par apenas os nós do caminho).
+"""
+import weakref
+from collections import OrderedDict
+
+import networkx as nx
+
+import graph_analysis
+import routing
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_NODES = 500_000
+
+_caches: "weakref.WeakSet[RouteCache]" = weakref.WeakSet()
+
+
+class RouteCache:
+    """
+    Cache LRU de rotas.
+
+    Args:
+        max_entries: Número máximo de entradas (pares, árvores e detalhes).
+        max_nodes: Total máximo de nós guardados somando todas as entradas. None desativa o limite.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_nodes: int | None = DEFAULT_MAX_NODES):
+        self.max_entries = max_entries
+        self.max_nodes = max_nodes
+        self._entries: OrderedDict = OrderedDict()  # chave -> (valor, nós)
+        self._stored_nodes = 0
+        self._stats = {'acertos_par': 0, 'acertos_arvore': 0, 'acertos_detalhes': 0,
+                       'falhas': 0, 'descartes': 0, 'invalidacoes': 0}
+        _caches.add(self)
+
+    # --- Armazenamento LRU ---
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, value, nodes: int):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._stored_nodes -= old[1]
+        self._entries[key] = (value, nodes)
+        self._stored_nodes += nodes
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or (self.max_nodes is not None and self._stored_nodes > self.max_nodes)):
+            _, (_, evicted_nodes) = self._entries.popitem(last=False)
+            self._stored_nodes -= evicted_nodes
+            self._stats['descartes'] += 1
+
+    @staticmethod
+    def _prefix(graph: nx.DiGraph, weight: str) -> tuple:
+        # Versão + estado (nós e arestas): inclusões/remoções no lugar fora de patch_graph_lines
+        # também separam as entradas
+        return (graph_analysis.get_graph_version(graph), routing.graph_state(graph), weight,
+                graph.graph.get(f'modelo_peso__{weight}'))
+
+    # --- Consultas ---
+
+    def shortest_path(self, graph: nx.DiGraph, source_node, target_node, weight: str = 'weight',
+                      method: str = 'dijkstra'):
+        """
+        Mesma interface e retorno de graph_analysis.find_shortest_path_dijkstra
+        ((comprimento, caminho) ou (None, mensagem)), respondendo do cache quando possível:
+        primeiro o par, depois a árvore da origem, e só então uma nova busca.
+        """
+        prefix = self._prefix(graph, weight)
+        entry = self._get((*prefix, 'par', source_node, target_node))
+        if entry is not None:
+            self._stats['acertos_par'] += 1
+            return entry[0]
+
+        tree = self._get((*prefix, 'arvore', source_node))
+        if tree is not None:
+            self._stats['acertos_arvore'] += 1
+            result = self._path_from_tree(tree[0], source_node, target_node)
+        else:
+            self._stats['falhas'] += 1
+            result = graph_analysis.find_shortest_path_dijkstra(graph, source_node, target_node, weight=weight, method=method)
+        self._put((*prefix, 'par', source_node, target_node), result,
+                  len(result[1]) if result[0] is not None else 1)
+        return result
+
+    def shortest_path_tree(self, graph: nx.DiGraph, source_node, weight: str = 'weight') -> tuple[dict, dict]:
+        """
+        Árvore de caminhos mínimos a partir de `source_node`: (predecessores, distâncias), como
+        nx.dijkstra_predecessor_and_distance. As consultas de par com a mesma origem passam a
+        ser respondidas por ela.
+        """
+        key = (*self._prefix(graph, weight), 'arvore', source_node)
+        entry = self._get(key)
+        if entry is not None:
+            self._stats['acertos_arvore'] += 1
+            return entry[0]
+        self._stats['falhas'] += 1
+        tree = nx.dijkstra_predecessor_and_distance(graph, source_node, weight=weight)
+        self._put(key, tree, len(tree[1]))
+        return tree
+
+    def path_details(self, graph: nx.DiGraph, path_nodes: list) -> list[dict]:
+        """graph_analysis.get_path_details com cache por (versão do grafo, caminho)."""
+        key = (graph_analysis.get_graph_version(graph), routing.graph_state(graph), 'detalhes', tuple(path_nodes or ()))
+        entry = self._get(key)
+        if entry is not None:
+            self._stats['acertos_detalhes'] += 1
+            return entry[0]
+        self._stats['falhas'] += 1
+        details = graph_analysis.get_path_details(graph, path_nodes)
+        self._put(key, details, max(1, len(details)))
+        return details
+
+    @staticmethod
+    def _path_from_tree(tree: tuple[dict, dict], source_node, target_node):
+        pred, dist = tree
+        if target_node not in dist:
+            return None, f"Não há caminho entre '{source_node}' e '{target_node}' no grafo."
+        path = [target_node]
+        while path[-1] != source_node:
+            path.append(pred[path[-1]][0])
+        path.reverse()
+        return dist[target_node], path
+
+    # --- Manutenção ---
+
+    def invalidate(self, graph_version: str | None = None):
+        """Remove todas as entradas, ou apenas as de uma versão de grafo."""
+        if graph_version is None:
+            removed = list(self._entries)
+        else:
+            removed = [key for key in self._entries if key[0] == graph_version]
+        for key in removed:
+            self._stored_nodes -= self._entries.pop(key)[1]
+        self._stats['invalidacoes'] += len(removed)
+
+    def stats(self) -> dict:
+        """Contadores de acertos/falhas, taxa de acerto, entradas, nós guardados, descartes e invalidações."""
+        acertos = self._stats['acertos_par'] + self._stats['acertos_arvore'] + self._stats['acertos_detalhes']
+        total = acertos + self._stats['falhas']
+        return {**self._stats, 'acertos': acertos, 'taxa_acerto': acertos / total if total else 0.0,
+                'entradas': len(self._entries), 'nos_guardados': self._stored_nodes}
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"(Cache de Rotas) {s['entradas']} entradas, {s['nos_guardados']} nós guardados. "
+              f"Acertos: {s['acertos']} (par {s['acertos_par']}, árvore {s['acertos_arvore']}, "
+              f"detalhes {s['acertos_detalhes']}), falhas: {s['falhas']}, taxa: {s['taxa_acerto']:.0%}. "
+              f"Descartes LRU: {s['descartes']}, invalidações: {s['invalidacoes']}.")
+
+
+def _on_graph_change(graph, old_version: str, new_version: str, alteracoes: dict):
+    """Rotas da versão antiga podem ter mudado: descarta-as de todos os caches."""
+    for cache in list(_caches):
+        cache.invalidate(old_version)
+
+
+graph_analysis.register_graph_change_listener(_on_graph_change)
+
+# Cache compartilhado pelo processo
+default_cache = RouteCache()
+
+
+def cached_shortest_path(graph: nx.DiGraph, source_node, target_node, weight: str = 'weight', method: str = 'dijkstra'):
+    """find_shortest_path_dijkstra com o cache compartilhado (default_cache)."""
+    return default_cache.shortest_path(graph, source_node, target_node, weight=weight, method=method)
+
+
+def cached_path_details(graph: nx.DiGraph, path_nodes: list) -> list[dict]:
+    """get_path_details com o cache compartilhado (default_cache)."""
+    return default_cache.path_details(graph, path_nodes)
@@ -0,0 +1,584 @@
+"""
+Motor de caminhos mínimos para o grafo de transporte.
+
+Reúne Dijkstra (unidirecional e bidirecional), A* e Dijkstra com penalidade de
+transferência entre linhas, todos devolvendo custo e caminho a partir de uma única busca,
+além dos k caminhos alternativos mais curtos (Yen). A heurística do A* é a distância haversine
+até o destino, calculada de uma só vez (vetorizada) sobre um índice de
+coordenadas por nó, em vez de chamar `geodesic` a cada expansão.
+"""
+import heapq
+import weakref
+from itertools import count
+
+import networkx as nx
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+# O haversine usa uma esfera e pode superestimar a distância geodésica (elipsoide)
+# em até ~0,5%. O fator de segurança mantém a heurística admissível.
+HEURISTIC_SAFETY_FACTOR = 0.995
+# Trechos entre paradas consecutivas mais longos que isso são tratados como erro de geocodificação
+# (ex.: parada geocodificada em outro estado) nas análises de extensão, lacunas e novas paradas
+MAX_PLAUSIBLE_SEGMENT_M = 3000.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distância haversine em km. Aceita escalares ou arrays numpy (com broadcasting).
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def node_coordinates(node_data: dict) -> tuple[float, float] | None:
+    """
+    Retorna (lat, lon) de um nó, aceitando os dois formatos de atributos usados no projeto:
+    'latitude'/'longitude' (graph_analysis) e 'lat'/'lon' (tests/otimizacao).
+    """
+    lat = node_data.get('latitude', node_data.get('lat'))
+    lon = node_data.get('longitude', node_data.get('lon'))
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+def graph_state(graph: nx.DiGraph) -> tuple:
+    """
+    Estado do grafo para detectar índices desatualizados: versão (graph['versao']), número de nós
+    e número de arestas. Qualquer inclusão/remoção de paradas ou trechos muda o estado; alterações
+    que mantêm as contagens (ex.: mover uma parada) devem mudar graph['versao'] ou invalidar o índice.
+    """
+    # Soma dos tamanhos dos dicionários de adjacência (graph.adjacency()): ~3,5x mais rápida que
+    # graph.number_of_edges(), que percorre os graus, e ~10x mais que percorrer as views de graph.succ;
+    # o estado é consultado a cada busca nos caches de rotas e índices
+    return graph.graph.get('versao'), len(graph), sum(len(vizinhos) for _, vizinhos in graph.adjacency())
+
+
+class CoordinateIndex:
+    """
+    Índice de coordenadas do grafo: uma posição inteira por nó e arrays numpy
+    contíguos de latitude/longitude. Nós sem coordenadas ficam com NaN.
+    """
+
+    def __init__(self, graph: nx.DiGraph):
+        self.state = graph_state(graph)
+        self.nodes = list(graph.nodes)
+        self.position = {node: i for i, node in enumerate(self.nodes)}
+        self.latitudes = np.full(len(self.nodes), np.nan)
+        self.longitudes = np.full(len(self.nodes), np.nan)
+        for i, node in enumerate(self.nodes):
+            coords = node_coordinates(graph.nodes[node])
+            if coords is not None:
+                self.latitudes[i], self.longitudes[i] = coords
+
+    def distances_to_km(self, node) -> np.ndarray:
+        """Distância haversine (km) de todos os nós até `node`. NaN vira 0."""
+        i = self.position[node]
+        dist = haversine_km(self.latitudes, self.longitudes, self.latitudes[i], self.longitudes[i])
+        return np.nan_to_num(dist, nan=0.0)
+
+
+_coordinate_indexes: "weakref.WeakKeyDictionary[nx.DiGraph, CoordinateIndex]" = weakref.WeakKeyDictionary()
+
+
+def get_coordinate_index(graph: nx.DiGraph) -> CoordinateIndex:
+    """
+    Retorna o índice de coordenadas do grafo, construindo-o na primeira chamada.
+    O índice é refeito se o estado do grafo (graph_state: versão, nós e arestas) mudar.
+    """
+    index = _coordinate_indexes.get(graph)
+    if index is None or index.state != graph_state(graph):
+        index = CoordinateIndex(graph)
+        _coordinate_indexes[graph] = index
+    return index
+
+
+def invalidate_coordinate_index(graph: nx.DiGraph):
+    """Descarta o índice de coordenadas do grafo (ex.: após substituir paradas com o mesmo número de nós)."""
+    _coordinate_indexes.pop(graph, None)
+
+
+def dijkstra_path(graph: nx.DiGraph, source, target, weight: str = 'weight') -> tuple[float, list]:
+    """
+    Dijkstra com parada antecipada no destino: custo e caminho na mesma busca.
+    Levanta nx.NetworkXNoPath se não houver caminho.
+    """
+    return nx.single_source_dijkstra(graph, source, target, weight=weight)
+
+
+def bidirectional_dijkstra_path(graph: nx.DiGraph, source, target, weight: str = 'weight') -> tuple[float, list]:
+    """
+    Dijkstra bidirecional (expande a partir da origem e do destino ao mesmo tempo).
+    Levanta nx.NetworkXNoPath se não houver caminho.
+    """
+    return nx.bidirectional_dijkstra(graph, source, target, weight=weight)
+
+
+def astar_path(graph: nx.DiGraph, source, target, weight: str = 'weight',
+               units_per_km: float = 1.0) -> tuple[float, list]:
+    """
+    A* com heurística haversine pré-calculada para todos os nós.
+
+    Args:
+        graph: Grafo com coordenadas nos nós.
+        source: Nó de origem.
+        target: Nó de destino.
+        weight: Atributo de peso das arestas.
+        units_per_km: Conversão de km para a unidade do peso (1.0 para km, 1000.0 para metros).
+                      Para pesos que não são distância, use um limite inferior válido (ou 0).
+
+    Returns:
+        (custo, caminho). Levanta nx.NetworkXNoPath se não houver caminho.
+    """
+    if source not in graph:
+        raise nx.NodeNotFound(f"Nó de origem {source} não está no grafo.")
+    if target not in graph:
+        raise nx.NodeNotFound(f"Nó de destino {target} não está no grafo.")
+
+    index = get_coordinate_index(graph)
+    # Lista Python: indexação e aritmética com float nativo são mais rápidas que com escalares numpy
+    heuristic = (index.distances_to_km(target) * (units_per_km * HEURISTIC_SAFETY_FACTOR)).tolist()
+    position = index.position
+    succ = dict(graph.adjacency())  # dicionários de adjacência, sem as views de graph.succ
+
+    settled = {}       # nó -> custo definitivo
+    best = {source: 0.0}
+    pred = {source: None}
+    tie = count()
+    queue = [(heuristic[position[source]], next(tie), 0.0, source)]
+
+    while queue:
+        _, __, cost, node = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled[node] = cost
+        if node == target:
+            path = [node]
+            while pred[node] is not None:
+                node = pred[node]
+                path.append(node)
+            path.reverse()
+            return cost, path
+        for neighbor, edge_data in succ[node].items():
+            if neighbor in settled:
+                continue
+            new_cost = cost + edge_data.get(weight, 1)
+            if new_cost < best.get(neighbor, float('inf')):
+                best[neighbor] = new_cost
+                pred[neighbor] = node
+                heapq.heappush(queue, (new_cost + heuristic[position[neighbor]], next(tie), new_cost, neighbor))
+
+    raise nx.NetworkXNoPath(f"Nó {target} não é alcançável a partir de {source}.")
+
+
+
+def weight_units_per_km(graph: nx.DiGraph, weight: str = 'weight') -> float:
+    """
+    Limite inferior de custo por km em linha reta para o atributo de peso, usado pela heurística do A*.
+    Pesos de tempo (weight_models) registram o valor em graph['unidades_por_km__<nome>'];
+    'weight' segue graph['unidade_peso'] ('km' ou 'm'). Para outros pesos retorna 0 (sem heurística).
+    """
+    registrado = graph.graph.get(f'unidades_por_km__{weight}')
+    if registrado is not None:
+        return float(registrado)
+    if weight == 'weight':
+        return 1000.0 if graph.graph.get('unidade_peso') == 'm' else 1.0
+    return 0.0
+
+
+def edge_lines(edge_data: dict) -> list:
+    """Linhas que percorrem a aresta, nos dois formatos de grafo do projeto."""
+    linhas = edge_data.get('linhas_passantes')
+    if linhas:
+        return linhas
+    linha = edge_data.get('linha', edge_data.get('numero_linha'))
+    return [linha] if linha is not None else [None]
+
+
+def transfer_aware_path(graph: nx.DiGraph, source, target, weight: str = 'weight',
+                        transfer_penalty: float | None = None) -> tuple[float, list, list]:
+    """
+    Dijkstra sobre estados (parada, linha atual): trocar de linha soma `transfer_penalty`
+    (na unidade do peso); embarcar na primeira linha não tem custo.
+
+    Args:
+        graph: Grafo de transporte (linhas em 'linhas_passantes', 'linha' ou 'numero_linha').
+        source: Nó de origem.
+        target: Nó de destino.
+        weight: Atributo de peso das arestas.
+        transfer_penalty: Penalidade por transferência. None usa graph['penalidade_transferencia__<peso>']
+                          (registrada por weight_models.apply_weight_model) ou 0.
+
+    Returns:
+        (custo, caminho, linhas), onde linhas[i] é a linha usada na aresta caminho[i] -> caminho[i + 1].
+        Levanta nx.NetworkXNoPath se não houver caminho.
+    """
+    if source not in graph:
+        raise nx.NodeNotFound(f"Nó de origem {source} não está no grafo.")
+    if target not in graph:
+        raise nx.NodeNotFound(f"Nó de destino {target} não está no grafo.")
+    if transfer_penalty is None:
+        transfer_penalty = float(graph.graph.get(f'penalidade_transferencia__{weight}', 0.0))
+
+    succ = dict(graph.adjacency())
+    start = (source, None)
+    settled = set()
+    best = {start: 0.0}
+    pred = {start: None}
+    tie = count()
+    queue = [(0.0, next(tie), start)]
+
+    while queue:
+        cost, _, state = heapq.heappop(queue)
+        if state in settled:
+            continue
+        settled.add(state)
+        node, line = state
+        if node == target:
+            path, lines = [node], []
+            while pred[state] is not None:
+                lines.append(state[1])
+                state = pred[state]
+                path.append(state[0])
+            path.reverse()
+            lines.reverse()
+            return cost, path, lines
+        for neighbor, edge_data in succ[node].items():
+            edge_cost = cost + edge_data.get(weight, 1)
+            for next_line in edge_lines(edge_data):
+                next_state = (neighbor, next_line)
+                if next_state in settled:
+                    continue
+                new_cost = edge_cost if line is None or next_line == line else edge_cost + transfer_penalty
+                if new_cost < best.get(next_state, float('inf')):
+                    best[next_state] = new_cost
+                    pred[next_state] = state
+                    heapq.heappush(queue, (new_cost, next(tie), next_state))
+
+    raise nx.NetworkXNoPath(f"Nó {target} não é alcançável a partir de {source}.")
+
+
+# --- K caminhos mais curtos (Yen) ---
+
+def _path_cost(succ, path: list, weight: str) -> float:
+    """Custo de `path`; `succ` é a adjacência de saída (graph.succ ou dict(graph.adjacency()))."""
+    return sum(succ[u][v].get(weight, 1) for u, v in zip(path, path[1:]))
+
+
+def _spur_search(succ: dict, spur, target, weight: str, to_target: dict, tree_next: dict,
+                 blocked_nodes: set, blocked_edges: set) -> tuple[float, list] | None:
+    """
+    Caminho mínimo de `spur` a `target` sem passar por `blocked_nodes` nem `blocked_edges`.
+
+    Reaproveita a árvore de caminhos mínimos até o destino (calculada uma vez no grafo completo):
+    se o caminho da árvore a partir de `spur` não toca nada bloqueado, ele já é o ótimo; senão,
+    a distância da árvore é um limite inferior exato para a heurística do A* (bloquear arestas só
+    aumenta distâncias). `succ` é dict(graph.adjacency()), montado uma vez por k_shortest_paths.
+    """
+    path = [spur]
+    node = spur
+    while node != target:
+        nxt = tree_next.get(node)
+        if nxt is None or nxt in blocked_nodes or (node, nxt) in blocked_edges:
+            break
+        path.append(nxt)
+        node = nxt
+    else:
+        return to_target[spur], path
+
+    settled = set()
+    best = {spur: 0.0}
+    pred = {spur: None}
+    tie = count()
+    queue = [(to_target.get(spur, 0.0), next(tie), 0.0, spur)]
+    while queue:
+        _, __, cost, node = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node == target:
+            path = [node]
+            while pred[node] is not None:
+                node = pred[node]
+                path.append(node)
+            path.reverse()
+            return cost, path
+        for neighbor, edge_data in succ[node].items():
+            if neighbor in settled or neighbor in blocked_nodes or (node, neighbor) in blocked_edges:
+                continue
+            h = to_target.get(neighbor)
+            if h is None:  # sem caminho até o destino nem no grafo completo
+                continue
+            new_cost = cost + edge_data.get(weight, 1)
+            if new_cost < best.get(neighbor, float('inf')):
+                best[neighbor] = new_cost
+                pred[neighbor] = node
+                heapq.heappush(queue, (new_cost + h, next(tie), new_cost, neighbor))
+    return None
+
+
+def path_overlap(graph: nx.DiGraph, path: list, other: list, weight: str = 'weight') -> float:
+    """Fração do custo de `path` percorrida em arestas que também estão em `other` (0 a 1)."""
+    other_edges = set(zip(other, other[1:]))
+    succ = graph.succ
+    total = _path_cost(succ, path, weight)
+    if total <= 0:
+        return 1.0 if other_edges.issuperset(zip(path, path[1:])) else 0.0
+    shared = sum(succ[u][v].get(weight, 1) for u, v in zip(path, path[1:]) if (u, v) in other_edges)
+    return shared / total
+
+
+def k_shortest_paths(graph: nx.DiGraph, source, target, k: int = 3, weight: str = 'weight',
+                     max_overlap: float | None = None, max_candidates: int | None = None) -> list[tuple[float, list]]:
+    """
+    Até `k` caminhos simples (sem ciclos) de menor custo, em ordem crescente (algoritmo de Yen).
+
+    A árvore de caminhos mínimos até o destino é calculada uma única vez (Dijkstra reverso) e
+    reaproveitada em todas as buscas de desvio (ver _spur_search).
+
+    Args:
+        graph: Grafo de transporte.
+        source: Nó de origem.
+        target: Nó de destino.
+        k: Número de caminhos.
+        weight: Atributo de peso das arestas.
+        max_overlap: Filtro de diversidade: descarta caminhos cuja fração de custo compartilhada
+                     com algum caminho já aceito (path_overlap) passe deste valor. None não filtra.
+        max_candidates: Limite de caminhos examinados (aceitos ou descartados pelo filtro).
+                        None usa 10 * k quando há filtro.
+
+    Returns:
+        Lista de (custo, caminho). Levanta nx.NetworkXNoPath se não houver nenhum caminho.
+    """
+    if source not in graph:
+        raise nx.NodeNotFound(f"Nó de origem {source} não está no grafo.")
+    if target not in graph:
+        raise nx.NodeNotFound(f"Nó de destino {target} não está no grafo.")
+
+    # No grafo reverso, o predecessor de cada nó é o próximo nó do caminho mínimo até o destino
+    tree_pred, to_target = nx.dijkstra_predecessor_and_distance(graph.reverse(copy=False), target, weight=weight)
+    if source not in to_target:
+        raise nx.NetworkXNoPath(f"Nó {target} não é alcançável a partir de {source}.")
+    tree_next = {node: parents[0] for node, parents in tree_pred.items() if parents}
+    if max_candidates is None:
+        max_candidates = 10 * k if max_overlap is not None else k
+
+    first = [source]
+    while first[-1] != target:
+        first.append(tree_next[first[-1]])
+    # Dicionários de adjacência (sem as views de graph.succ), consultados em todas as buscas de desvio
+    succ = dict(graph.adjacency())
+    examined = [(to_target[source], first)]   # caminhos na ordem de Yen
+    accepted = [(to_target[source], first)]
+    seen = {tuple(first)}
+    candidates = []
+    tie = count()
+
+    while len(accepted) < k and len(examined) < max_candidates:
+        _, last = examined[-1]
+        for i in range(len(last) - 1):
+            spur, root = last[i], last[:i + 1]
+            blocked_edges = {(p[i], p[i + 1]) for _, p in examined if len(p) > i + 1 and p[:i + 1] == root}
+            blocked_nodes = set(root[:-1])
+            spur_result = _spur_search(succ, spur, target, weight, to_target, tree_next, blocked_nodes, blocked_edges)
+            if spur_result is None:
+                continue
+            candidate = root[:-1] + spur_result[1]
+            key = tuple(candidate)
+            if key not in seen:
+                seen.add(key)
+                heapq.heappush(candidates, (_path_cost(succ, candidate, weight), next(tie), candidate))
+        if not candidates:
+            break
+        cost, _, path = heapq.heappop(candidates)
+        examined.append((cost, path))
+        if max_overlap is None or all(path_overlap(graph, path, p, weight) <= max_overlap for _, p in accepted):
+            accepted.append((cost, path))
+    return accepted
+
+
+# --- Execução paralela sobre o grafo ---
+
+# Grafo compartilhado com os processos do pool. Com o método 'fork' o processo
+# filho herda estas referências (cópia sob demanda), sem serializar o grafo.
+_shared_graph: nx.DiGraph | None = None
+_shared_context = None
+
+
+def _init_worker(graph: nx.DiGraph | None, context):
+    """Inicializador do pool. Em 'spawn' recebe o grafo uma única vez por processo."""
+    global _shared_graph, _shared_context
+    if graph is not None:
+        _shared_graph = graph
+        _shared_context = context
+
+
+def _call_with_graph(task):
+    func, item = task
+    return func(_shared_graph, item, _shared_context)
+
+
+def map_over_graph(graph: nx.DiGraph, func, items: list, context=None,
+                   processes: int | None = None, min_items_per_process: int = 8) -> list:
+    """
+    Aplica `func(graph, item, context)` a cada item, distribuindo os itens entre processos.
+
+    O grafo (e o `context`, dados auxiliares somente leitura) é compartilhado com os
+    processos: herdado via 'fork' quando disponível, ou enviado uma vez por processo
+    no inicializador do pool ('spawn'). `func` deve ser uma função de nível de módulo.
+
+    Args:
+        graph: Grafo compartilhado somente para leitura.
+        func: Função de nível de módulo com assinatura func(graph, item, context).
+        items: Itens a processar (ex.: nós de origem, lotes de origens, cenários).
+        context: Dados auxiliares compartilhados.
+        processes: Número de processos. None usa os.cpu_count(); 1 executa no processo atual.
+        min_items_per_process: Abaixo deste número de itens por processo, roda serialmente.
+
+    Returns:
+        Lista de resultados, na ordem dos itens.
+    """
+    import multiprocessing
+    import os
+
+    global _shared_graph, _shared_context
+
+    items = list(items)
+    processes = processes or os.cpu_count() or 1
+    processes = max(1, min(processes, len(items) // max(1, min_items_per_process)))
+    if processes == 1:
+        return [func(graph, item, context) for item in items]
+
+    previous = (_shared_graph, _shared_context)
+    _shared_graph, _shared_context = graph, context
+    try:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            initargs = (None, None)  # herdado via fork
+        else:
+            ctx = multiprocessing.get_context('spawn')
+            initargs = (graph, context)
+        chunksize = max(1, len(items) // (processes * 4))
+        with ctx.Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+            return pool.map(_call_with_graph, [(func, item) for item in items], chunksize=chunksize)
+    finally:
+        _shared_graph, _shared_context = previous
+
+
+# --- Consultas em lote (um-para-muitos / muitos-para-muitos) ---
+
+def _source_tree(graph: nx.DiGraph, source, context) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Executa uma árvore de caminhos mínimos a partir de `source` e devolve
+    (distâncias até os destinos, predecessor de cada nó do grafo).
+    """
+    weight, position, target_positions = context
+    pred, dist = nx.dijkstra_predecessor_and_distance(graph, source, weight=weight)
+    node_dist = np.full(len(position), np.inf)
+    node_pred = np.full(len(position), -1, dtype=np.int32)
+    for node, d in dist.items():
+        i = position[node]
+        node_dist[i] = d
+        parents = pred[node]
+        if parents:
+            node_pred[i] = position[parents[0]]
+    return node_dist[target_positions], node_pred
+
+
+class ShortestPathMatrix:
+    """
+    Resultado denso de consultas em lote.
+
+    Atributos:
+        nodes: Lista de nós do grafo (a posição é o índice usado em `predecessors`).
+        sources: Origens distintas, na ordem das linhas.
+        targets: Destinos, na ordem das colunas de `distances`.
+        distances: Array (origens x destinos) com o custo mínimo (inf se inalcançável).
+        predecessors: Array (origens x nós) com o índice do predecessor na árvore de cada origem (-1 se nenhum).
+    """
+
+    def __init__(self, nodes: list, sources: list, targets: list, distances: np.ndarray, predecessors: np.ndarray):
+        self.nodes = nodes
+        self.sources = sources
+        self.targets = targets
+        self.distances = distances
+        self.predecessors = predecessors
+        self._source_row = {s: i for i, s in enumerate(sources)}
+        self._target_col = {t: j for j, t in enumerate(targets)}
+        self._node_position = {n: i for i, n in enumerate(nodes)}
+
+    def distance(self, source, target) -> float:
+        """Custo mínimo entre uma origem e um destino do lote."""
+        return float(self.distances[self._source_row[source], self._target_col[target]])
+
+    def path(self, source, target) -> list | None:
+        """Reconstrói o caminho a partir da árvore da origem. None se inalcançável."""
+        row = self.predecessors[self._source_row[source]]
+        i = self._node_position[target]
+        if target != source and row[i] < 0:
+            return None
+        path = [target]
+        while self.nodes[i] != source:
+            i = row[i]
+            path.append(self.nodes[i])
+        path.reverse()
+        return path
+
+    def to_dataframe(self, long_format: bool = False):
+        """
+        Converte as distâncias em DataFrame.
+        long_format=False: matriz (índice = origens, colunas = destinos).
+        long_format=True: uma linha por par, com colunas 'origem', 'destino', 'custo'.
+        """
+        import pandas as pd
+        wide = pd.DataFrame(self.distances, index=pd.Index(self.sources, name='origem'),
+                            columns=pd.Index(self.targets, name='destino'))
+        if not long_format:
+            return wide
+        return wide.stack().rename('custo').reset_index()
+
+
+def shortest_path_matrix(graph: nx.DiGraph, sources: list, targets: list | None = None,
+                         weight: str = 'weight', processes: int | None = None,
+                         min_sources_per_process: int = 8) -> ShortestPathMatrix:
+    """
+    Calcula custos mínimos de várias origens para vários destinos.
+
+    Executa uma única árvore de caminhos mínimos por origem distinta e responde
+    todos os destinos a partir dela. As origens são distribuídas entre processos;
+    o grafo é compartilhado somente para leitura (ver `map_over_graph`).
+
+    Args:
+        graph: Grafo de transporte.
+        sources: Nós de origem (duplicatas são ignoradas).
+        targets: Nós de destino. None usa todos os nós do grafo.
+        weight: Atributo de peso das arestas.
+        processes: Número de processos. None usa os.cpu_count(); 1 executa no processo atual.
+        min_sources_per_process: Abaixo deste número de origens por processo, o lote roda serialmente.
+
+    Returns:
+        ShortestPathMatrix com distâncias (origens x destinos) e predecessores (origens x nós).
+    """
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    sources = list(dict.fromkeys(sources))
+    targets = nodes if targets is None else list(targets)
+    missing = [n for n in sources + targets if n not in position]
+    if missing:
+        raise nx.NodeNotFound(f"Nós não encontrados no grafo: {missing[:5]}")
+    target_positions = np.array([position[t] for t in targets], dtype=np.int64)
+
+    rows = map_over_graph(graph, _source_tree, sources, context=(weight, position, target_positions),
+                          processes=processes, min_items_per_process=min_sources_per_process)
+
+    if rows:
+        distances = np.vstack([r[0] for r in rows])
+        predecessors = np.vstack([r[1] for r in rows])
+    else:
+        distances = np.empty((0, len(targets)))
+        predecessors = np.empty((0, len(nodes)), dtype=np.int32)
+    return ShortestPathMatrix(nodes, sources, targets, distances, predecessors)
@@ -0,0 +1,121 @@
+"""
+Índice espacial das paradas (KD-tree) para localizar paradas próximas de um ponto.
+
+As coordenadas são convertidas em vetores unitários 3D, de modo que a distância euclidiana
+(corda) na KD-tree (scipy.spatial.cKDTree) é monotônica com a distância sobre a esfera:
+"parada mais próxima" e "paradas num raio de X km" saem em O(log n) por consulta, sem
+calcular a distância até todas as paradas.
+"""
+import weakref
+
+import networkx as nx
+import numpy as np
+from scipy.spatial import cKDTree
+
+import routing
+
+
+def _unit_vectors(latitudes, longitudes) -> np.ndarray:
+    lat, lon = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_to_km(chord):
+    return 2.0 * routing.EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+def _km_to_chord(km: float) -> float:
+    return 2.0 * np.sin(min(km / (2.0 * routing.EARTH_RADIUS_KM), np.pi / 2))
+
+
+class StopSpatialIndex:
+    """
+    KD-tree sobre as paradas com coordenadas.
+
+    Atributos:
+        nodes: Lista de paradas indexadas (na ordem das linhas da árvore).
+        latitudes, longitudes: Arrays com as coordenadas das paradas indexadas.
+    """
+
+    def __init__(self, nodes: list, latitudes: np.ndarray, longitudes: np.ndarray):
+        latitudes, longitudes = np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        self.nodes = [node for node, ok in zip(nodes, valid) if ok]
+        self.latitudes = latitudes[valid]
+        self.longitudes = longitudes[valid]
+        self._tree = cKDTree(_unit_vectors(self.latitudes, self.longitudes)) if self.nodes else None
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph) -> "StopSpatialIndex":
+        """Constrói o índice a partir do índice de coordenadas do grafo (routing.get_coordinate_index)."""
+        coords = routing.get_coordinate_index(graph)
+        return cls(coords.nodes, coords.latitudes, coords.longitudes)
+
+    @classmethod
+    def from_stops(cls, stops) -> "StopSpatialIndex":
+        """
+        Constrói o índice a partir da tabela de paradas (stop_data.load_stops), com uma entrada
+        por coordenada distinta (paradas repetidas em várias linhas contam uma vez). Os nós são
+        as tuplas (lat, lon).
+        """
+        coords = stops[['latitude', 'longitude']].dropna().drop_duplicates()
+        lats, lons = coords['latitude'].to_numpy(dtype=float), coords['longitude'].to_numpy(dtype=float)
+        return cls(list(zip(lats.tolist(), lons.tolist())), lats, lons)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> list[tuple]:
+        """As `k` paradas mais próximas de (lat, lon): lista de (parada, distância em km), da mais próxima."""
+        if self._tree is None:
+            return []
+        k = min(k, len(self.nodes))
+        chords, positions = self._tree.query(_unit_vectors([lat], [lon])[0], k=k)
+        chords, positions = np.atleast_1d(chords), np.atleast_1d(positions)
+        return [(self.nodes[i], float(d)) for i, d in zip(positions.tolist(), _chord_to_km(chords).tolist())]
+
+    def nearest_many(self, latitudes, longitudes, workers: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Parada mais próxima de cada ponto, em lote (vetorizado).
+
+        Args:
+            latitudes, longitudes: Arrays com as coordenadas dos pontos.
+            workers: Threads da consulta à KD-tree (-1 usa todos os núcleos).
+
+        Returns:
+            (posições das paradas em `nodes`, distâncias em km). Sem paradas: posições -1 e distâncias inf.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        if self._tree is None:
+            return np.full(len(latitudes), -1, dtype=np.int64), np.full(len(latitudes), np.inf)
+        chords, positions = self._tree.query(_unit_vectors(latitudes, longitudes), k=1, workers=workers)
+        return positions.astype(np.int64), _chord_to_km(chords)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list[tuple]:
+        """Paradas a até `radius_km` de (lat, lon): lista de (parada, distância em km), da mais próxima."""
+        if self._tree is None:
+            return []
+        point = _unit_vectors([lat], [lon])[0]
+        positions = self._tree.query_ball_point(point, _km_to_chord(radius_km))
+        if not positions:
+            return []
+        positions = np.array(positions, dtype=np.int64)
+        dist = _chord_to_km(np.linalg.norm(self._tree.data[positions] - point, axis=1))
+        order = np.argsort(dist, kind='stable')
+        return [(self.nodes[i], float(d)) for i, d in zip(positions[order].tolist(), dist[order].tolist())]
+
+
+_spatial_indexes: "weakref.WeakKeyDictionary[nx.DiGraph, tuple]" = weakref.WeakKeyDictionary()
+
+
+def get_spatial_index(graph: nx.DiGraph) -> StopSpatialIndex:
+    """
+    Retorna o índice espacial do grafo, construindo-o na primeira chamada. Acompanha o
+    índice de coordenadas (routing.get_coordinate_index): é refeito quando ele é refeito.
+    """
+    coords = routing.get_coordinate_index(graph)
+    cached = _spatial_indexes.get(graph)
+    if cached is None or cached[0] is not coords:
+        cached = (coords, StopSpatialIndex(coords.nodes, coords.latitudes, coords.longitudes))
+        _spatial_indexes[graph] = cached
+    return cached[1]
@@ -0,0 +1,170 @@
+"""
+Deduplicação de paradas por agrupamento espacial antes da construção do grafo.
+
+A mesma parada física aparece com pequenas variações: nomes com grafias diferentes
+("Estrada Itaipuaçu" / "Estrada De Itaipuaçu", "Ponto Final - Ponta Negra (E02)") viram nós
+distintos no grafo por nome, e coordenadas a poucos metros uma da outra viram nós distintos
+no grafo por coordenada. Aqui os registros (nome, lat, lon) são agrupados quando estão a até
+`tolerance_m` metros e têm o mesmo nome normalizado; cada grupo recebe um id canônico, um
+nome canônico (o mais frequente) e uma coordenada canônica (média dos registros).
+
+O agrupamento é do tipo DBSCAN com min_samples=1 (componentes conexas do grafo "a até
+tolerance_m"), em tempo linear: cada registro cai em uma célula de uma grade de lado
+tolerance_m (com o nome normalizado na chave), os pares candidatos saem de uma junção por
+hash com as células vizinhas e as componentes de scipy.sparse.csgraph.connected_components.
+
+Coordenadas idênticas com nomes diferentes NÃO são unidas por padrão: na base geocodificada
+elas costumam ser paradas distintas que caíram no mesmo ponto genérico da via
+(ex.: várias "Rodovia Amaral Peixoto, N"). Use match_names=False para agrupar só pela distância.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+import routing
+from gap_detection import STREET_PREFIXES
+
+DEFAULT_TOLERANCE_M = 25.0
+METERS_PER_DEGREE_LAT = 111_320.0
+# Casas decimais da coordenada canônica (mesma precisão das coordenadas geocodificadas)
+COORD_DECIMALS = 7
+# Palavras ignoradas na comparação de nomes
+NAME_STOPWORDS = {"de", "da", "do", "das", "dos", "e"}
+ALIAS_COLUMNS = ['id_parada_canonica', 'parada_nome_canonica', 'latitude_canonica', 'longitude_canonica',
+                 'parada_nome', 'latitude', 'longitude', 'registros']
+
+
+def normalize_stop_name(stop_name: str) -> str:
+    """
+    Nome da parada para comparação: sem acentos, códigos entre parênteses ("(E02)"), pontuação,
+    prefixo de logradouro e preposições, em minúsculas. Números e demais parênteses são mantidos
+    ("Rua X, 20" e "Rua X, 30" ou "(Sentido Maricá)" e "(Sentido Ponta Negra)" diferem).
+    Ex.: "Estrada De Itaipuaçu" e "Estrada Itaipuaçu" -> "itaipuacu".
+    """
+    if not isinstance(stop_name, str):
+        return ""
+    nome = re.sub(r"\(\s*[A-Za-z]{0,2}\d+\s*\)", " ", stop_name)
+    nome = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii').lower()
+    nome = re.sub(STREET_PREFIXES, "", nome.strip())
+    palavras = re.sub(r"[^\w]+", " ", nome).split()
+    return " ".join(p for p in palavras if p not in NAME_STOPWORDS)
+
+
+def _cell_pairs(cells: pd.DataFrame, offsets: list[tuple[int, int]]) -> tuple[np.ndarray, np.ndarray]:
+    """Pares (i, j) de registros em células vizinhas (mesma chave de nome), por junção de hash."""
+    pares_i, pares_j = [], []
+    for dx, dy in offsets:
+        vizinhas = cells.assign(cx=cells['cx'] + dx, cy=cells['cy'] + dy)
+        juncao = cells.merge(vizinhas, on=['chave', 'cx', 'cy'], suffixes=('_i', '_j'))
+        if dx == 0 and dy == 0:
+            juncao = juncao[juncao['pos_i'] < juncao['pos_j']]
+        pares_i.append(juncao['pos_i'].to_numpy())
+        pares_j.append(juncao['pos_j'].to_numpy())
+    return np.concatenate(pares_i), np.concatenate(pares_j)
+
+
+def cluster_stops(stops: pd.DataFrame, tolerance_m: float = DEFAULT_TOLERANCE_M,
+                  match_names: bool = True) -> pd.DataFrame:
+    """
+    Agrupa os registros (parada_nome, latitude, longitude) que representam a mesma parada física.
+
+    Args:
+        stops: Tabela de paradas (stop_data.load_stops).
+        tolerance_m: Distância máxima (metros) entre registros vizinhos de um mesmo grupo.
+        match_names: Exige o mesmo nome normalizado (normalize_stop_name) para unir registros.
+
+    Returns:
+        Tabela de aliases (ALIAS_COLUMNS): uma linha por registro distinto, com o id, o nome e a
+        coordenada canônicos do grupo e o número de registros da tabela original.
+    """
+    df = stops.dropna(subset=['parada_nome', 'latitude', 'longitude'])
+    registros = (df.groupby(['parada_nome', 'latitude', 'longitude'], sort=True)
+                 .size().rename('registros').reset_index())
+    if registros.empty:
+        return pd.DataFrame(columns=ALIAS_COLUMNS)
+    lats, lons = registros['latitude'].to_numpy(dtype=float), registros['longitude'].to_numpy(dtype=float)
+
+    # Grade de lado tolerance_m. A escala da longitude usa a maior |latitude| da tabela, de modo
+    # que pares a até tolerance_m sempre caiam em células vizinhas; a distância exata é conferida depois.
+    escala_lon = np.cos(np.radians(np.abs(lats).max()))
+    cells = pd.DataFrame({
+        'chave': registros['parada_nome'].map(normalize_stop_name) if match_names else "",
+        'cx': np.floor(lons * escala_lon * METERS_PER_DEGREE_LAT / tolerance_m).astype(np.int64),
+        'cy': np.floor(lats * METERS_PER_DEGREE_LAT / tolerance_m).astype(np.int64),
+        'pos': np.arange(len(registros)),
+    })
+    # Metade da vizinhança 3x3 (cada par de células é visitado uma vez)
+    i, j = _cell_pairs(cells, [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)])
+    perto = routing.haversine_km(lats[i], lons[i], lats[j], lons[j]) * 1000.0 <= tolerance_m
+    i, j = i[perto], j[perto]
+    adjacencia = sparse.coo_matrix((np.ones(len(i)), (i, j)), shape=(len(registros), len(registros)))
+    _, grupos = connected_components(adjacencia, directed=False)
+
+    # Nome canônico: o mais frequente do grupo (empate: ordem alfabética); coordenada: média ponderada
+    registros['id_parada_canonica'] = grupos.astype(np.int64)
+    por_nome = registros.groupby(['id_parada_canonica', 'parada_nome'], sort=True)['registros'].sum().reset_index()
+    por_nome = por_nome.sort_values(by=['id_parada_canonica', 'registros'], ascending=[True, False], kind='stable')
+    nome_canonico = por_nome.drop_duplicates(subset=['id_parada_canonica']).set_index('id_parada_canonica')['parada_nome']
+    peso = registros['registros'].to_numpy(dtype=float)
+    soma = registros.assign(_lat=lats * peso, _lon=lons * peso).groupby('id_parada_canonica')[['_lat', '_lon', 'registros']].sum()
+    registros['parada_nome_canonica'] = registros['id_parada_canonica'].map(nome_canonico)
+    centroide = (soma[['_lat', '_lon']].div(soma['registros'], axis=0)).round(COORD_DECIMALS)
+    registros['latitude_canonica'] = registros['id_parada_canonica'].map(centroide['_lat'])
+    registros['longitude_canonica'] = registros['id_parada_canonica'].map(centroide['_lon'])
+    return registros[ALIAS_COLUMNS]
+
+
+def deduplicate_stops(stops: pd.DataFrame, tolerance_m: float = DEFAULT_TOLERANCE_M,
+                      match_names: bool = True, verbose: bool = True) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Substitui cada registro pelo nome e coordenada canônicos do seu grupo (cluster_stops) e
+    acrescenta a coluna 'id_parada_canonica'. Paradas consecutivas de um itinerário que caem no
+    mesmo grupo são reduzidas a uma (não geram laços no grafo).
+
+    Returns:
+        (tabela de paradas deduplicada, tabela de aliases). A tabela mantém o formato de
+        stop_data.prepare_stops e pode ser passada diretamente a stop_data.build_graph.
+    """
+    aliases = cluster_stops(stops, tolerance_m, match_names)
+    df = stops.merge(aliases[['parada_nome', 'latitude', 'longitude', 'id_parada_canonica',
+                              'parada_nome_canonica', 'latitude_canonica', 'longitude_canonica']],
+                     on=['parada_nome', 'latitude', 'longitude'], how='left', sort=False)
+    canonica = df['id_parada_canonica'].notna()
+    df.loc[canonica, 'parada_nome'] = df.loc[canonica, 'parada_nome_canonica']
+    df.loc[canonica, 'latitude'] = df.loc[canonica, 'latitude_canonica']
+    df.loc[canonica, 'longitude'] = df.loc[canonica, 'longitude_canonica']
+    df['id_parada_canonica'] = df['id_parada_canonica'].astype('Int64')
+    df = df.drop(columns=['parada_nome_canonica', 'latitude_canonica', 'longitude_canonica'])
+
+    df = df.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable').reset_index(drop=True)
+    ids = df['id_parada_canonica'].to_numpy(dtype=float, na_value=np.nan)
+    repetida = (df['numero_linha'].eq(df['numero_linha'].shift()) & df['sentido'].eq(df['sentido'].shift())
+                & (ids == np.roll(ids, 1)))
+    df = df[~repetida].reset_index(drop=True)
+    # Conteúdo mudou: a versão (stop_data.stops_version) é recalculada a partir dos dados
+    df.attrs = {k: v for k, v in stops.attrs.items() if k != 'versao_paradas'}
+
+    if verbose:
+        antes = len(aliases)
+        depois = aliases['id_parada_canonica'].nunique()
+        print(f"(Paradas) Deduplicação (tolerância {tolerance_m:.0f} m): {antes} paradas distintas -> {depois} "
+              f"canônicas; {int(repetida.sum())} registros consecutivos repetidos removidos.")
+    return df, aliases
+
+
+def canonical_stop_names(stops: pd.DataFrame, aliases: pd.DataFrame) -> pd.Series:
+    """
+    Nome canônico (nó do grafo deduplicado) de cada registro da tabela original, alinhado ao
+    índice de `stops`. Registros sem alias (nome ou coordenada ausente) mantêm o próprio nome.
+    Permite filtrar a tabela original pelos nós de um subgrafo sem perder os nomes e
+    coordenadas publicados.
+    """
+    chave = ['parada_nome', 'latitude', 'longitude']
+    nomes = stops[chave].merge(aliases[chave + ['parada_nome_canonica']].drop_duplicates(subset=chave),
+                               on=chave, how='left', sort=False)['parada_nome_canonica']
+    nomes.index = stops.index
+    return nomes.fillna(stops['parada_nome'])
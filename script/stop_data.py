@@ -0,0 +1,413 @@
+"""
+Carregamento único da tabela de paradas e construção do grafo de transporte.
+
+Ponto de entrada comum para main.py e para os scripts de análise em tests/:
+    - load_stops: lê o CSV geocodificado uma única vez, normaliza os nomes das colunas,
+      aplica os tipos (STOP_SCHEMA) e descarta linhas inválidas, informando quantas.
+    - build_graph: um único construtor com as duas estratégias de identificação dos nós:
+        'nome'       -> nós = 'parada_nome' (grafo de graph_analysis.create_transport_graph)
+        'coordenada' -> nós = (lat, lon), agregando linhas/endereços de cada ponto
+      opcionalmente após unir registros da mesma parada física (stop_clustering).
+
+Os resultados são memorizados em processo (mesma versão dos dados -> mesmo objeto) e em
+disco: a tabela em script/cache/stops/ e o grafo no cache versionado (graph_store.GraphStore),
+também particionado em ladrilhos espaciais (tile_store.TiledGraphStore) para que
+load_region_graph (retângulo) e load_region_graphs (polígonos de regions) carreguem só a
+parte da rede que cruza uma região.
+As chaves são derivadas do conteúdo dos dados, nunca da data de modificação dos arquivos.
+"""
+import hashlib
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+import graph_analysis
+import regions
+import stop_clustering
+import tile_store
+from graph_store import GraphStore, hash_file
+from routing import MAX_PLAUSIBLE_SEGMENT_M  # Limite compartilhado com as análises (line_overlap, stop_placement)
+
+# Tipos de cada coluna da tabela de paradas
+STOP_SCHEMA = {
+    'id_parada': 'int64',
+    'numero_linha': 'str',
+    'nome_linha': 'str',
+    'url_linha': 'str',
+    'sentido': 'str',
+    'ordem_parada': 'int64',
+    'parada_nome': 'str',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'endereco_geocodificado': 'str',
+}
+# Colunas sem as quais a linha é descartada
+REQUIRED_COLUMNS = ['numero_linha', 'sentido', 'ordem_parada', 'latitude', 'longitude']
+# Nomes alternativos encontrados nos CSVs exportados
+COLUMN_ALIASES = {'nome_parada': 'parada_nome'}
+
+NODE_KEYS = ('nome', 'coordenada')
+UNITS_PER_KM = {'km': 1.0, 'm': 1000.0}
+
+# Versão do formato da tabela e do construtor por coordenada (incrementar ao mudar)
+STOP_TABLE_VERSION = 1
+COORDINATE_BUILDER_VERSION = 1
+
+DEFAULT_STOPS_CACHE_DIR = "script/cache/stops"
+DEFAULT_GRAPH_CACHE_DIR = "script/cache/graphs"
+TILES_SUBDIR = "tiles"  # Ladrilhos de cada versão, dentro do diretório do cache de grafos
+
+# Memória em processo: caminho -> (hash do arquivo, tabela) e chave -> grafo
+_stops_memo: dict = {}
+_graph_memo: dict = {}
+
+
+def prepare_stops(df: pd.DataFrame, verbose: bool = True) -> pd.DataFrame:
+    """
+    Normaliza e valida uma tabela de paradas já em memória.
+    Renomeia aliases, numera os registros ('id_parada', se ausente), aplica STOP_SCHEMA, descarta linhas sem as colunas obrigatórias ou com
+    coordenadas fora dos limites válidos e ordena por linha, sentido e ordem da parada.
+    Uma 'versao_paradas' herdada nos attrs é descartada (ver stops_version).
+    """
+    df = df.rename(columns={k: v for k, v in COLUMN_ALIASES.items() if k in df.columns and v not in df.columns})
+    faltando = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes na tabela de paradas: {faltando}")
+
+    df = df.copy()
+    df.attrs.pop('versao_paradas', None)
+    if 'id_parada' not in df.columns:
+        df['id_parada'] = np.arange(len(df))  # posição do registro no arquivo de origem
+    for col, dtype in STOP_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'str':
+            df[col] = df[col].astype('str').where(df[col].notna())
+        else:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    validas = df[REQUIRED_COLUMNS].notna().all(axis=1)
+    validas &= df['latitude'].between(-90, 90) & df['longitude'].between(-180, 180)
+    descartadas = int((~validas).sum())
+    if descartadas and verbose:
+        print(f"(Paradas) {descartadas} registros descartados (colunas obrigatórias ausentes ou coordenadas inválidas).")
+    df = df[validas].astype({'ordem_parada': 'int64'})
+    return df.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable').reset_index(drop=True)
+
+
+def file_version(filepath: str, file_hash: str | None = None) -> str:
+    """
+    Versão da tabela lida de um arquivo: hash do arquivo + versão do formato, sem percorrer a
+    tabela. Para build_graph/load_region_graph(table_version=...) quando a tabela passada é
+    exatamente a de load_stops(filepath), sem recortes nem alterações.
+    """
+    file_hash = file_hash or hash_file(filepath)
+    return hashlib.sha256(f"arquivo={file_hash}|tabela={STOP_TABLE_VERSION}".encode('utf-8')).hexdigest()[:32]
+
+
+def stops_version(df: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo da tabela de paradas (usado nas chaves dos caches). Calculado sempre a partir
+    dos dados (~6 ms na rede completa): o pandas copia os attrs para recortes e cópias alteradas,
+    então uma versão guardada neles não identifica a tabela (como em stop_index._table_version).
+    Quem já conhece a versão pode informá-la em build_graph(table_version=...).
+    """
+    digest = hashlib.sha256(f"tabela={STOP_TABLE_VERSION}|{'|'.join(df.columns)}".encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _stops_cache_path(cache_dir: str, file_hash: str) -> str:
+    return os.path.join(cache_dir, f"stops-{file_hash[:32]}-v{STOP_TABLE_VERSION}.npz")
+
+
+def _save_stops(df: pd.DataFrame, path: str):
+    """Grava a tabela em colunas (.npz, sem pickle); texto codificado como dicionário."""
+    arrays = {'columns': np.array(df.columns.tolist(), dtype=str)}
+    for i, col in enumerate(df.columns):
+        if STOP_SCHEMA.get(col, 'str') == 'str':
+            codes, vocab = pd.factorize(df[col])
+            arrays[f'col{i}__codes'] = codes.astype(np.int32)
+            arrays[f'col{i}__vocab'] = np.array(vocab.tolist() or [""], dtype=str)
+        else:
+            arrays[f'col{i}__values'] = df[col].to_numpy()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load_stops_file(path: str) -> pd.DataFrame:
+    with np.load(path, allow_pickle=False) as data:
+        columns = {}
+        for i, col in enumerate(data['columns'].tolist()):
+            if f'col{i}__values' in data.files:
+                columns[col] = data[f'col{i}__values']
+            else:
+                vocab = np.append(data[f'col{i}__vocab'].astype(object), None)  # código -1 -> ausente
+                columns[col] = pd.array(vocab[data[f'col{i}__codes']], dtype='str')
+    return pd.DataFrame(columns)
+
+
+def load_stops(filepath: str, use_cache: bool = True, cache_dir: str = DEFAULT_STOPS_CACHE_DIR) -> pd.DataFrame:
+    """
+    Carrega a tabela de paradas validada de um CSV geocodificado.
+
+    A tabela é memorizada em processo e em disco pela chave do conteúdo do arquivo; chamadas
+    repetidas não relêem nem reprocessam o CSV. Retorna uma cópia, que pode ser alterada livremente.
+    Levanta FileNotFoundError se o arquivo não existir e ValueError se faltarem colunas obrigatórias.
+    """
+    file_hash = hash_file(filepath)
+    chave = os.path.abspath(filepath)
+    memo = _stops_memo.get(chave) if use_cache else None
+    if memo is not None and memo[0] == file_hash:
+        return memo[1].copy()
+
+    df = None
+    cache_path = _stops_cache_path(cache_dir, file_hash)
+    if use_cache and os.path.exists(cache_path):
+        try:
+            df = _load_stops_file(cache_path)
+        except Exception as e:
+            print(f"(Paradas) Erro ao ler o cache '{cache_path}': {e}. Relendo o CSV.")
+            df = None
+    if df is None:
+        df = prepare_stops(pd.read_csv(filepath))
+        if use_cache:
+            try:
+                _save_stops(df, cache_path)
+            except OSError as e:
+                print(f"(Paradas) Não foi possível salvar o cache '{cache_path}': {e}")
+    if use_cache:
+        _stops_memo[chave] = (file_hash, df)
+    return df.copy()
+
+
+def _build_coordinate_graph(stops: pd.DataFrame, units_per_km: float) -> nx.DiGraph:
+    """
+    Nós = coordenada (lat, lon), agregando ids, endereços, linhas, sentidos e ordens do ponto.
+    Arestas ligam coordenadas consecutivas de cada linha/sentido; em trechos compartilhados,
+    'numero_linha'/'nome_linha' ficam com a última linha processada.
+    """
+    G = nx.DiGraph()
+    df = stops.copy()
+    for col in ['endereco_geocodificado', 'nome_linha']:
+        if col not in df.columns:
+            df[col] = None
+
+    def unicos_texto(serie):
+        return [str(v) for v in pd.unique(serie.dropna())]
+
+    agregados = df.groupby(['latitude', 'longitude'], sort=True).agg(
+        ids=('id_parada', unicos_texto),
+        enderecos=('endereco_geocodificado', unicos_texto),
+        linhas=('nome_linha', unicos_texto),
+        numeros_linha=('numero_linha', unicos_texto),
+        sentidos=('sentido', unicos_texto),
+        ordens=('ordem_parada', unicos_texto),
+    )
+    G.add_nodes_from(((lat, lon), {**data, 'lat': lat, 'lon': lon})
+                     for (lat, lon), data in zip(agregados.index, agregados.to_dict('records')))
+
+    # Pares consecutivos dentro de cada linha/sentido (tabela já ordenada por prepare_stops)
+    df = df.sort_values(by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable')
+    mesma_sequencia = (df['numero_linha'].eq(df['numero_linha'].shift())
+                       & df['sentido'].eq(df['sentido'].shift()))
+    lat_ant, lon_ant = df['latitude'].shift(), df['longitude'].shift()
+    mask = mesma_sequencia & ((lat_ant != df['latitude']) | (lon_ant != df['longitude']))
+
+    distancias = {}
+    for lat0, lon0, lat1, lon1, numero, nome in zip(lat_ant[mask], lon_ant[mask], df['latitude'][mask],
+                                                    df['longitude'][mask], df['numero_linha'][mask], df['nome_linha'][mask]):
+        par = ((lat0, lon0), (lat1, lon1))
+        if par not in distancias:
+            distancias[par] = geodesic(par[0], par[1]).km * units_per_km
+        G.add_edge(par[0], par[1], weight=distancias[par], numero_linha=numero, nome_linha=nome)
+    return G
+
+
+def build_graph(stops: pd.DataFrame, node_key: str = 'nome', weight_unit: str = 'km',
+                use_cache: bool = True, cache_dir: str = DEFAULT_GRAPH_CACHE_DIR,
+                max_entries: int = 5, max_changed_fraction: float = 0.25,
+                merge_tolerance_m: float | None = None, table_version: str | None = None) -> nx.DiGraph | None:
+    """
+    Constrói (ou obtém dos caches) o grafo de transporte a partir da tabela de paradas.
+
+    Args:
+        stops: Tabela de load_stops/prepare_stops.
+        node_key: 'nome' (nós = 'parada_nome') ou 'coordenada' (nós = (lat, lon)).
+        weight_unit: Unidade do peso 'weight' das arestas: 'km' ou 'm'.
+        use_cache: Usa a memória em processo e o cache em disco.
+        cache_dir: Diretório do cache versionado de grafos.
+        max_entries: Versões mantidas no cache (descarte LRU).
+        max_changed_fraction: Para node_key='nome', fração máxima de linhas alteradas para
+            atualizar incrementalmente a versão anterior do cache em vez de reconstruir.
+        merge_tolerance_m: Se informado, une antes as paradas que são a mesma parada física
+            (stop_clustering.deduplicate_stops, com esta tolerância em metros).
+        table_version: Versão de `stops` já conhecida pelo chamador (ex.: file_version do CSV de
+            origem), usada na chave do cache no lugar de stops_version (ver _graph_key).
+
+    Returns:
+        O grafo (com graph['versao'] = chave do cache), ou None se a tabela não tiver as
+        colunas necessárias. O objeto é compartilhado entre chamadas: use graph.copy()
+        antes de alterar sua estrutura (colunas de peso de weight_models podem ser adicionadas).
+    """
+    if node_key not in NODE_KEYS:
+        raise ValueError(f"node_key deve ser um de {NODE_KEYS}, não '{node_key}'.")
+    if weight_unit not in UNITS_PER_KM:
+        raise ValueError(f"weight_unit deve ser um de {tuple(UNITS_PER_KM)}, não '{weight_unit}'.")
+    if node_key == 'nome' and 'parada_nome' not in stops.columns:
+        print("(Grafo) A tabela de paradas não tem a coluna 'parada_nome'; use node_key='coordenada'.")
+        return None
+    chave, builder_version = _graph_key(stops, node_key, weight_unit, table_version, merge_tolerance_m)
+    if use_cache and chave in _graph_memo:
+        return _graph_memo[chave]
+    if merge_tolerance_m is not None and 'parada_nome' in stops.columns:
+        stops, _ = stop_clustering.deduplicate_stops(stops, merge_tolerance_m, verbose=False)
+
+    atributos = {'chave_nos': node_key, 'unidade_peso': weight_unit, 'versao_construtor': builder_version,
+                 'tolerancia_agrupamento_m': merge_tolerance_m}
+    store = GraphStore(cache_dir, max_entries=max_entries) if use_cache else None
+    G = None
+    if store is not None:
+        armazenado = store.load(chave)
+        if armazenado is not None:
+            G = armazenado.graph
+        elif node_key == 'nome' and weight_unit == 'km':
+            G = _patch_latest(store, chave, stops, atributos, max_changed_fraction)
+
+    if G is None:
+        print(f"(Grafo) Construindo o grafo de transporte (nós por {node_key}, pesos em {weight_unit})...")
+        if node_key == 'nome':
+            G = graph_analysis.create_transport_graph(stops)
+            if weight_unit != 'km':
+                for _, _, data in G.edges(data=True):
+                    data['weight'] *= UNITS_PER_KM[weight_unit]
+        else:
+            G = _build_coordinate_graph(stops, UNITS_PER_KM[weight_unit])
+        G.graph.update(atributos)
+        G.graph['versao'] = chave
+        if store is not None and G.number_of_nodes() > 0:
+            store.save(chave, G)
+
+    if store is not None and G.number_of_nodes() > 0:
+        tiles = tile_store.TiledGraphStore(os.path.join(cache_dir, TILES_SUBDIR), max_entries=max_entries)
+        if not tiles.has(chave):
+            tiles.save(chave, G)
+    if use_cache:
+        _graph_memo[chave] = G
+    return G
+
+
+def _graph_key(stops: pd.DataFrame, node_key: str, weight_unit: str, table_version: str | None = None,
+               merge_tolerance_m: float | None = None) -> tuple[str, int]:
+    """
+    Chave do grafo (versão da tabela + parâmetros do construtor) e versão do construtor.
+    A versão é a da tabela antes da deduplicação por `merge_tolerance_m`: `table_version`, se
+    informada, ou o hash do conteúdo (stops_version).
+    """
+    builder_version = graph_analysis.GRAPH_BUILDER_VERSION if node_key == 'nome' else COORDINATE_BUILDER_VERSION
+    versao = table_version or stops_version(stops)
+    if merge_tolerance_m is not None:
+        versao = f"{versao}|agrupamento={merge_tolerance_m}"
+    chave = hashlib.sha256(f"{versao}|{node_key}|{weight_unit}|builder={builder_version}"
+                           .encode('utf-8')).hexdigest()[:32]
+    return chave, builder_version
+
+
+def load_region_graph(stops: pd.DataFrame, bounds: tuple[float, float, float, float], node_key: str = 'nome',
+                      weight_unit: str = 'km', cache_dir: str = DEFAULT_GRAPH_CACHE_DIR,
+                      include_boundary: bool = False, merge_tolerance_m: float | None = None,
+                      table_version: str | None = None) -> nx.DiGraph | None:
+    """
+    Grafo das paradas dentro de `bounds` = (lat_min, lat_max, lon_min, lon_max).
+
+    Se a versão do grafo já foi particionada em disco, lê só os ladrilhos que cruzam a região
+    (tile_store.TiledGraphStore.load_region), sem montar a rede inteira; caso contrário, constrói
+    o grafo completo (build_graph, que o particiona) e recorta a região. Sem `include_boundary`,
+    o resultado é o subgrafo induzido pelas paradas da região; com `include_boundary`, as arestas
+    que saem da região são mantidas, com as paradas do outro lado marcadas com 'borda' = True.
+    O grafo regional é um objeto novo a cada chamada, com versão própria em graph['versao'].
+    A chave dos ladrilhos é a de build_graph (_graph_key), calculada antes da deduplicação por
+    `merge_tolerance_m`: quando a região já está em disco, a tabela não é deduplicada (e, com
+    `table_version`, nem percorrida).
+    """
+    if node_key == 'nome' and 'parada_nome' not in stops.columns:
+        print("(Grafo) A tabela de paradas não tem a coluna 'parada_nome'; use node_key='coordenada'.")
+        return None
+    chave, _ = _graph_key(stops, node_key, weight_unit, table_version, merge_tolerance_m)
+    if chave not in _graph_memo:
+        tiles = tile_store.TiledGraphStore(os.path.join(cache_dir, TILES_SUBDIR))
+        G = tiles.load_region(chave, bounds, include_boundary)
+        if G is not None:
+            print(f"(Ladrilhos) Região carregada de {len(tiles.tiles_in(chave, bounds))} ladrilhos: "
+                  f"{G.number_of_nodes()} nós e {G.number_of_edges()} arestas.")
+            return G
+    G = build_graph(stops, node_key=node_key, weight_unit=weight_unit, cache_dir=cache_dir,
+                    merge_tolerance_m=merge_tolerance_m, table_version=table_version)
+    if G is None:
+        return None
+    return tile_store.region_subgraph(G, bounds, include_boundary)
+
+
+def load_region_graphs(stops: pd.DataFrame, region_list: list[regions.Region], node_key: str = 'nome',
+                       weight_unit: str = 'km', cache_dir: str = DEFAULT_GRAPH_CACHE_DIR,
+                       include_boundary: bool = False, merge_tolerance_m: float | None = None,
+                       table_version: str | None = None) -> dict[str, nx.DiGraph] | None:
+    """
+    Grafo de cada região poligonal (nome -> grafo), como load_region_graph: de cada região são
+    lidos só os ladrilhos que cruzam seu retângulo envolvente, seguidos do teste do polígono
+    (regions.load_region_subgraphs); sem ladrilhos da versão, constrói o grafo completo e o
+    recorta (regions.region_subgraphs). O resultado é o mesmo nos dois casos.
+    """
+    if node_key == 'nome' and 'parada_nome' not in stops.columns:
+        print("(Grafo) A tabela de paradas não tem a coluna 'parada_nome'; use node_key='coordenada'.")
+        return None
+    chave, _ = _graph_key(stops, node_key, weight_unit, table_version, merge_tolerance_m)
+    tiles = tile_store.TiledGraphStore(os.path.join(cache_dir, TILES_SUBDIR))
+    subgrafos = regions.load_region_subgraphs(tiles, chave, region_list, include_boundary)
+    if subgrafos is not None:
+        lidos = {nome for region in region_list for nome in tiles.tiles_in(chave, region.bounds)}
+        print(f"(Ladrilhos) {len(region_list)} região(ões) carregada(s) de {len(lidos)} ladrilhos.")
+        return subgrafos
+    G = build_graph(stops, node_key=node_key, weight_unit=weight_unit, cache_dir=cache_dir,
+                    merge_tolerance_m=merge_tolerance_m, table_version=table_version)
+    if G is None:
+        return None
+    return regions.region_subgraphs(G, region_list, include_boundary)
+
+
+def _patch_latest(store: GraphStore, chave: str, stops: pd.DataFrame, atributos: dict,
+                  max_changed_fraction: float) -> nx.DiGraph | None:
+    """
+    Atualiza incrementalmente a versão compatível mais recente do cache quando poucas linhas
+    mudaram (graph_analysis.patch_graph_lines) e a salva sob a nova chave.
+    Retorna None se não houver versão anterior compatível ou se muitas linhas mudaram.
+    """
+    anterior = store.load_latest(exclude=chave, graph_attrs=atributos)
+    if anterior is None:
+        return None
+    G = anterior.graph
+    linhas_alteradas = graph_analysis.changed_lines(G, stops)
+    total_linhas = max(1, stops['numero_linha'].nunique())
+    if len(linhas_alteradas) > max_changed_fraction * total_linhas:
+        print(f"(Cache do Grafo) {len(linhas_alteradas)} de {total_linhas} linhas alteradas. Reconstruindo o grafo.")
+        return None
+
+    alteracoes = graph_analysis.patch_graph_lines(G, stops, linhas_alteradas, new_version=chave)
+    print(f"(Cache do Grafo) Grafo atualizado incrementalmente ({len(linhas_alteradas)} linhas: "
+          f"{', '.join(linhas_alteradas) or 'nenhuma'}; "
+          f"{len(alteracoes['arestas_adicionadas'])} arestas adicionadas, "
+          f"{len(alteracoes['arestas_removidas'])} removidas, "
+          f"{len(alteracoes['arestas_alteradas'])} alteradas).")
+    store.save(chave, G)
+    return G
+
+
+def clear_memo():
+    """Esvazia a memória em processo (os caches em disco são mantidos)."""
+    _stops_memo.clear()
+    _graph_memo.clear()
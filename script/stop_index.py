@@ -0,0 +1,135 @@
+"""
+Índice parada -> linhas (e sentidos / posições nos itinerários).
+
+Os geradores de mapas e relatórios consultam, para cada parada, as linhas que passam por ela.
+Filtrar a tabela de itinerários uma vez por parada custa O(paradas × registros); aqui a
+tabela é agrupada uma única vez (pd.factorize + ordenação estável) e cada consulta é um
+acesso a dicionário. A ordem das linhas de cada parada é a de aparição na tabela, a mesma
+de df[df['parada_nome'] == parada]['numero_linha'].unique().
+
+get_stop_line_index memoriza o índice pelo hash do conteúdo da tabela, de modo que todos
+os geradores que recebem a mesma tabela reutilizam o mesmo índice.
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MEMO_MAX_ENTRIES = 8
+NODE_KEYS = ('nome', 'coordenada')
+
+
+class StopLineIndex:
+    """
+    Relação parada -> linhas / sentidos / posições.
+
+    Atributos:
+        node_key: 'nome' (paradas = 'parada_nome') ou 'coordenada' (paradas = (lat, lon)),
+            como em stop_data.build_graph.
+        stops: Lista de paradas, na ordem de primeira aparição na tabela.
+    """
+
+    def __init__(self, node_key: str, stops: list, lines: list[list], directions: list[list], positions: list[list]):
+        self.node_key = node_key
+        self.stops = stops
+        self._lines = dict(zip(stops, lines))
+        self._directions = dict(zip(stops, directions))
+        self._positions = dict(zip(stops, positions))
+
+    @classmethod
+    def from_stops(cls, stops: pd.DataFrame, node_key: str = 'nome') -> "StopLineIndex":
+        """Constrói o índice a partir da tabela de itinerários/paradas em uma única passada agrupada."""
+        if node_key not in NODE_KEYS:
+            raise ValueError(f"node_key deve ser um de {NODE_KEYS}, não '{node_key}'.")
+        if node_key == 'nome':
+            df = stops.dropna(subset=['parada_nome'])
+            keys = df['parada_nome'].to_numpy()
+        else:
+            df = stops.dropna(subset=['latitude', 'longitude'])
+            keys = pd.Series(list(zip(df['latitude'].tolist(), df['longitude'].tolist())), dtype=object)
+        if df.empty:
+            return cls(node_key, [], [], [], [])
+        codes, uniques = pd.factorize(keys)
+        order = np.argsort(codes, kind='stable')  # dentro de cada parada, mantém a ordem da tabela
+        limites = np.flatnonzero(np.diff(codes[order])) + 1
+
+        def por_parada(column: str) -> list:
+            if column not in df.columns:
+                values = np.full(len(df), None, dtype=object)
+            else:
+                values = df[column].to_numpy(dtype=object)
+            return np.split(values[order], limites)
+
+        linhas, sentidos, ordens = por_parada('numero_linha'), por_parada('sentido'), por_parada('ordem_parada')
+        lines, directions, positions = [], [], []
+        for ls, ss, os_ in zip(linhas, sentidos, ordens):
+            registros = list(zip(ls.tolist(), ss.tolist(), os_.tolist()))
+            lines.append(list(dict.fromkeys(l for l in ls.tolist() if l is not None)))
+            directions.append(list(dict.fromkeys((l, s) for l, s, _ in registros)))
+            positions.append(registros)
+        return cls(node_key, list(uniques), lines, directions, positions)
+
+    def __len__(self) -> int:
+        return len(self.stops)
+
+    def __contains__(self, stop) -> bool:
+        return stop in self._lines
+
+    def lines(self, stop) -> list:
+        """Linhas ('numero_linha') que passam pela parada, na ordem de aparição na tabela."""
+        return self._lines.get(stop, [])
+
+    def directions(self, stop) -> list[tuple]:
+        """Pares (linha, sentido) que passam pela parada."""
+        return self._directions.get(stop, [])
+
+    def positions(self, stop) -> list[tuple]:
+        """Posições da parada nos itinerários: (linha, sentido, ordem_parada) de cada registro."""
+        return self._positions.get(stop, [])
+
+    def lines_label(self, stop, separator: str = ", ", empty: str = "") -> str:
+        """Linhas da parada como texto (ex.: popups de mapas)."""
+        linhas = self.lines(stop)
+        return separator.join(str(l) for l in linhas) if linhas else empty
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Uma linha por parada: linhas, número de linhas e número de pares (linha, sentido)."""
+        return pd.DataFrame({
+            'parada': self.stops,
+            'linhas': [", ".join(str(l) for l in self._lines[s]) for s in self.stops],
+            'n_linhas': [len(self._lines[s]) for s in self.stops],
+            'n_linha_sentido': [len(self._directions[s]) for s in self.stops],
+        })
+
+
+_index_memo: "OrderedDict[tuple, StopLineIndex]" = OrderedDict()
+
+
+def _table_version(stops: pd.DataFrame) -> str:
+    """
+    Hash do conteúdo das colunas usadas pelo índice. Calculado sempre a partir dos dados: tabelas
+    filtradas herdam os attrs (e a 'versao_paradas') da tabela original.
+    """
+    colunas = [c for c in ('parada_nome', 'latitude', 'longitude', 'numero_linha', 'sentido', 'ordem_parada')
+               if c in stops.columns]
+    digest = hashlib.sha256("|".join(colunas).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(stops[colunas], index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def get_stop_line_index(stops: pd.DataFrame, node_key: str = 'nome') -> StopLineIndex:
+    """
+    Retorna o índice da tabela, construindo-o na primeira chamada. Memorizado pelo hash do
+    conteúdo da tabela (as últimas MEMO_MAX_ENTRIES tabelas).
+    """
+    chave = (_table_version(stops), node_key)
+    index = _index_memo.get(chave)
+    if index is None:
+        index = StopLineIndex.from_stops(stops, node_key)
+        _index_memo[chave] = index
+        while len(_index_memo) > MEMO_MAX_ENTRIES:
+            _index_memo.popitem(last=False)
+    else:
+        _index_memo.move_to_end(chave)
+    return index
@@ -0,0 +1,261 @@
+"""
+Otimização da posição de novas paradas (máxima cobertura / p-mediana).
+
+Em vez de sugerir uma parada no ponto médio de cada lacuna (gap_detection), escolhe K novas
+posições entre pontos candidatos amostrados ao longo do percurso das linhas existentes
+(segmentos entre paradas consecutivas de cada itinerário), de modo a:
+    - 'cobertura': maximizar a demanda (células da grade ou população) a até 400 m de uma
+      parada que hoje não está coberta;
+    - 'mediana': minimizar a distância média ponderada da demanda até a parada mais próxima
+      (heurística gulosa para o problema das p-medianas, com distâncias limitadas a um raio).
+
+Os conjuntos de cobertura (quais pontos de demanda cada candidato alcança) saem de uma única
+consulta a uma KD-tree da demanda e ficam em uma matriz esparsa (scipy.sparse.csr_matrix,
+candidatos x pontos). A escolha é gulosa com avaliação preguiçosa (lazy greedy): como o ganho
+de um candidato só diminui à medida que outros são escolhidos, o ganho guardado no heap é um
+limite superior e só o topo precisa ser recalculado.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+import routing
+from coverage import DEFAULT_THRESHOLD_M, compute_coverage
+from spatial_index import StopSpatialIndex, _chord_to_km, _km_to_chord, _unit_vectors
+from stop_data import MAX_PLAUSIBLE_SEGMENT_M
+
+DEFAULT_CANDIDATE_SPACING_M = 100.0
+# Segmentos mais longos que isso entre paradas consecutivas costumam ser erro de geocodificação
+DEFAULT_MAX_SEGMENT_M = MAX_PLAUSIBLE_SEGMENT_M
+# Raio das distâncias consideradas no modo 'mediana' (demanda mais distante conta como este valor)
+DEFAULT_MEDIAN_RADIUS_M = 1200.0
+METHODS = ('cobertura', 'mediana')
+
+
+def candidate_points(stops: pd.DataFrame, spacing_m: float = DEFAULT_CANDIDATE_SPACING_M,
+                     max_segment_m: float = DEFAULT_MAX_SEGMENT_M) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pontos candidatos a nova parada, a cada `spacing_m` metros ao longo dos segmentos entre
+    paradas consecutivas de cada itinerário (linha e sentido). Segmentos mais longos que
+    `max_segment_m` são ignorados. Pontos de linhas diferentes no mesmo trecho são unificados
+    (arredondados a uma grade de `spacing_m` / 2).
+
+    Returns:
+        (latitudes, longitudes) dos candidatos.
+    """
+    df = stops.dropna(subset=['latitude', 'longitude']).sort_values(
+        by=['numero_linha', 'sentido', 'ordem_parada'], kind='stable')
+    grupos = (df['numero_linha'].astype(str) + "|" + df['sentido'].astype(str)).to_numpy(dtype=object)
+    lats, lons = df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float)
+    if len(lats) < 2:
+        return np.empty(0), np.empty(0)
+
+    seg_m = routing.haversine_km(lats[:-1], lons[:-1], lats[1:], lons[1:]) * 1000.0
+    valid = (grupos[:-1] == grupos[1:]) & (seg_m > 0) & (seg_m <= max_segment_m)
+    lat0, lon0, lat1, lon1, seg_m = lats[:-1][valid], lons[:-1][valid], lats[1:][valid], lons[1:][valid], seg_m[valid]
+    if not len(seg_m):
+        return np.empty(0), np.empty(0)
+
+    # Interpolação linear de todos os segmentos de uma vez: n_i pontos no segmento i (inclui as pontas)
+    n_points = np.ceil(seg_m / spacing_m).astype(np.int64) + 1
+    seg = np.repeat(np.arange(len(seg_m)), n_points)
+    starts = np.concatenate([[0], np.cumsum(n_points)[:-1]])
+    frac = (np.arange(len(seg)) - starts[seg]) / (n_points[seg] - 1)
+    cand_lat = lat0[seg] + (lat1[seg] - lat0[seg]) * frac
+    cand_lon = lon0[seg] + (lon1[seg] - lon0[seg]) * frac
+
+    # Deduplicação em uma grade de meio espaçamento
+    step_lat = (spacing_m / 2.0) / 111_320.0
+    step_lon = step_lat / np.cos(np.radians(np.mean(cand_lat)))
+    keys = np.column_stack([np.round(cand_lat / step_lat), np.round(cand_lon / step_lon)]).astype(np.int64)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    first = np.sort(first)
+    return cand_lat[first], cand_lon[first]
+
+
+def coverage_matrix(cand_lats, cand_lons, demand_lats, demand_lons, radius_m: float) -> sparse.csr_matrix:
+    """
+    Matriz esparsa candidatos x pontos de demanda com a distância (metros) de cada par a até
+    `radius_m` metros. Uma única consulta em lote à KD-tree da demanda.
+    """
+    demand_tree = cKDTree(_unit_vectors(demand_lats, demand_lons))
+    cand_vectors = _unit_vectors(cand_lats, cand_lons)
+    neighbors = demand_tree.query_ball_point(cand_vectors, _km_to_chord(radius_m / 1000.0))
+    counts = np.fromiter((len(n) for n in neighbors), dtype=np.int64, count=len(neighbors))
+    indptr = np.concatenate([[0], np.cumsum(counts)])
+    indices = np.fromiter((j for n in neighbors for j in n), dtype=np.int64, count=int(indptr[-1]))
+    rows = np.repeat(np.arange(len(cand_lats)), counts)
+    dist_m = _chord_to_km(np.linalg.norm(demand_tree.data[indices] - cand_vectors[rows], axis=1)) * 1000.0
+    # Distância 0 vira um valor mínimo para não ser descartada como zero implícito da matriz esparsa
+    matrix = sparse.csr_matrix((np.maximum(dist_m, 1e-6), indices, indptr),
+                               shape=(len(cand_lats), len(demand_lats)))
+    matrix.sort_indices()
+    return matrix
+
+
+class PlacementResult:
+    """
+    Resultado da otimização de novas paradas.
+
+    Atributos:
+        selected: DataFrame com as paradas escolhidas, na ordem de escolha ('posicao', 'latitude',
+            'longitude', 'ganho', 'cobertura_acumulada'). 'ganho' é a demanda passada a coberta
+            ('cobertura') ou a redução da distância média, em metros ('mediana').
+        method: 'cobertura' ou 'mediana'.
+        threshold_m: Raio de cobertura (metros).
+        covered_before, covered_after: Fração (ponderada) da demanda a até `threshold_m` de uma
+            parada, antes e depois das novas paradas.
+        mean_distance_before, mean_distance_after: Distância média ponderada até a parada mais
+            próxima (metros).
+        n_candidates: Número de candidatos avaliados.
+    """
+
+    def __init__(self, selected: pd.DataFrame, method: str, threshold_m: float, covered_before: float,
+                 covered_after: float, mean_distance_before: float, mean_distance_after: float, n_candidates: int):
+        self.selected = selected
+        self.method = method
+        self.threshold_m = threshold_m
+        self.covered_before = covered_before
+        self.covered_after = covered_after
+        self.mean_distance_before = mean_distance_before
+        self.mean_distance_after = mean_distance_after
+        self.n_candidates = n_candidates
+
+    def __len__(self) -> int:
+        return len(self.selected)
+
+    def add_to_map(self, folium_map, name: str = "Novas paradas sugeridas", color: str = "darkgreen"):
+        """Adiciona as paradas escolhidas (com o círculo de cobertura) como camada do mapa Folium."""
+        import folium
+        layer = folium.FeatureGroup(name=name)
+        for _, parada in self.selected.iterrows():
+            folium.Circle(location=[parada['latitude'], parada['longitude']], radius=self.threshold_m,
+                          color=color, weight=1, fill=True, fill_opacity=0.08).add_to(layer)
+            folium.Marker(location=[parada['latitude'], parada['longitude']],
+                          tooltip=f"Nova parada #{int(parada['posicao'])} (ganho: {parada['ganho']:.1f})",
+                          icon=folium.Icon(color='green', icon='plus')).add_to(layer)
+        layer.add_to(folium_map)
+        return folium_map
+
+
+def _lazy_greedy(initial_gains: np.ndarray, k: int, gain_of, accept) -> list[tuple[int, float]]:
+    """
+    Seleção gulosa preguiçosa: `gain_of(i)` calcula o ganho atual do candidato i e `accept(i)`
+    atualiza o estado. Os ganhos no heap são limites superiores (o ganho só diminui); o topo é
+    recalculado e aceito se continuar maior ou igual ao próximo.
+    """
+    positive = np.flatnonzero(initial_gains > 0)
+    heap = list(zip((-initial_gains[positive]).tolist(), positive.tolist()))
+    heapq.heapify(heap)
+    chosen = []
+    while heap and len(chosen) < k:
+        _, i = heapq.heappop(heap)
+        gain = gain_of(i)
+        if gain <= 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        accept(i)
+        chosen.append((i, gain))
+    return chosen
+
+
+def optimize_stop_placement(stops: pd.DataFrame, demand_lats, demand_lons, k: int, weights=None,
+                            method: str = 'cobertura', threshold_m: float = DEFAULT_THRESHOLD_M,
+                            spacing_m: float = DEFAULT_CANDIDATE_SPACING_M,
+                            median_radius_m: float = DEFAULT_MEDIAN_RADIUS_M,
+                            candidates: tuple[np.ndarray, np.ndarray] | None = None) -> PlacementResult | None:
+    """
+    Escolhe `k` novas paradas entre candidatos ao longo das linhas existentes.
+
+    Args:
+        stops: Tabela de paradas (stop_data.load_stops); define as paradas existentes e o percurso das linhas.
+        demand_lats, demand_lons: Pontos de demanda (células de coverage.make_grid ou domicílios).
+        k: Número de novas paradas.
+        weights: Peso de cada ponto de demanda (ex.: população) ou None (todos valem 1).
+        method: 'cobertura' (máxima cobertura a até `threshold_m`) ou 'mediana' (p-mediana).
+        threshold_m: Raio de cobertura de uma parada (metros).
+        spacing_m: Espaçamento dos candidatos ao longo das linhas (metros).
+        median_radius_m: Raio das distâncias consideradas no modo 'mediana'.
+        candidates: (latitudes, longitudes) de candidatos próprios, no lugar de candidate_points.
+
+    Returns:
+        PlacementResult, ou None se `method` for inválido ou não houver candidatos/demanda.
+    """
+    if method not in METHODS:
+        print(f"Método de otimização inválido: '{method}'. Use um de {METHODS}.")
+        return None
+    demand_lats, demand_lons = np.asarray(demand_lats, dtype=float), np.asarray(demand_lons, dtype=float)
+    weights = np.ones(len(demand_lats)) if weights is None else np.asarray(weights, dtype=float)
+    cand_lats, cand_lons = candidates if candidates is not None else candidate_points(stops, spacing_m)
+    if not len(cand_lats) or not len(demand_lats):
+        print("Sem candidatos ou pontos de demanda para otimizar.")
+        return None
+
+    # Situação atual: distância de cada ponto de demanda até a parada existente mais próxima
+    existing = compute_coverage(StopSpatialIndex.from_stops(stops), demand_lats, demand_lons)
+    radius_m = threshold_m if method == 'cobertura' else max(median_radius_m, threshold_m)
+    current = np.minimum(existing.distances_m, radius_m)
+    matrix = coverage_matrix(cand_lats, cand_lons, demand_lats, demand_lons, radius_m)
+    indptr, indices, dists = matrix.indptr, matrix.indices, matrix.data
+    rows = np.repeat(np.arange(len(cand_lats)), np.diff(indptr))
+    total = weights.sum()
+
+    # Ganho inicial de todos os candidatos de uma vez (soma por linha da matriz esparsa)
+    if method == 'cobertura':
+        covered = existing.distances_m <= threshold_m
+        initial = np.bincount(rows, weights=(weights * ~covered)[indices], minlength=len(cand_lats))
+
+        def gain_of(i):
+            cols = indices[indptr[i]:indptr[i + 1]]
+            return float(weights[cols][~covered[cols]].sum())
+
+        def accept(i):
+            covered[indices[indptr[i]:indptr[i + 1]]] = True
+    else:
+        initial = np.bincount(rows, weights=weights[indices] * np.maximum(current[indices] - dists, 0.0),
+                              minlength=len(cand_lats)) / total
+
+        def gain_of(i):
+            cols, d = indices[indptr[i]:indptr[i + 1]], dists[indptr[i]:indptr[i + 1]]
+            return float((weights[cols] * np.maximum(current[cols] - d, 0.0)).sum()) / total
+
+        def accept(i):
+            cols, d = indices[indptr[i]:indptr[i + 1]], dists[indptr[i]:indptr[i + 1]]
+            current[cols] = np.minimum(current[cols], d)
+
+    chosen = _lazy_greedy(initial, k, gain_of, accept)
+    positions = np.array([i for i, _ in chosen], dtype=np.int64)
+
+    # Cobertura acumulada a cada parada escolhida (a matriz tem todos os pares a até threshold_m)
+    covered_now = existing.distances_m <= threshold_m
+    cumulative = []
+    for i in positions.tolist():
+        cols, d = indices[indptr[i]:indptr[i + 1]], dists[indptr[i]:indptr[i + 1]]
+        covered_now[cols[d <= threshold_m]] = True
+        cumulative.append(float(weights[covered_now].sum() / total))
+
+    # Distância média até a parada mais próxima, com as paradas existentes e as novas
+    new_index = StopSpatialIndex(list(zip(cand_lats[positions].tolist(), cand_lons[positions].tolist())),
+                                 cand_lats[positions], cand_lons[positions])
+    _, new_km = new_index.nearest_many(demand_lats, demand_lons, workers=-1)
+    after_m = np.minimum(existing.distances_m, new_km * 1000.0)
+
+    selected = pd.DataFrame({
+        'posicao': np.arange(1, len(positions) + 1),
+        'latitude': cand_lats[positions],
+        'longitude': cand_lons[positions],
+        'ganho': [gain for _, gain in chosen],
+        'cobertura_acumulada': cumulative,
+    })
+    return PlacementResult(
+        selected, method, threshold_m,
+        covered_before=float(weights[existing.distances_m <= threshold_m].sum() / total),
+        covered_after=float(weights[after_m <= threshold_m].sum() / total),
+        mean_distance_before=float((weights * existing.distances_m).sum() / total),
+        mean_distance_after=float((weights * after_m).sum() / total),
+        n_candidates=len(cand_lats))
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+
+# Permite importar os módulos compartilhados de script/ (stop_data, od_assignment, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+import od_assignment
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"  # Rede completa
+MERGE_TOLERANCE_M = 25.0  # Une registros da mesma parada física antes de montar o grafo
+# CSV de demanda (lat_origem, lon_origem, lat_destino, lon_destino, viagens). Sem o arquivo,
+# é usada uma demanda sintética: SYNTHETIC_TRIPS viagens entre pontos sorteados perto das paradas.
+OD_FILE = "script/data/demanda_od.csv"
+SYNTHETIC_TRIPS = 200_000
+SYNTHETIC_SPREAD_M = 300  # Desvio-padrão da distância entre o ponto sorteado e a parada
+SEED = 42
+MAX_SNAP_KM = 1.0
+TOP_N = 10
+OUTPUT_SEGMENTS = "script/tests/carregamento-od/carregamento_trechos.csv"
+OUTPUT_LINES = "script/tests/carregamento-od/carregamento_linhas.csv"
+OUTPUT_MAP = "script/tests/carregamento-od/map.html"
+MAP_CENTER_LAT, MAP_CENTER_LON = -22.9200, -42.8500
+
+
+def synthetic_demand(graph, n_trips: int, spread_m: float, seed: int) -> pd.DataFrame:
+    """Viagens entre paradas sorteadas, com origem e destino deslocados aleatoriamente da parada."""
+    rng = np.random.default_rng(seed)
+    lats = np.array([data['latitude'] for _, data in graph.nodes(data=True)], dtype=float)
+    lons = np.array([data['longitude'] for _, data in graph.nodes(data=True)], dtype=float)
+    desvio = spread_m / 111_320.0
+    origem, destino = rng.integers(len(lats), size=n_trips), rng.integers(len(lats), size=n_trips)
+    return pd.DataFrame({
+        'lat_origem': lats[origem] + rng.normal(0, desvio, n_trips),
+        'lon_origem': lons[origem] + rng.normal(0, desvio, n_trips),
+        'lat_destino': lats[destino] + rng.normal(0, desvio, n_trips),
+        'lon_destino': lons[destino] + rng.normal(0, desvio, n_trips),
+        'viagens': 1.0,
+    })
+
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    G = stop_data.build_graph(df_stops, node_key='nome', merge_tolerance_m=MERGE_TOLERANCE_M)
+    if G is None or G.number_of_nodes() == 0:
+        print("Grafo vazio. Análise cancelada.")
+        sys.exit(1)
+
+    if os.path.exists(OD_FILE):
+        demanda = od_assignment.load_od_demand(OD_FILE)
+        print(f"Demanda: {len(demanda)} registros de '{OD_FILE}'.")
+    else:
+        demanda = synthetic_demand(G, SYNTHETIC_TRIPS, SYNTHETIC_SPREAD_M, SEED)
+        print(f"Demanda sintética: {len(demanda)} viagens (semente {SEED}).")
+
+    inicio = time.perf_counter()
+    resultado = od_assignment.assign_demand(G, demanda, max_snap_km=MAX_SNAP_KM)
+    print(f"Demanda alocada em {time.perf_counter() - inicio:.2f}s.")
+    resultado.print_summary()
+
+    print("\nTrechos mais carregados:")
+    for trecho in resultado.segments.head(TOP_N).itertuples(index=False):
+        print(f"  {trecho.de} -> {trecho.para}: {trecho.viagens:.0f} viagens ({trecho.linhas})")
+    print("\nLinhas com maior carga:")
+    for linha in resultado.lines.head(TOP_N).itertuples(index=False):
+        print(f"  {linha.linha}: {linha.passageiros_km:.0f} passageiros-km, "
+              f"trecho mais carregado com {linha.viagens_trecho_max:.0f} viagens")
+
+    resultado.segments.to_csv(OUTPUT_SEGMENTS, index=False, float_format='%.6f')
+    resultado.lines.to_csv(OUTPUT_LINES, index=False, float_format='%.6f')
+    print(f"\nCargas salvas em '{OUTPUT_SEGMENTS}' e '{OUTPUT_LINES}'.")
+
+    m = folium.Map(location=[MAP_CENTER_LAT, MAP_CENTER_LON], zoom_start=12)
+    resultado.add_to_map(m)
+    folium.LayerControl().add_to(m)
+    m.save(OUTPUT_MAP)
+    print(f"Mapa '{OUTPUT_MAP}' gerado.")
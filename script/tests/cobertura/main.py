@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+
+import folium
+
+# Permite importar os módulos compartilhados de script/ (stop_data, coverage, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+from coverage import (DEFAULT_THRESHOLD_M, DISTANCE_BUCKETS, compute_coverage, compute_grid_coverage,
+                      load_points)
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded_filtered.csv"
+# Região de Itaipuaçu (mesmos limites do filtro de main.py): (lat_min, lat_max, lon_min, lon_max)
+REGION_BOUNDS = (-22.990, -22.900, -43.030, -42.870)
+CELL_SIZE_M = 50
+# CSV opcional com pontos de domicílios/população ('latitude', 'longitude' e uma coluna de peso).
+# Se existir, é usado no lugar da grade.
+POINTS_FILE = "script/data/domicilios_itaipuacu.csv"
+POINTS_WEIGHT_COLUMN = "populacao"
+OUTPUT_SUMMARY = "script/tests/cobertura/cobertura_resumo.csv"
+OUTPUT_MAP = "script/tests/cobertura/map.html"
+MAP_CENTER_LAT, MAP_CENTER_LON = -22.9367, -42.9751
+HEATMAP_MAX_POINTS = 10_000
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    if os.path.exists(POINTS_FILE):
+        lats, lons, pesos = load_points(POINTS_FILE, POINTS_WEIGHT_COLUMN)
+        resultado = compute_coverage(df_stops, lats, lons, weights=pesos)
+        print(f"Cobertura calculada para {len(resultado)} pontos de '{POINTS_FILE}' "
+              f"em {time.perf_counter() - inicio:.2f}s.")
+    else:
+        resultado = compute_grid_coverage(df_stops, REGION_BOUNDS, cell_m=CELL_SIZE_M)
+        print(f"Cobertura calculada para uma grade de {len(resultado)} células de {CELL_SIZE_M} m "
+              f"em {time.perf_counter() - inicio:.2f}s.")
+
+    resumo = resultado.summary()
+    print(f"\nDistância até a parada mais próxima:")
+    for _, faixa in resumo.iterrows():
+        print(f"  - {faixa['faixa']:<22} {faixa['percentual_peso']:6.1f}%")
+    print(f"\nÁrea a mais de {DEFAULT_THRESHOLD_M:.0f} m de qualquer parada: "
+          f"{1 - resultado.covered_fraction(DEFAULT_THRESHOLD_M):.1%}")
+    resumo.to_csv(OUTPUT_SUMMARY, index=False, float_format='%.2f')
+    print(f"Resumo salvo em '{OUTPUT_SUMMARY}'.")
+
+    # Mapa: paradas e mapa de calor das áreas descobertas
+    m = folium.Map(location=[MAP_CENTER_LAT, MAP_CENTER_LON], zoom_start=13)
+    resultado.add_heatmap_layer(m, threshold_m=DEFAULT_THRESHOLD_M, max_points=HEATMAP_MAX_POINTS)
+    paradas = folium.FeatureGroup(name="Paradas")
+    for lat, lon in resultado.stop_index.nodes:
+        folium.CircleMarker(location=[lat, lon], radius=3, color="blue", fill=True, fill_opacity=0.8).add_to(paradas)
+    paradas.add_to(m)
+    legenda = "".join(f"<div><span style='color:{cor}'>&#9632;</span> {rotulo}: {pct:.1f}%</div>"
+                      for (_, rotulo, cor), pct in zip(DISTANCE_BUCKETS, resumo['percentual_peso']))
+    m.get_root().html.add_child(folium.Element(
+        "<div style='position: fixed; bottom: 30px; left: 30px; z-index: 9999; background: white; "
+        f"padding: 8px; border: 1px solid #999; font-size: 12px'><b>Cobertura das paradas</b>{legenda}</div>"))
+    folium.LayerControl().add_to(m)
+    m.save(OUTPUT_MAP)
+    print(f"Mapa '{OUTPUT_MAP}' gerado.")
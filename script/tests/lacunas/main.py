@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+# Permite importar os módulos compartilhados de script/ (stop_data, gap_detection, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+from gap_detection import DEFAULT_MAX_GAP_M, detect_gaps, export_gaps, within_bounds
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"  # Rede completa (todas as vias e linhas)
+OUTPUT_FILE = "script/tests/lacunas/lacunas.csv"
+MAX_GAP_M = DEFAULT_MAX_GAP_M  # Mesmo limite da análise da Av. Carlos Marighella
+MAX_SEGMENT_M = stop_data.MAX_PLAUSIBLE_SEGMENT_M  # Trechos mais longos são erro de geocodificação
+REGION_BOUNDS = (-23.010, -22.830, -43.050, -42.600)  # Maricá (lat_min, lat_max, lon_min, lon_max)
+TOP_N = 15
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    fora = len(df_stops) - len(within_bounds(df_stops, REGION_BOUNDS))
+    print(f"{fora} registros de paradas fora do município descartados; trechos acima de "
+          f"{MAX_SEGMENT_M:.0f} m ignorados.")
+
+    inicio = time.perf_counter()
+    relatorio = detect_gaps(df_stops, max_gap_m=MAX_GAP_M, max_segment_m=MAX_SEGMENT_M, bounds=REGION_BOUNDS)
+    por_tipo = relatorio['tipo'].value_counts().to_dict()
+    print(f"{len(relatorio)} lacunas acima de {MAX_GAP_M:.0f} m ({por_tipo.get('rua', 0)} em vias, "
+          f"{por_tipo.get('linha', 0)} em itinerários) em {time.perf_counter() - inicio:.3f}s.")
+
+    for tipo, titulo in [('rua', "Maiores lacunas entre paradas vizinhas de uma mesma via"),
+                         ('linha', "Maiores lacunas entre paradas consecutivas de um itinerário")]:
+        print(f"\n{titulo}:")
+        for _, lacuna in relatorio[relatorio['tipo'] == tipo].head(TOP_N).iterrows():
+            print(f"  #{lacuna['posicao']:<4} {lacuna['grupo']}: {lacuna['de']} -> {lacuna['para']} "
+                  f"({lacuna['distancia_m']:.0f} m, {lacuna['faixa']})")
+
+    export_gaps(relatorio, OUTPUT_FILE)
+    print(f"\nRelatório salvo em '{OUTPUT_FILE}'.")
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+import folium
+
+# Permite importar os módulos compartilhados de script/ (stop_data, stop_placement, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+from coverage import DEFAULT_THRESHOLD_M, load_points, make_grid
+from stop_placement import candidate_points, optimize_stop_placement
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"  # Rede completa do município
+# Município de Maricá: (lat_min, lat_max, lon_min, lon_max)
+REGION_BOUNDS = (-23.010, -22.830, -43.050, -42.600)
+CELL_SIZE_M = 50
+# CSV opcional com pontos de domicílios/população (mesmo formato da análise de cobertura)
+POINTS_FILE = "script/data/domicilios_marica.csv"
+POINTS_WEIGHT_COLUMN = "populacao"
+NEW_STOPS = 20
+METHOD = 'cobertura'  # 'cobertura' (máxima cobertura) ou 'mediana' (p-mediana)
+OUTPUT_FILE = "script/tests/novas-paradas/novas_paradas.csv"
+OUTPUT_MAP = "script/tests/novas-paradas/map.html"
+MAP_CENTER_LAT, MAP_CENTER_LON = -22.9200, -42.8500
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    if os.path.exists(POINTS_FILE):
+        lats, lons, pesos = load_points(POINTS_FILE, POINTS_WEIGHT_COLUMN)
+        print(f"Demanda: {len(lats)} pontos de '{POINTS_FILE}'.")
+    else:
+        lats, lons = make_grid(REGION_BOUNDS, CELL_SIZE_M)
+        pesos = None
+        print(f"Demanda: grade de {len(lats)} células de {CELL_SIZE_M} m.")
+
+    inicio = time.perf_counter()
+    candidatos = candidate_points(df_stops)
+    resultado = optimize_stop_placement(df_stops, lats, lons, NEW_STOPS, weights=pesos, method=METHOD,
+                                        candidates=candidatos)
+    if resultado is None:
+        sys.exit(1)
+    print(f"{len(resultado)} novas paradas escolhidas entre {resultado.n_candidates} candidatos "
+          f"(método '{METHOD}') em {time.perf_counter() - inicio:.2f}s.")
+    print(f"Demanda a até {DEFAULT_THRESHOLD_M:.0f} m de uma parada: "
+          f"{resultado.covered_before:.2%} -> {resultado.covered_after:.2%}")
+    print(f"Distância média até a parada mais próxima: "
+          f"{resultado.mean_distance_before:.0f} m -> {resultado.mean_distance_after:.0f} m")
+    for _, parada in resultado.selected.iterrows():
+        print(f"  #{int(parada['posicao']):<3} ({parada['latitude']:.5f}, {parada['longitude']:.5f}) "
+              f"ganho: {parada['ganho']:.1f}, cobertura acumulada: {parada['cobertura_acumulada']:.2%}")
+    resultado.selected.to_csv(OUTPUT_FILE, index=False, float_format='%.6f')
+    print(f"Paradas sugeridas salvas em '{OUTPUT_FILE}'.")
+
+    # Mapa: paradas existentes e novas paradas com o raio de cobertura
+    m = folium.Map(location=[MAP_CENTER_LAT, MAP_CENTER_LON], zoom_start=12)
+    existentes = folium.FeatureGroup(name="Paradas existentes")
+    for lat, lon in df_stops[['latitude', 'longitude']].dropna().drop_duplicates().itertuples(index=False):
+        folium.CircleMarker(location=[lat, lon], radius=3, color="blue", fill=True, fill_opacity=0.8).add_to(existentes)
+    existentes.add_to(m)
+    resultado.add_to_map(m)
+    folium.LayerControl().add_to(m)
+    m.save(OUTPUT_MAP)
+    print(f"Mapa '{OUTPUT_MAP}' gerado.")
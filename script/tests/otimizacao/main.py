@@ -1,9 +1,18 @@
+import os
+import sys
 import pandas as pd
 import folium
-from geopy.distance import geodesic
 import numpy as np
 import networkx as nx
 
+# Permite importar os módulos compartilhados de script/ (routing, graph_analysis, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import map_layers
+import routing
+import stop_data
+from weight_models import WeightModel, apply_weight_model
+from centrality import compute_centrality, print_centrality_report
+
 # --- Configuration ---
 STOPS_FILE = "script/data/moovit_stops_geocoded_filtered.csv"
 MAP_CENTER_LAT, MAP_CENTER_LON = -22.9367, -42.9751
@@ -20,20 +29,11 @@ USER_TARGET_COORD = (-22.9675662, -42.9707889)
 # --- Helper Functions ---
 def load_stops_data(filepath):
     """
-    Carrega e limpa os dados das paradas do Moovit.
+    Carrega a tabela de paradas validada (stop_data.load_stops, memorizada em processo e em disco).
     Retorna um DataFrame com as colunas originais do CSV.
     """
     try:
-        df = pd.read_csv(filepath)
-        # Não faz mais rename, usa os nomes originais do CSV
-        if 'id_parada' not in df.columns:
-            df['id_parada'] = df.index
-        for col in ['latitude', 'longitude']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df['ordem_parada'] = pd.to_numeric(df['ordem_parada'], errors='coerce', downcast='integer')
-        required_cols = ['latitude', 'longitude', 'ordem_parada', 'endereco_geocodificado', 'nome_linha', 'sentido', 'numero_linha']
-        df.dropna(subset=required_cols, inplace=True)
-        return df
+        return stop_data.load_stops(filepath)
     except FileNotFoundError:
         print(f"Erro: Arquivo de paradas não encontrado em {filepath}")
         return pd.DataFrame()
@@ -43,88 +43,49 @@ def load_stops_data(filepath):
 
 def build_graph_from_stops(df_stops):
     """
-    Constrói um grafo multimodal: cada nó é uma coordenada (lat, lon), agregando todas as linhas, ids, sentidos, ordens, endereços.
-    Arestas conectam nós consecutivos na ordem de cada linha/sentido.
+    Grafo multimodal: cada nó é uma coordenada (lat, lon), agregando todas as linhas, ids, sentidos, ordens, endereços.
+    Arestas conectam nós consecutivos na ordem de cada linha/sentido, com peso em metros.
+    Construído por stop_data.build_graph (reaproveitado do cache quando os dados não mudaram).
     """
-    G = nx.DiGraph()
-    # Agregar informações por coordenada
-    grouped_coords = df_stops.groupby(['latitude', 'longitude'])
-    node_data = {}
-    for (lat, lon), group in grouped_coords:
-        node_data[(lat, lon)] = {
-            'ids': list(group['id_parada'].unique()),
-            'enderecos': list(group['endereco_geocodificado'].unique()),
-            'linhas': list(group['nome_linha'].unique()),
-            'numeros_linha': list(group['numero_linha'].unique()),
-            'sentidos': list(group['sentido'].unique()),
-            'ordens': list(group['ordem_parada'].unique()),
-        }
-    # Adicionar nós
-    for (lat, lon), data in node_data.items():
-        G.add_node((lat, lon), **data, lat=lat, lon=lon)
-    # Adicionar arestas por linha/sentido
-    for _, group in df_stops.groupby(['numero_linha', 'sentido']):
-        group_sorted = group.sort_values('ordem_parada')
-        prev_coord = None
-        for _, row in group_sorted.iterrows():
-            coord = (row['latitude'], row['longitude'])
-            if prev_coord is not None and prev_coord != coord:
-                dist = geodesic(prev_coord, coord).meters
-                G.add_edge(prev_coord, coord, weight=dist, numero_linha=row['numero_linha'], nome_linha=row['nome_linha'])
-            prev_coord = coord
-    return G
+    return stop_data.build_graph(df_stops, node_key='coordenada', weight_unit='m')
 
-def dijkstra_shortest_path(G, source, target):
+def dijkstra_shortest_path(G, source, target, bidirectional=False):
     """
-    Find shortest path using Dijkstra's algorithm.
+    Find shortest path using Dijkstra's algorithm (single search).
+    Set bidirectional=True to search from both ends at once.
     Returns the path and total cost.
     """
     try:
-        path = nx.dijkstra_path(G, source, target, weight='weight')
-        cost = nx.dijkstra_path_length(G, source, target, weight='weight')
+        if bidirectional:
+            cost, path = routing.bidirectional_dijkstra_path(G, source, target, weight='weight')
+        else:
+            cost, path = routing.dijkstra_path(G, source, target, weight='weight')
         return path, cost
     except nx.NetworkXNoPath:
         return None, float('inf')
 
 def astar_shortest_path(G, source, target):
     """
-    Find shortest path using A* algorithm.
+    Find shortest path using A* algorithm (single search).
+    The heuristic is the haversine distance to the target, precomputed for every node.
     Returns the path and total cost.
     """
-    def heuristic(u, v):
-        lat_u, lon_u = G.nodes[u]['lat'], G.nodes[u]['lon']
-        lat_v, lon_v = G.nodes[v]['lat'], G.nodes[v]['lon']
-        return geodesic((lat_u, lon_u), (lat_v, lon_v)).meters
     try:
-        path = nx.astar_path(G, source, target, heuristic=heuristic, weight='weight')
-        cost = nx.astar_path_length(G, source, target, heuristic=heuristic, weight='weight')
+        # Pesos deste grafo estão em metros
+        cost, path = routing.astar_path(G, source, target, weight='weight', units_per_km=1000.0)
         return path, cost
     except nx.NetworkXNoPath:
         return None, float('inf')
 
-def node_centrality_analysis(G):
+def node_centrality_analysis(G, k=None):
     """
-    Count how many times each node appears in all lines (centrality by repetition).
-    Returns a dict: node_id -> count.
+    Betweenness centrality of each node: share of shortest paths passing through the stop
+    (through-traffic). Exact by default, or approximated from k sampled sources.
+    Returns a dict: node_id -> betweenness.
     """
-    centrality = {}
-    for node in G.nodes:
-        centrality[node] = len(G.in_edges(node)) + len(G.out_edges(node))
-    return centrality
-
-def classify_distance(distance_m):
-    if pd.isna(distance_m):
-        return "Sem dados", "gray"
-    if distance_m <= 400:
-        return "Perto (0-400m)", "green"
-    elif distance_m <= 600:
-        return "Razoável (400-600m)", "gold"
-    elif distance_m <= 800:
-        return "Médio (600-800m)", "orange"
-    elif distance_m <= 1200:
-        return "Longe (800-1200m)", "red"
-    else:
-        return "Muito longe (>1200m)", "purple"
+    result = compute_centrality(G, k=k, weight='weight')
+    print_centrality_report(result)
+    return result.betweenness
 
 def create_graph_map(G, centrality=None, highlight_path=None):
     """
@@ -132,64 +93,60 @@ def create_graph_map(G, centrality=None, highlight_path=None):
     - Nodes: bus stops (size/color by centrality if provided)
     - Edges: real connections (color by distance)
     - Optionally highlight a path (Dijkstra/A*)
-    - Destaca os top 5 nós mais centrais em amarelo/verde
+    - Destaca os top 5 nós mais centrais (intermediação) em amarelo/verde
+    A rede é uma única camada GeoJSON (map_layers.add_network_layer), com popups e tooltips
+    montados no navegador a partir das propriedades de cada parada e trecho.
     """
     m = folium.Map(location=[MAP_CENTER_LAT, MAP_CENTER_LON], zoom_start=14)
-    # Draw edges (todas as arestas em cinza)
-    for u, v, data in G.edges(data=True):
-        lat_u, lon_u = u
-        lat_v, lon_v = v
-        dist = data['weight']
-        folium.PolyLine(
-            [(lat_u, lon_u), (lat_v, lon_v)],
-            color='#888',  # cinza neutro
-            weight=3,
-            opacity=0.6,
-            tooltip=f"Distância: {dist:.0f}m"
-        ).add_to(m)
     # Identificar top 5 centrais
     top_central_nodes = set()
     if centrality:
         top_central = sorted(centrality.items(), key=lambda x: x[1], reverse=True)[:5]
         top_central_nodes = set([node for node, _ in top_central])
-    # Draw nodes
-    for node, data in G.nodes(data=True):
-        if centrality and node in top_central_nodes:
-            c = 'yellow'
-            fill_c = 'lime'
-            radius = 12
-            tooltip_extra = f"Parada central (grau {centrality[node]})"
-        else:
-            c = 'blue'
-            fill_c = 'blue'
-            radius = 5
-            tooltip_extra = None
-        enderecos_str = '<br>'.join(data['enderecos']) if 'enderecos' in data else '-'
-        ids_str = ', '.join(str(x) for x in data['ids']) if 'ids' in data else '-'
-        linhas_str = '<br>'.join(str(x) for x in data['linhas']) if 'linhas' in data else '-'
-        numeros_linha_str = ', '.join(str(x) for x in data['numeros_linha']) if 'numeros_linha' in data else '-'
-        sentidos_str = ', '.join(str(x) for x in data['sentidos']) if 'sentidos' in data else '-'
-        ordens_str = ', '.join(str(x) for x in data['ordens']) if 'ordens' in data else '-'
-        folium.CircleMarker(
-            location=[data['lat'], data['lon']],
-            radius=radius,
-            color=c,
-            fill=True,
-            fill_color=fill_c,
-            fill_opacity=0.85 if (centrality and node in top_central_nodes) else 0.7,
-            tooltip=(f"{enderecos_str}<br>{tooltip_extra}" if tooltip_extra else enderecos_str),
-            popup=folium.Popup(
-                f"<b>Endereço(s):</b> {enderecos_str}<br>"
-                f"<b>Latitude:</b> {data['lat']}<br>"
-                f"<b>Longitude:</b> {data['lon']}<br>"
-                f"<b>Sentido(s):</b> {sentidos_str}<br>"
-                f"<b>Ordem da parada(s):</b> {ordens_str}<br>"
-                f"<b>ID(s) da parada:</b> {ids_str}<br>"
-                f"<b>Linhas:</b><br>{numeros_linha_str} - {linhas_str}" +
-                (f"<br><b>Parada central (grau {centrality[node]})</b>" if (centrality and node in top_central_nodes) else ""),
-                max_width=400
-            )
-        ).add_to(m)
+
+    def juntar(data, campo, sep=', '):
+        return sep.join(str(x) for x in data[campo]) if campo in data else '-'
+
+    def propriedades_parada(node, data):
+        enderecos_str = juntar(data, 'enderecos', '<br>')
+        props = {
+            'endereco': enderecos_str,
+            'sentidos': juntar(data, 'sentidos'),
+            'ordens': juntar(data, 'ordens'),
+            'ids': juntar(data, 'ids'),
+            'linhas': f"<br>{juntar(data, 'numeros_linha')} - {juntar(data, 'linhas', '<br>')}",
+            'rotulo': enderecos_str,
+        }
+        if node in top_central_nodes:
+            props['intermediacao'] = centrality[node]
+            props['rotulo'] = f"{enderecos_str}<br>Parada central (intermediação {centrality[node]:.3f})"
+        return props
+
+    def propriedades_trecho(u, v, data):
+        return {'distancia_m': data['weight'], 'rotulo': f"Distância: {data['weight']:.0f}m"}
+
+    # Todas as arestas em cinza; top 5 centrais com borda amarela e preenchimento verde
+    map_layers.add_network_layer(
+        m, G, stop_properties=propriedades_parada, edge_properties=propriedades_trecho,
+        highlight_nodes=top_central_nodes,
+        stop_popup_fields=[
+            ("Endereço(s)", 'endereco', None, ""),
+            ("Latitude", 'lat', None, ""),
+            ("Longitude", 'lon', None, ""),
+            ("Sentido(s)", 'sentidos', None, ""),
+            ("Ordem da parada(s)", 'ordens', None, ""),
+            ("ID(s) da parada", 'ids', None, ""),
+            ("Linhas", 'linhas', None, ""),
+            ("Parada central (intermediação)", 'intermediacao', 3, ""),
+        ],
+        segment_popup_fields=[("Distância", 'distancia_m', 0, "m")],
+        stop_tooltip='rotulo', segment_tooltip='rotulo',
+        node_styles={
+            'padrao': {'radius': 5, 'color': 'blue', 'fillColor': 'blue', 'fillOpacity': 0.7, 'weight': 3},
+            'destaque': {'radius': 12, 'color': 'yellow', 'fillColor': 'lime', 'fillOpacity': 0.85, 'weight': 3},
+        },
+        edge_styles={'padrao': {'color': '#888', 'weight': 3, 'opacity': 0.6}},  # cinza neutro
+    )
     # Highlight path if provided
     if highlight_path:
         path_coords = [(n[0], n[1]) for n in highlight_path]
@@ -266,11 +223,23 @@ if __name__ == "__main__":
         else:
             print("Não existe caminho entre as paradas selecionadas (A*).")
 
+        # --- Tempo de viagem (velocidade, tempo de parada e transferências) ---
+        peso_tempo = apply_weight_model(G, WeightModel())
+        try:
+            cost_tempo, path_tempo, linhas_tempo = routing.transfer_aware_path(G, source, target, weight=peso_tempo)
+            transferencias = sum(1 for a, b in zip(linhas_tempo, linhas_tempo[1:]) if a != b)
+            print(f"Caminho mais rápido (tempo de viagem) de {source} para {target}:")
+            for n, linha in zip(path_tempo, linhas_tempo + ['-']):
+                print(f"  - {n} | linha {linha} | {G.nodes[n]['enderecos']}")
+            print(f"Tempo total estimado: {cost_tempo:.1f} min ({transferencias} transferências)")
+        except nx.NetworkXNoPath:
+            print("Não existe caminho entre as paradas selecionadas (tempo de viagem).")
+
         # --- Centralidade ---
         top_central = sorted(centrality.items(), key=lambda x: x[1], reverse=True)[:5]
-        print("Paradas mais centrais (maior grau de passagem):")
-        for node, grau in top_central:
-            print(f"  - {node} | {G.nodes[node]['enderecos']} | grau: {grau}")
+        print("Paradas mais centrais (maior intermediação):")
+        for node, valor in top_central:
+            print(f"  - {node} | {G.nodes[node]['enderecos']} | intermediação: {valor:.3f}")
 
         # --- Mapa com destaque do caminho ótimo (Dijkstra) ---
         create_graph_map(G, centrality, highlight_path=path_dij)
@@ -1,10 +1,18 @@
+import os
+import sys
 import pandas as pd
 import folium
-from geopy.distance import geodesic
 import numpy as np
 import re
 # import networkx as nx # Se for usar para Dijkstra na malha ou centralidade
 
+# Allows importing the shared modules from script/ (stop_data, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+import routing
+from coverage import classify_distance  # Distance buckets shared with the coverage analysis
+import gap_detection  # Ordering of stops along a street (KD-tree) shared with the network-wide gap report
+
 # --- Configuration ---
 STOPS_FILE = "script/data/moovit_stops_geocoded_filtered.csv"
 MAIN_STREET_NAMES = [
@@ -18,11 +26,11 @@ MAP_CENTER_LAT, MAP_CENTER_LON = -22.9367, -42.9751
 # --- Helper Functions ---
 def load_stops_data(filepath):
     """
-    Load and clean Moovit stops data.
+    Load the validated stops table (stop_data.load_stops, memoized in-process and on disk).
     Returns a DataFrame with columns: 'stop_id', 'lat', 'lon', 'address', 'line_name', 'direction', 'stop_order', 'line_number'.
     """
     try:
-        df = pd.read_csv(filepath)
+        df = stop_data.load_stops(filepath)
         df.rename(columns={
             'latitude': 'lat',
             'longitude': 'lon',
@@ -33,13 +41,8 @@ def load_stops_data(filepath):
             'ordem_parada': 'stop_order',
             'numero_linha': 'line_number',
         }, inplace=True)
-        if 'stop_id' not in df.columns:
-            df['stop_id'] = df.index
-        for col in ['lat', 'lon']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df['stop_order'] = pd.to_numeric(df['stop_order'], errors='coerce', downcast='integer')
-        required_cols = ['lat', 'lon', 'stop_order', 'address', 'line_name', 'direction', 'line_number']
-        df.dropna(subset=required_cols, inplace=True)
+        required_cols = ['address', 'line_name']
+        df.dropna(subset=[col for col in required_cols if col in df.columns], inplace=True)
         return df
     except FileNotFoundError:
         print(f"Error: Stops file not found at {filepath}")
@@ -67,28 +70,11 @@ def filter_stops_by_street(df_stops, street_names):
         return pd.DataFrame()
     return df_main_street.reset_index(drop=True)
 
-def classify_distance(distance_m):
-    """
-    Classify the distance and return the category and corresponding color.
-    """
-    if pd.isna(distance_m):
-        return "No data", "gray"
-    if distance_m <= 400:
-        return "Near (0-400m)", "green"
-    elif distance_m <= 600:
-        return "Reasonable (400-600m)", "gold"
-    elif distance_m <= 800:
-        return "Medium (600-800m)", "orange"
-    elif distance_m <= 1200:
-        return "Far (800-1200m)", "red"
-    else:
-        return "Very Far (>1200m)", "purple"
-
 def create_main_street_map(df_stops_main_street):
     """
     Create and save the map for the main street analysis.
     - Groups stops by coordinates.
-    - Orders stops by stop_order and proximity.
+    - Orders stops by stop_order and proximity (gap_detection.order_points).
     - Draws sequential edges colored by distance.
     - Shows only the address on hover, all info in popup.
     - Suggests new stops where gaps are too large.
@@ -99,45 +85,21 @@ def create_main_street_map(df_stops_main_street):
     m = folium.Map(location=[MAP_CENTER_LAT, MAP_CENTER_LON], zoom_start=14)
     grouped = df_stops_main_street.groupby(['lat', 'lon'])
     points = list(grouped.groups.keys())
-    # Order by stop_order (if available), then by proximity
-    points_ordered = []
+    lats = np.array([p[0] for p in points])
+    lons = np.array([p[1] for p in points])
+    # Order along the street: start at the lowest stop_order (if available), then nearest neighbour via KD-tree
+    orders = None
     if 'stop_order' in df_stops_main_street.columns and not df_stops_main_street['stop_order'].isnull().all():
         order_by_point = grouped['stop_order'].min().to_dict()
-        points_ordered = sorted(points, key=lambda x: (order_by_point.get(x, float('inf')), x[0], x[1]))
-    else:
-        points_ordered = points
-    # Build a sequential path by nearest neighbor
-    visited = set()
-    path = []
-    if points_ordered:
-        current = points_ordered[0]
-        path.append(current)
-        visited.add(current)
-        while len(visited) < len(points_ordered):
-            min_dist = float('inf')
-            next_point = None
-            for p in points_ordered:
-                if p in visited:
-                    continue
-                dist = (p[0] - current[0])**2 + (p[1] - current[1])**2
-                if dist < min_dist:
-                    min_dist = dist
-                    next_point = p
-            if next_point is not None:
-                path.append(next_point)
-                visited.add(next_point)
-                current = next_point
-            else:
-                break
-    else:
-        path = points_ordered
-    # Calculate gaps (distances) only for the drawn edges
+        orders = np.array([order_by_point.get(p, np.nan) for p in points], dtype=float)
+    order = gap_detection.order_points(lats, lons, orders)
+    path = [points[i] for i in order]
+    # Distances for the drawn edges, computed once in a single vectorized pass
+    edge_distances = routing.haversine_km(lats[order][:-1], lons[order][:-1], lats[order][1:], lons[order][1:]) * 1000.0
     gaps = []
-    for i in range(len(path) - 1):
-        p1 = path[i]
-        p2 = path[i+1]
-        dist = geodesic(p1, p2).meters
+    for i, dist in enumerate(edge_distances.tolist()):
         if dist > MAX_ACCEPTABLE_DISTANCE_METERS:
+            p1, p2 = path[i], path[i + 1]
             gaps.append({
                 'lat': (p1[0] + p2[0]) / 2,
                 'lon': (p1[1] + p2[1]) / 2,
@@ -176,10 +138,9 @@ def create_main_street_map(df_stops_main_street):
             popup=folium.Popup(popup_text, max_width=400)
         ).add_to(m)
     # Draw sequential edges (linear graph, ordered)
-    for i in range(len(path) - 1):
+    for i, dist in enumerate(edge_distances.tolist()):
         p1_lat, p1_lon = path[i]
         p2_lat, p2_lon = path[i+1]
-        dist = geodesic((p1_lat, p1_lon), (p2_lat, p2_lon)).meters
         class_dist, color = classify_distance(dist)
         folium.PolyLine(
             [(p1_lat, p1_lon), (p2_lat, p2_lon)],
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+# Permite importar os módulos compartilhados de script/ (stop_data, robustness, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+import robustness
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"  # Rede completa
+MERGE_TOLERANCE_M = 25.0  # Une registros da mesma parada física antes de montar o grafo
+# Vias inteiras fechadas (obras, alagamentos)
+STREET_CLOSURES = ["Rodovia Amaral Peixoto", "Avenida Carlos Mariguella", "Rodovia Ernani do Amaral Peixoto"]
+RANDOM_SCENARIOS = 50  # Sorteios de cada tipo (paradas / trechos)
+RANDOM_SIZE = 10  # Paradas ou trechos fechados em cada sorteio
+SEED = 42
+TOP_N = 15
+OUTPUT_FILE = "script/tests/robustez/criticidade.csv"
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    G = stop_data.build_graph(df_stops, node_key='nome', merge_tolerance_m=MERGE_TOLERANCE_M)
+    if G is None or G.number_of_nodes() == 0:
+        print("Grafo vazio. Análise cancelada.")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    base = robustness.BaselineDistances(G)
+    print(f"Grafo com {len(base)} paradas e {G.number_of_edges()} arestas; "
+          f"{base.reachable_pairs} pares conectados no grafo intacto.")
+
+    cenarios = robustness.stop_scenarios(G) + robustness.segment_scenarios(G)
+    for via in STREET_CLOSURES:
+        cenario = robustness.street_scenario(G, via)
+        if cenario is None:
+            print(f"Nenhuma parada encontrada para a via '{via}'.")
+        else:
+            cenarios.append(cenario)
+    cenarios += robustness.random_scenarios(G, RANDOM_SCENARIOS, RANDOM_SIZE, 'paradas_aleatorias', seed=SEED)
+    cenarios += robustness.random_scenarios(G, RANDOM_SCENARIOS, RANDOM_SIZE, 'trechos_aleatorios', seed=SEED)
+
+    tabela = robustness.simulate(G, cenarios, baseline=base)
+    print(f"{len(cenarios)} cenários avaliados em {time.perf_counter() - inicio:.1f}s "
+          f"(média de {tabela['origens_recalculadas'].mean():.0f} de {len(base)} origens recalculadas por cenário).")
+
+    for tipo, titulo in [('parada', "Paradas mais críticas"), ('trecho', "Trechos mais críticos"), ('via', "Fechamento de vias")]:
+        print(f"\n{titulo}:")
+        for _, linha in tabela[tabela['tipo'] == tipo].head(TOP_N).iterrows():
+            print(f"  #{int(linha['posicao']):<5} {linha['descricao']}: {linha['fracao_pares_perdidos']:.1%} dos pares "
+                  f"desconectados, custo médio {linha['aumento_custo_medio']:+.1%}")
+    for tipo in ('paradas_aleatorias', 'trechos_aleatorios'):
+        sorteios = tabela[tabela['tipo'] == tipo]
+        print(f"\n{len(sorteios)} sorteios de {RANDOM_SIZE} {tipo.replace('_aleatorios', '').replace('_aleatorias', '')} "
+              f"(semente {SEED}): {sorteios['fracao_pares_perdidos'].mean():.1%} dos pares desconectados em média "
+              f"(pior caso: {sorteios['fracao_pares_perdidos'].max():.1%}).")
+
+    tabela.to_csv(OUTPUT_FILE, index=False, float_format='%.6f')
+    print(f"\nTabela de criticidade salva em '{OUTPUT_FILE}'.")
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+# Permite importar os módulos compartilhados de script/ (stop_data, line_overlap, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import stop_data
+from line_overlap import compute_line_overlap, export_overlap
+
+# --- Configuration ---
+STOPS_FILE = "script/data/moovit_stops_geocoded.csv"  # Rede completa (todas as linhas)
+OUTPUT_PREFIX = "script/tests/sobreposicao-linhas/sobreposicao"
+TOP_N = 10
+
+# --- Main Flow ---
+if __name__ == "__main__":
+    try:
+        df_stops = stop_data.load_stops(STOPS_FILE)
+    except Exception as e:
+        print(f"Erro ao carregar dados das paradas: {e}")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    resultado = compute_line_overlap(df_stops, node_key='nome')
+    print(f"Sobreposição calculada para {len(resultado.redundancia)} linhas "
+          f"({len(resultado.pares)} pares com algo em comum) em {time.perf_counter() - inicio:.3f}s.")
+    implausiveis = int(resultado.corredores['trecho_implausivel'].sum())
+    print(f"Trechos com mais de {stop_data.MAX_PLAUSIBLE_SEGMENT_M:.0f} m (erro de geocodificação) fora das extensões: "
+          f"{int(resultado.redundancia['trechos_implausiveis'].sum())} ocorrências em linhas, "
+          f"{implausiveis} em corredores.")
+
+    print(f"\nPares de linhas com maior extensão compartilhada:")
+    for _, par in resultado.top(TOP_N).iterrows():
+        print(f"  - {par['linha_a']} x {par['linha_b']}: {par['extensao_compartilhada_km']:.2f} km em comum "
+              f"({par['fracao_menor_linha']:.0%} da menor linha), {par['paradas_compartilhadas']} paradas, "
+              f"Jaccard trechos {par['jaccard_trechos']:.2f}")
+
+    print(f"\nLinhas mais redundantes (fração da extensão percorrida também por outra linha):")
+    for _, linha in resultado.redundancia.head(TOP_N).iterrows():
+        print(f"  - {linha['linha']} ({linha['nome_linha']}): {linha['fracao_redundante']:.0%} "
+              f"de {linha['extensao_km']:.1f} km")
+
+    print(f"\nTrechos percorridos por mais linhas (corredores):")
+    for _, trecho in resultado.corredores.head(TOP_N).iterrows():
+        print(f"  - {trecho['origem']} -> {trecho['destino']}: {trecho['num_linhas']} linhas ({trecho['linhas']})")
+
+    for path in export_overlap(resultado, OUTPUT_PREFIX):
+        print(f"Arquivo '{path}' gerado.")
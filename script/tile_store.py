@@ -0,0 +1,221 @@
+"""
+Armazenamento do grafo particionado em ladrilhos espaciais, com carregamento por região.
+
+Cada versão do grafo (mesma chave do cache versionado, graph_store.GraphStore) é gravada
+também como um conjunto de ladrilhos: a grade de lado `tile_deg` graus divide as paradas
+pela coordenada, e cada ladrilho é um .npz no formato colunar de graph_store com as paradas
+do ladrilho e as arestas que tocam nelas. A extremidade de uma aresta que cai em outro
+ladrilho é gravada como "stub" de borda (a parada, com seus atributos, marcada em
+'tile_stub'), de modo que as arestas entre ladrilhos não se perdem.
+
+Uma análise ou mapa regional lê o manifesto, carrega só os ladrilhos que cruzam o retângulo
+pedido e filtra as paradas desses ladrilhos de forma vetorizada: o custo é proporcional à
+região, não à rede inteira.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import networkx as nx
+import numpy as np
+
+import routing
+from graph_store import StoredGraph, graph_to_arrays
+
+DEFAULT_TILE_DEG = 0.05  # ~5,5 km de lado
+MANIFEST_FILENAME = "manifest.json"
+DIR_PREFIX = "tiles-"
+
+
+def _tile_of(latitudes: np.ndarray, longitudes: np.ndarray, tile_deg: float) -> tuple[np.ndarray, np.ndarray]:
+    """Índices (linha, coluna) do ladrilho de cada coordenada."""
+    return (np.floor(np.asarray(latitudes, dtype=float) / tile_deg).astype(np.int64),
+            np.floor(np.asarray(longitudes, dtype=float) / tile_deg).astype(np.int64))
+
+
+def _tile_name(iy: int, ix: int) -> str:
+    return f"{iy}_{ix}"
+
+
+def _bounds_tag(bounds: tuple[float, float, float, float]) -> str:
+    return "bbox=" + ",".join(f"{b:.6f}" for b in bounds)
+
+
+def region_version(version: str | None, region_tag: str) -> str:
+    """Versão do grafo regional: a versão do grafo completo combinada com a identificação da região."""
+    return hashlib.sha256(f"{version}|regiao={region_tag}".encode('utf-8')).hexdigest()[:32]
+
+
+def region_subgraph(graph: nx.DiGraph, bounds: tuple[float, float, float, float],
+                    include_boundary: bool = False) -> nx.DiGraph:
+    """
+    Subgrafo das paradas dentro de `bounds` = (lat_min, lat_max, lon_min, lon_max), a partir
+    de um grafo já em memória (teste vetorizado sobre o índice de coordenadas do grafo).
+    Com `include_boundary`, mantém também as arestas que saem da região e suas paradas do
+    outro lado, marcadas com o atributo 'borda' = True.
+    """
+    lat_min, lat_max, lon_min, lon_max = bounds
+    coords = routing.get_coordinate_index(graph)
+    dentro = ((coords.latitudes >= lat_min) & (coords.latitudes <= lat_max)
+              & (coords.longitudes >= lon_min) & (coords.longitudes <= lon_max))
+    nodes = [node for node, ok in zip(coords.nodes, dentro.tolist()) if ok]
+    return restrict_graph(graph, nodes, _bounds_tag(bounds), include_boundary)
+
+
+def restrict_graph(graph: nx.DiGraph, nodes: list, region_tag: str, include_boundary: bool = False) -> nx.DiGraph:
+    """
+    Subgrafo das paradas `nodes` de uma região (com as arestas de borda, se pedido), com versão
+    própria derivada da versão do grafo e de `region_tag`.
+    """
+    if include_boundary:
+        region = set(nodes)
+        vizinhos = {v for u in nodes for v in graph.successors(u)} | {u for v in nodes for u in graph.predecessors(v)}
+        sub = graph.subgraph(region | vizinhos).copy()
+        sub.remove_edges_from([(u, v) for u, v in list(sub.edges) if u not in region and v not in region])
+        for node in vizinhos - region:
+            sub.nodes[node]['borda'] = True
+    else:
+        sub = graph.subgraph(nodes).copy()
+    sub.graph['versao'] = region_version(graph.graph.get('versao'), region_tag)
+    return sub
+
+
+class TiledGraphStore:
+    """
+    Diretório de grafos particionados em ladrilhos, um subdiretório por versão
+    (tiles-<chave>/ com manifest.json e um tile_<linha>_<coluna>.npz por ladrilho), com descarte LRU.
+    """
+
+    def __init__(self, cache_dir: str, tile_deg: float = DEFAULT_TILE_DEG, max_entries: int = 5):
+        self.cache_dir = cache_dir
+        self.tile_deg = tile_deg
+        self.max_entries = max_entries
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{DIR_PREFIX}{key}")
+
+    def has(self, key: str) -> bool:
+        """True se a versão `key` já foi particionada."""
+        return os.path.exists(os.path.join(self._dir(key), MANIFEST_FILENAME))
+
+    def manifest(self, key: str) -> dict | None:
+        """Manifesto da versão `key` (tamanho dos ladrilhos e, por ladrilho, retângulo e contagens)."""
+        path = os.path.join(self._dir(key), MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"(Ladrilhos) Erro ao ler o manifesto '{path}': {e}.")
+            return None
+
+    def save(self, key: str, graph: nx.DiGraph) -> str | None:
+        """Particiona o grafo em ladrilhos sob a chave `key` e aplica o descarte LRU."""
+        coords = routing.get_coordinate_index(graph)
+        if len(coords.nodes) < graph.number_of_nodes():
+            print("(Ladrilhos) Há paradas sem coordenadas; o grafo não será particionado.")
+            return None
+        iy, ix = _tile_of(coords.latitudes, coords.longitudes, self.tile_deg)
+        tile_of_node = {node: (y, x) for node, y, x in zip(coords.nodes, iy.tolist(), ix.tolist())}
+        por_ladrilho: dict[tuple, list] = {}
+        for node, tile in tile_of_node.items():
+            por_ladrilho.setdefault(tile, []).append(node)
+
+        final_dir = self._dir(key)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        tiles = {}
+        try:
+            for (y, x), nodes in sorted(por_ladrilho.items()):
+                proprios = set(nodes)
+                arestas = ([(u, v) for u in nodes for v in graph.successors(u)]
+                           + [(u, v) for v in nodes for u in graph.predecessors(v) if u not in proprios])
+                stubs = {n for edge in arestas for n in edge} - proprios
+                sub = graph.edge_subgraph(arestas) if arestas else graph.subgraph(nodes)
+                sub = nx.DiGraph(sub)
+                sub.add_nodes_from((n, graph.nodes[n]) for n in nodes)  # paradas isoladas também
+                arrays = graph_to_arrays(sub)
+                arrays['tile_stub'] = np.array([n in stubs for n in sub.nodes], dtype=bool)
+                name = _tile_name(y, x)
+                np.savez(os.path.join(tmp_dir, f"tile_{name}.npz"), **arrays)
+                tiles[name] = {
+                    'bounds': [y * self.tile_deg, (y + 1) * self.tile_deg, x * self.tile_deg, (x + 1) * self.tile_deg],
+                    'nodes': len(nodes), 'edges': len(arestas), 'stubs': len(stubs),
+                }
+            with open(os.path.join(tmp_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'tile_deg': self.tile_deg, 'tiles': tiles,
+                           'graph_attrs': {k: v for k, v in graph.graph.items()
+                                           if isinstance(v, (str, int, float, bool))}}, f)
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(tmp_dir, final_dir)
+        except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            print(f"(Ladrilhos) Erro ao particionar o grafo em '{final_dir}': {e}")
+            return None
+        print(f"(Ladrilhos) Grafo particionado em {len(tiles)} ladrilhos de {self.tile_deg}° em '{final_dir}'.")
+        self.evict()
+        return final_dir
+
+    def tiles_in(self, key: str, bounds: tuple[float, float, float, float]) -> list[str]:
+        """Ladrilhos da versão `key` que cruzam `bounds` = (lat_min, lat_max, lon_min, lon_max)."""
+        manifest = self.manifest(key)
+        if manifest is None:
+            return []
+        lat_min, lat_max, lon_min, lon_max = bounds
+        return [name for name, tile in manifest['tiles'].items()
+                if tile['bounds'][0] <= lat_max and tile['bounds'][1] >= lat_min
+                and tile['bounds'][2] <= lon_max and tile['bounds'][3] >= lon_min]
+
+    def load_tiles(self, key: str, bounds: tuple[float, float, float, float]) -> nx.DiGraph | None:
+        """
+        União dos ladrilhos da versão `key` que cruzam `bounds`, sem recorte: toda parada dos
+        ladrilhos vem com todas as suas arestas (e as paradas do outro lado delas), de modo que
+        qualquer recorte dentro de `bounds` é igual ao feito sobre o grafo completo.
+        Retorna None se a versão não foi particionada ou um ladrilho não pôde ser lido.
+        """
+        manifest = self.manifest(key)
+        if manifest is None:
+            return None
+        names = self.tiles_in(key, bounds)
+        G = nx.DiGraph()
+        G.graph.update(manifest.get('graph_attrs', {}))
+        for name in names:
+            path = os.path.join(self._dir(key), f"tile_{name}.npz")
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    arrays = {k: data[k] for k in data.files}
+                G.update(StoredGraph(key, arrays).graph)
+            except Exception as e:
+                print(f"(Ladrilhos) Erro ao carregar '{path}': {e}.")
+                return None
+        os.utime(self._dir(key))  # marca como usado recentemente (LRU)
+        return G
+
+    def load_region(self, key: str, bounds: tuple[float, float, float, float],
+                    include_boundary: bool = False) -> nx.DiGraph | None:
+        """
+        Grafo das paradas dentro de `bounds` = (lat_min, lat_max, lon_min, lon_max), lendo só os
+        ladrilhos que cruzam o retângulo. Sem `include_boundary`, é o mesmo subgrafo que
+        graph.subgraph(paradas da região) do grafo completo; com `include_boundary`, as arestas que
+        saem da região são mantidas e as paradas do outro lado recebem 'borda' = True.
+        Retorna None se a versão não foi particionada ou um ladrilho não pôde ser lido.
+        """
+        G = self.load_tiles(key, bounds)
+        return None if G is None else region_subgraph(G, bounds, include_boundary)
+
+    def entries(self) -> list[str]:
+        """Diretórios das versões existentes, da mais recentemente usada para a menos."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        paths = [os.path.join(self.cache_dir, d) for d in os.listdir(self.cache_dir)
+                 if d.startswith(DIR_PREFIX) and not d.endswith('.tmp')]
+        return sorted(paths, key=os.path.getmtime, reverse=True)
+
+    def evict(self):
+        """Remove as versões menos usadas além de `max_entries`."""
+        for path in self.entries()[self.max_entries:]:
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"(Ladrilhos) Versão antiga removida: '{path}'.")
@@ -0,0 +1,125 @@
+"""
+Modelos de peso de tempo de viagem para o grafo de transporte.
+
+O peso 'weight' do grafo é distância (km no grafo por nome, metros no grafo por
+coordenada), então o "caminho mais curto" ignora velocidade, tempo de parada e
+transferências. Um WeightModel converte a distância em minutos a partir de:
+    - perfis de velocidade: padrão, por linha e por trecho (km/h);
+    - tempo de parada (dwell) na parada de chegada de cada trecho (padrão e por parada);
+    - penalidade de transferência entre linhas (usada por routing.transfer_aware_path).
+
+O cálculo é vetorizado sobre os arrays de arestas e o resultado é gravado como uma
+coluna de peso alternativa (ex.: 'tempo_min') nas próprias arestas. Os roteadores a
+selecionam pelo parâmetro `weight`, sem reconstruir o grafo.
+"""
+import hashlib
+import json
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+import routing
+
+DEFAULT_SPEED_KMH = 20.0
+DEFAULT_DWELL_S = 20.0
+DEFAULT_TRANSFER_PENALTY_MIN = 5.0
+
+
+class WeightModel:
+    """
+    Parâmetros de um modelo de tempo de viagem.
+
+    Atributos:
+        name: Nome do atributo de peso gravado nas arestas.
+        default_speed_kmh: Velocidade usada quando a linha/trecho não tem perfil próprio.
+        line_speeds_kmh: dict numero_linha -> velocidade (km/h).
+        segment_speeds_kmh: dict (origem, destino) -> velocidade (km/h); tem precedência sobre a linha.
+        dwell_s: Tempo de parada padrão (segundos) na parada de chegada.
+        stop_dwell_s: dict parada -> tempo de parada (segundos).
+        transfer_penalty_min: Penalidade por troca de linha (minutos).
+    """
+
+    def __init__(self, name: str = 'tempo_min', default_speed_kmh: float = DEFAULT_SPEED_KMH,
+                 line_speeds_kmh: dict | None = None, segment_speeds_kmh: dict | None = None,
+                 dwell_s: float = DEFAULT_DWELL_S, stop_dwell_s: dict | None = None,
+                 transfer_penalty_min: float = DEFAULT_TRANSFER_PENALTY_MIN):
+        self.name = name
+        self.default_speed_kmh = default_speed_kmh
+        self.line_speeds_kmh = dict(line_speeds_kmh or {})
+        self.segment_speeds_kmh = dict(segment_speeds_kmh or {})
+        self.dwell_s = dwell_s
+        self.stop_dwell_s = dict(stop_dwell_s or {})
+        self.transfer_penalty_min = transfer_penalty_min
+
+    def max_speed_kmh(self) -> float:
+        """Maior velocidade do modelo (limite para a heurística do A*)."""
+        return max([self.default_speed_kmh, *self.line_speeds_kmh.values(), *self.segment_speeds_kmh.values()])
+
+    def signature(self) -> str:
+        """Identificador curto dos parâmetros (distingue resultados em cache de modelos diferentes)."""
+        params = {
+            'v': self.default_speed_kmh,
+            'linhas': sorted((str(k), v) for k, v in self.line_speeds_kmh.items()),
+            'trechos': sorted((repr(k), v) for k, v in self.segment_speeds_kmh.items()),
+            'dwell': self.dwell_s,
+            'paradas': sorted((repr(k), v) for k, v in self.stop_dwell_s.items()),
+            'transf': self.transfer_penalty_min,
+        }
+        return hashlib.sha1(json.dumps(params).encode('utf-8')).hexdigest()[:12]
+
+
+def apply_weight_model(graph: nx.DiGraph, model: WeightModel) -> str:
+    """
+    Calcula o tempo de viagem (minutos) de todas as arestas e o grava em `model.name`.
+
+    Para uma aresta percorrida por várias linhas, usa a mais rápida (o atributo guarda um
+    único valor). Também registra em graph.graph o limite por km para o A*, a penalidade
+    de transferência e a assinatura do modelo (ver routing.weight_units_per_km e
+    routing.transfer_aware_path).
+
+    Returns:
+        O nome do atributo de peso, para uso como `weight=` nos roteadores.
+    """
+    edges = list(graph.edges(data=True))
+    distancia_km = np.array([d.get('weight', 0.0) for _, _, d in edges], dtype=float) / routing.weight_units_per_km(graph, 'weight')
+
+    # Velocidade por aresta: perfil da linha mais rápida entre as que a percorrem
+    ocorrencias = pd.DataFrame(
+        [(i, linha) for i, (_, _, d) in enumerate(edges) for linha in routing.edge_lines(d)],
+        columns=['aresta', 'linha'])
+    ocorrencias['velocidade'] = (ocorrencias['linha'].astype(str).map({str(k): v for k, v in model.line_speeds_kmh.items()})
+                                 .fillna(model.default_speed_kmh).astype(float))
+    velocidade = np.full(len(edges), model.default_speed_kmh, dtype=float)
+    if len(ocorrencias):
+        velocidade[:] = 0.0
+        np.maximum.at(velocidade, ocorrencias['aresta'].to_numpy(), ocorrencias['velocidade'].to_numpy())
+
+    # Perfis por trecho têm precedência
+    if model.segment_speeds_kmh:
+        posicao = {(u, v): i for i, (u, v, _) in enumerate(edges)}
+        for trecho, kmh in model.segment_speeds_kmh.items():
+            i = posicao.get(trecho)
+            if i is not None:
+                velocidade[i] = kmh
+
+    destinos = pd.Series([v for _, v, _ in edges], dtype=object)
+    dwell_s = destinos.map(model.stop_dwell_s).fillna(model.dwell_s).to_numpy(dtype=float) if model.stop_dwell_s \
+        else np.full(len(edges), model.dwell_s, dtype=float)
+
+    tempo_min = distancia_km / velocidade * 60.0 + dwell_s / 60.0
+    for (_, _, data), tempo in zip(edges, tempo_min.tolist()):
+        data[model.name] = tempo
+
+    graph.graph[f'unidades_por_km__{model.name}'] = 60.0 / model.max_speed_kmh()
+    graph.graph[f'penalidade_transferencia__{model.name}'] = model.transfer_penalty_min
+    graph.graph[f'modelo_peso__{model.name}'] = model.signature()
+    return model.name
+
+
+def remove_weight_model(graph: nx.DiGraph, name: str):
+    """Remove a coluna de peso `name` das arestas e seus registros em graph.graph."""
+    for _, _, data in graph.edges(data=True):
+        data.pop(name, None)
+    for prefixo in ('unidades_por_km__', 'penalidade_transferencia__', 'modelo_peso__'):
+        graph.graph.pop(f'{prefixo}{name}', None)